@@ -0,0 +1,136 @@
+# This module sheds load instead of letting it queue: when more events arrive than the service applies, requests
+# beyond a bounded queue are refused at once with a 429 and a Retry-After header, so the latency of the admitted
+# ones stays bounded and refused clients can back off, instead of every client waiting behind the threadpool.
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused to shed load; `retry_after` is the time in seconds to wait before retrying."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+    # Value of the Retry-After header: whole seconds, at least one.
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+# This class bounds the requests processed at the same time. Up to `max_concurrency` requests run; the next
+# `max_queue` wait for one of them to finish, in arrival order, for at most `queue_timeout` seconds; any other
+# request is refused with Overloaded. A finishing request hands its slot straight to the first waiting one,
+# so later arrivals cannot overtake the queue.
+#
+# The controller is used from the event loop and takes no lock. Each process has its own, so the limits apply
+# per worker.
+class AdmissionControl:
+    def __init__(self, max_concurrency: int, max_queue: int = 0, queue_timeout: float = 1.0, retry_after: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.shed = 0
+        self._active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    # Number of requests being processed
+    @property
+    def active(self) -> int:
+        return self._active
+
+    # Number of requests waiting for a slot
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    # This context manager holds a slot while the request is processed, and raises Overloaded if none is free
+    # and the queue is full, or if none is freed within the queue timeout.
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(self.retry_after, "Too many requests in progress")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended: pass it on.
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(error, asyncio.TimeoutError):
+                self.shed += 1
+                raise Overloaded(self.retry_after, "Too many requests in progress")
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+
+# This class limits the rate of requests per key (the account of an event) with token buckets: each key
+# earns `rate` tokens per second up to `burst`, and every request spends one. Buckets of the `max_keys` most
+# recently seen keys are kept; a key whose bucket was dropped starts again with a full one, which is what it
+# would have earned back by then anyway unless its requests were very close together.
+#
+# Like AdmissionControl, it is used from the event loop and takes no lock.
+class RateLimiter:
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self.limited = 0
+        self._clock = clock
+        # Key -> (tokens left, time they were counted), least recently seen first
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    # This method spends a token of the key's bucket, or raises Overloaded with the time until one is earned.
+    def check(self, key: Optional[str]) -> None:
+        if key is None:
+            return
+
+        now = self._clock()
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+            if len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            tokens, counted_at = bucket
+            tokens = min(self.burst, tokens + (now - counted_at) * self.rate)
+            buckets.move_to_end(key)
+
+        if tokens < 1.0:
+            buckets[key] = (tokens, now)
+            self.limited += 1
+            raise Overloaded((1.0 - tokens) / self.rate, "Too many requests for this account")
+
+        buckets[key] = (tokens - 1.0, now)
@@ -0,0 +1,266 @@
+# This module imports balances in bulk from CSV or NDJSON files. Every row credits an amount to an account, like a
+# deposit sent to POST /event, so imported balances are logged and replayed like any other event.
+#
+# The file is memory-mapped and parsed a chunk of lines at a time: a chunk is decoded at once, its rows are split
+# (or decoded as a single JSON array) and its amounts are converted and checked in one pass.
+# Only a chunk holding an invalid row is parsed again row by row, to reject that row alone. Valid rows are applied
+# with AccountService.deposit_many, a batch at a time, so no lock is held for more than one batch.
+#
+# CSV rows are `account_id,amount`; a first line whose second column is `amount` or `balance` is taken as a header.
+# NDJSON rows are `{"id": ..., "amount": ...}` objects; `balance` is accepted instead of `amount`, so the output
+# of GET /accounts can be imported into an empty instance. A row cannot span several lines.
+import csv
+import json
+import mmap
+import os
+import time
+from typing import BinaryIO, Iterator
+
+from app.api.schemas import parse_amount
+
+FORMATS = ("csv", "ndjson")
+
+# Bytes of the file decoded and parsed at a time
+READ_CHUNK_SIZE = 1 << 20
+
+# Rows applied per call to deposit_many: operations on their accounts wait while a batch is applied
+APPLY_BATCH_SIZE = 1024
+
+# Rejected rows reported with their line and error; the others are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    """
+        Outcome of a bulk import.
+
+        Attributes:
+        ----------
+        rows : int
+            Rows read, leaving out blank lines and the CSV header.
+        imported : int
+            Rows applied as deposits.
+        rejected : int
+            Rows that could not be parsed or applied.
+        errors : list[dict]
+            Line and error of the first rejected rows.
+        seconds : float
+            Time the import took.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors: list[dict] = []
+        self.seconds = 0.0
+
+    def reject(self, line: int, error: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "seconds": round(self.seconds, 6),
+            "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds else None,
+            "errors": self.errors,
+        }
+
+
+# This function returns the format of a file from its name: NDJSON for .ndjson, .jsonl and .json files, CSV otherwise.
+def detect_format(name: str) -> str:
+    return "ndjson" if name.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+# This function imports every row of a file opened in binary mode into the service and returns the report.
+# `service` is an AccountService, or any service offering deposit_many (such as ShardedAccountService).
+def import_file(service, file: BinaryIO, format: str) -> ImportReport:
+    if format not in FORMATS:
+        raise ValueError(f"Unknown import format: {format}")
+
+    report = ImportReport()
+    started = time.perf_counter()
+    batch = _Batch(service, report)
+
+    if os.fstat(file.fileno()).st_size:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            start = _skip_header(buffer) if format == "csv" else 0
+            line = 2 if start else 1
+            parse = _parse_csv if format == "csv" else _parse_ndjson
+
+            for chunk in _chunks(buffer, start):
+                lines = _decode(chunk, line, report)
+                for row in parse(lines, line, report):
+                    batch.add(*row)
+                line += len(lines)
+
+    batch.flush()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+# Valid rows waiting to be applied, with their line to report the ones the repository rejects
+class _Batch:
+    def __init__(self, service, report: ImportReport):
+        self._service = service
+        self._report = report
+        self._deposits: list[tuple[str, int]] = []
+        self._lines: list[int] = []
+
+    def add(self, line: int, account_id: str, amount: int) -> None:
+        self._deposits.append((account_id, amount))
+        self._lines.append(line)
+        if len(self._deposits) >= APPLY_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._deposits:
+            return
+
+        rejected = self._service.deposit_many(self._deposits)
+        self._report.imported += len(self._deposits) - len(rejected)
+        for index, error in rejected:
+            self._report.reject(self._lines[index], str(error) or type(error).__name__)
+
+        self._deposits = []
+        self._lines = []
+
+
+# Returns the offset of the first row: after the first line if it is a CSV header naming the amount column.
+def _skip_header(buffer) -> int:
+    end = buffer.find(b"\n")
+    end = len(buffer) if end < 0 else end + 1
+    fields = next(csv.reader([buffer[:end].decode("utf-8", "replace").strip()]), [])
+
+    if len(fields) == 2 and fields[1].strip().lower() in ("amount", "balance"):
+        return end
+    return 0
+
+
+# Yields the file from `start` in chunks of about READ_CHUNK_SIZE bytes that end at the end of a line.
+def _chunks(buffer, start: int) -> Iterator[bytes]:
+    size = len(buffer)
+    while start < size:
+        end = start + READ_CHUNK_SIZE
+        if end >= size:
+            end = size
+        else:
+            newline = buffer.rfind(b"\n", start, end)
+            end = newline + 1 if newline >= 0 else (buffer.find(b"\n", end) + 1 or size)
+
+        yield buffer[start:end]
+        start = end
+
+
+# Decodes the lines of a chunk. Lines that are not valid UTF-8 are rejected and replaced with blank lines.
+def _decode(chunk: bytes, line: int, report: ImportReport) -> list[str]:
+    try:
+        lines = chunk.decode("utf-8").split("\n")
+    except UnicodeDecodeError:
+        lines = []
+        for offset, raw in enumerate(chunk.split(b"\n")):
+            try:
+                lines.append(raw.decode("utf-8"))
+            except UnicodeDecodeError:
+                report.rows += 1
+                report.reject(line + offset, "row is not valid UTF-8")
+                lines.append("")
+
+    if chunk.endswith(b"\n"):
+        lines.pop()
+    return lines
+
+
+# Splits the rows of a chunk. Lines with quotes go through the csv module one at a time, so a quote left open
+# cannot swallow the next lines.
+def _parse_csv(lines: list[str], line: int, report: ImportReport) -> list[tuple[int, str, int]]:
+    rows = []
+    for offset, text in enumerate(lines):
+        text = text.rstrip("\r")
+        if not text.strip():
+            continue
+
+        fields = next(csv.reader([text])) if '"' in text else text.split(",")
+
+        report.rows += 1
+        if len(fields) != 2:
+            report.reject(line + offset, "row must have 2 columns: account ID and amount")
+        elif not fields[0]:
+            report.reject(line + offset, "account ID is required")
+        else:
+            rows.append((line + offset, fields[0], fields[1]))
+
+    return _checked(rows, report)
+
+
+# Decodes the rows of a chunk as one JSON array, or one row at a time if one of them is not valid JSON.
+def _parse_ndjson(lines: list[str], line: int, report: ImportReport) -> list[tuple[int, str, int]]:
+    numbered = [(line + offset, text) for offset, text in enumerate(lines) if text.strip()]
+    report.rows += len(numbered)
+
+    try:
+        objects = json.loads("[" + ",".join(text for _, text in numbered) + "]")
+    except ValueError:
+        objects = []
+        for number, text in numbered:
+            try:
+                objects.append(json.loads(text))
+            except ValueError:
+                objects.append(None)
+
+    rows = []
+    for (number, _), row in zip(numbered, objects):
+        if not isinstance(row, dict):
+            report.reject(number, "row must be a JSON object")
+            continue
+
+        account_id = row.get("id")
+        amount = row.get("amount", row.get("balance"))
+        if not isinstance(account_id, str) or not account_id:
+            report.reject(number, "id must be a non-empty string")
+        elif amount is None:
+            report.reject(number, "amount is required")
+        else:
+            rows.append((number, account_id, amount))
+
+    return _checked(rows, report)
+
+
+# Converts the amounts of parsed rows and keeps the rows whose amount is a positive integer. The amounts of a
+# chunk are converted and checked in one pass; they are checked one by one only when that pass fails.
+def _checked(rows: list[tuple[int, str, object]], report: ImportReport) -> list[tuple[int, str, int]]:
+    if not rows:
+        return rows
+
+    raw_amounts = [amount for _, _, amount in rows]
+    try:
+        if set(map(type, raw_amounts)) == {int}:
+            amounts = raw_amounts
+        elif "".join(raw_amounts).isascii():
+            amounts = list(map(int, raw_amounts))
+        else:
+            raise ValueError()
+
+        if min(amounts) > 0:
+            return [(line, account_id, amount) for (line, account_id, _), amount in zip(rows, amounts)]
+    except (TypeError, ValueError):
+        pass
+
+    checked = []
+    for line, account_id, raw_amount in rows:
+        try:
+            amount = parse_amount(raw_amount)
+        except ValueError:
+            report.reject(line, "amount must be an integer")
+            continue
+
+        if amount <= 0:
+            report.reject(line, "amount must be positive")
+        else:
+            checked.append((line, account_id, amount))
+
+    return checked
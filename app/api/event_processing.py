@@ -0,0 +1,132 @@
+# This module maps events received by the API onto AccountService operations.
+# It is shared by the single-event endpoint and the batch endpoint so both produce the same results.
+from app.api.schemas import EventRequest
+from app.domain.exceptions import (
+    AccountNotFound,
+    BalanceOutOfRange,
+    InsufficientFunds,
+    InvalidAccountId,
+    NegativeValue,
+    RepositoryFull,
+)
+
+
+class InvalidEvent(Exception):
+    """Raised when an event has an unknown type or lacks the accounts its type requires."""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+# This function applies an event and returns the body /event responds with on success.
+# `operations` is an AccountService, or the batch yielded by AccountService.atomic().
+def apply_event(operations, event: EventRequest) -> dict:
+    if event.type == "deposit":
+        account = operations.deposit(
+            destination_id=event.destination,
+            amount=event.amount,
+        )
+        return {
+            "destination": {
+                "id": account.account_id,
+                "balance": account.balance,
+            }
+        }
+
+    elif event.type == "withdraw":
+        account = operations.withdraw(
+            origin_id=event.origin,
+            amount=event.amount,
+        )
+        return {
+            "origin": {
+                "id": account.account_id,
+                "balance": account.balance,
+            },
+        }
+
+    elif event.type == "transfer":
+        if not event.origin or not event.destination:
+            raise InvalidEvent(0)
+
+        origin, destination = operations.transfer(
+            origin_id=event.origin,
+            destination_id=event.destination,
+            amount=event.amount,
+        )
+
+        return {
+            "origin": {
+                "id": origin.account_id,
+                "balance": origin.balance,
+            },
+            "destination": {
+                "id": destination.account_id,
+                "balance": destination.balance,
+            },
+        }
+
+    else:
+        raise InvalidEvent("Invalid event type")
+
+
+# This function returns the accounts an event touches, so they can be locked before it is applied.
+# It raises InvalidEvent, like apply_event, when the type is unknown or an account the type requires is missing.
+def event_account_ids(event: EventRequest) -> tuple:
+    if event.type == "deposit":
+        account_ids = (event.destination,)
+    elif event.type == "withdraw":
+        account_ids = (event.origin,)
+    elif event.type == "transfer":
+        account_ids = (event.origin, event.destination)
+    else:
+        raise InvalidEvent("Invalid event type")
+
+    if not all(account_ids):
+        raise InvalidEvent(0)
+
+    return account_ids
+
+
+# Exceptions raised by apply_event for an event that is rejected, as opposed to a failure of the server
+EVENT_ERRORS = (
+    InvalidEvent,
+    AccountNotFound,
+    InsufficientFunds,
+    NegativeValue,
+    InvalidAccountId,
+    BalanceOutOfRange,
+    RepositoryFull,
+)
+
+
+# This function converts the outcome of apply_event into the status code and body /event would respond with.
+def error_result(error: Exception) -> tuple[int, object]:
+    if isinstance(error, InvalidEvent):
+        return 400, {"detail": error.detail}
+
+    if isinstance(error, (AccountNotFound, InsufficientFunds)):
+        return 404, 0
+
+    if isinstance(error, NegativeValue):
+        return 400, {"detail": "Amount must be positive"}
+
+    if isinstance(error, InvalidAccountId):
+        return 400, {"detail": str(error)}
+
+    if isinstance(error, BalanceOutOfRange):
+        return 400, {"detail": "Balance out of range"}
+
+    if isinstance(error, RepositoryFull):
+        return 507, {"detail": "No room left for new accounts"}
+
+    raise error
+
+
+# This function applies an event and returns the status code and body /event would respond with.
+def event_result(operations, event: EventRequest) -> tuple[int, object]:
+    try:
+        return 201, apply_event(operations, event)
+    except EVENT_ERRORS as error:
+        return error_result(error)
@@ -0,0 +1,164 @@
+# This module serves the hot endpoints (POST /event, GET /balance and POST /reset) from a bare ASGI handler, without
+# FastAPI routing, dependency resolution or Pydantic validation. Requests are checked by hand and answered with the
+# same status codes, headers and bodies as the FastAPI app; only the shapes clients send on the hot path are
+# handled here, and any other request (other endpoints, Idempotency-Key headers, point-in-time reads, amounts that
+# are not plain integers, bodies that are not JSON objects...) is passed on to the FastAPI app, with its body, so
+# its response is exactly the one the FastAPI app gives.
+import json
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException
+
+import app.api.routes as routes
+from app.api.admission import Overloaded
+from app.api.responses import encode_event_body
+from app.api.schemas import EventRequest
+from app.domain.exceptions import AccountNotFound
+from app.infrastructure.event_log import EventLogError
+from app.services.async_account_service import AsyncAccountService
+
+_TEXT = b"text/plain; charset=utf-8"
+_JSON = b"application/json"
+
+
+# This class is the ASGI application of the fast path. `fallback` is the FastAPI app, which serves every request
+# the fast path does not handle, as well as the lifespan events. `service` is the AsyncAccountService the
+# requests are applied to. Load shedding is applied like in the FastAPI app; profiling is only available there.
+class FastPathApp:
+    def __init__(self, fallback, service: AsyncAccountService):
+        self.fallback = fallback
+        self.service = service
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http":
+            path, method = scope["path"], scope["method"]
+            if path == "/event" and method == "POST":
+                return await self._event(scope, receive, send)
+            if path == "/balance" and method == "GET":
+                return await self._balance(scope, receive, send)
+            if path == "/reset" and method == "POST":
+                return await self._reset(scope, receive, send)
+
+        await self.fallback(scope, receive, send)
+
+    async def _event(self, scope, receive, send) -> None:
+        body = await _read_body(receive)
+        event = _fast_event(scope, body)
+        if event is None:
+            return await self.fallback(scope, _replay(body, receive), send)
+
+        try:
+            if routes.rate_limiter is not None:
+                routes.rate_limiter.check(event.origin or event.destination)
+
+            if routes.admission is None:
+                result = await routes._process_event(event, self.service)
+            else:
+                async with routes.admission.admit():
+                    result = await routes._process_event(event, self.service)
+        except HTTPException as error:
+            return await _respond(send, error.status_code, routes._encode_detail(error.detail), _JSON)
+        except Overloaded as error:
+            return await _respond(send, 429, str(error).encode(), _TEXT, [(b"retry-after", error.retry_after_header.encode())])
+        except EventLogError:
+            return await _respond(send, 503, b"Event log unavailable", _TEXT)
+
+        if isinstance(result, dict):
+            await _respond(send, 201, encode_event_body(result), _JSON)
+        else:
+            await send({"type": "http.response.start", "status": result.status_code, "headers": result.raw_headers})
+            await send({"type": "http.response.body", "body": result.body})
+
+    async def _balance(self, scope, receive, send) -> None:
+        params = dict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        account_id = params.get("account_id")
+        if account_id is None or "at" in params:
+            return await self.fallback(scope, receive, send)
+
+        try:
+            balance = await self.service.get_balance(account_id)
+        except AccountNotFound:
+            return await _respond(send, 404, b"0", _TEXT)
+
+        await _respond(send, 200, str(balance).encode(), _TEXT)
+
+    async def _reset(self, scope, receive, send) -> None:
+        try:
+            await self.service.reset()
+        except EventLogError:
+            return await _respond(send, 503, b"Event log unavailable", _TEXT)
+
+        routes.idempotency.clear()
+        await _respond(send, 200, b"OK", _TEXT)
+
+
+# Returns the event of a request the fast path can apply, or None if the FastAPI app must handle it: with an
+# Idempotency-Key, a content type other than JSON, or a body that is not an object with a string type, string
+# or missing accounts and an integer amount. Those are the events EventRequest accepts without converting them.
+def _fast_event(scope, body: bytes) -> Optional[EventRequest]:
+    for name, value in scope["headers"]:
+        if name == b"idempotency-key":
+            return None
+        if name == b"content-type" and value and not _is_json(value):
+            return None
+
+    try:
+        raw = json.loads(body)
+    except ValueError:
+        return None
+
+    if not isinstance(raw, dict):
+        return None
+
+    event_type, origin, destination, amount = raw.get("type"), raw.get("origin"), raw.get("destination"), raw.get("amount")
+    if (
+        type(event_type) is not str
+        or type(amount) is not int
+        or (origin is not None and type(origin) is not str)
+        or (destination is not None and type(destination) is not str)
+    ):
+        return None
+
+    return EventRequest.model_construct(type=event_type, origin=origin, destination=destination, amount=amount)
+
+
+# JSON content types, as FastAPI recognizes them: application/json and application/*+json
+def _is_json(content_type: bytes) -> bool:
+    main_type, _, subtype = content_type.split(b";")[0].strip().lower().partition(b"/")
+    return main_type == b"application" and (subtype == b"json" or subtype.endswith(b"+json"))
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+# Returns a receive channel that yields the already read body first, then reads from the client again.
+def _replay(body: bytes, receive):
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+async def _respond(send, status: int, body: bytes, content_type: bytes, headers: Optional[list] = None) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-length", str(len(body)).encode()), (b"content-type", content_type)] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
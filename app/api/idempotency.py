@@ -0,0 +1,345 @@
+# This module makes retried requests safe: the response to the first request carrying an Idempotency-Key
+# is kept and replayed to every later request with the same key, instead of applying the event again.
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Hashable, Iterator, Optional
+
+from app.utils.reclaimer import reclaimer
+
+# Bytes accounted to every cached response on top of its key and body (entry, tuple and dictionary slot)
+ENTRY_OVERHEAD = 256
+
+# Time in seconds between two looks at a key another request is processing, in SharedIdempotencyCache
+SHARED_POLL_INTERVAL = 0.002
+
+# Responses are kept in `responses`: the rows without an owner are complete, the others belong to a request
+# still being processed by the process `owner`. `usage` holds the sequence of the last row and the bytes kept.
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, fingerprint TEXT NOT NULL, "
+    "owner INTEGER, status_code INTEGER, content BLOB, media_type TEXT, expires_at REAL, size INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS responses_seq ON responses (seq)",
+    "CREATE INDEX IF NOT EXISTS responses_expiry ON responses (expires_at)",
+    "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL, bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO usage VALUES (0, 0, 0)",
+)
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an idempotency key is sent again with a different request than the one it was first used with."""
+    pass
+
+
+# A response as it is replayed: status code, rendered body and media type.
+class CachedResponse:
+    __slots__ = ("status_code", "content", "media_type", "fingerprint", "expires_at", "size")
+
+    def __init__(self, status_code: int, content: bytes, media_type: str, fingerprint: Hashable, expires_at: float, size: int):
+        self.status_code = status_code
+        self.content = content
+        self.media_type = media_type
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.size = size
+
+
+# This class caches the responses of requests by idempotency key, in least recently used order.
+# It is bounded by a number of entries and by an estimate of the memory they take; entries also expire
+# `ttl` seconds after they are stored, and expired entries are dropped when they are looked up or when
+# they reach the least recently used end. Concurrent requests with the key of a request still being
+# processed wait for its response instead of running again. Only responses are cached: a request that
+# fails with an exception leaves no entry, so its retries run again.
+#
+# The cache is used from the event loop and takes no lock. Each process has its own cache, so retries
+# are only deduplicated when they reach the same worker: when workers share a ledger, SharedIdempotencyCache
+# is used instead.
+class IdempotencyCache:
+    def __init__(self, max_entries: int = 100000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 86400.0, clock=time.monotonic):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._in_flight: dict[str, tuple[Hashable, asyncio.Future]] = {}
+        self._bytes = 0
+
+    # This method returns the response to the request identified by `key` and `fingerprint`, and whether it
+    # is a replay. The first request with a key runs `produce`, which returns (status code, content, media
+    # type); later ones get its response. It raises IdempotencyKeyReused if the key was used for another request.
+    async def run(
+        self,
+        key: str,
+        fingerprint: Hashable,
+        produce: Callable[[], Awaitable[tuple[int, bytes, str]]],
+    ) -> tuple[CachedResponse, bool]:
+        while True:
+            cached = self._get(key)
+            if cached is not None:
+                if cached.fingerprint != fingerprint:
+                    raise IdempotencyKeyReused()
+                return cached, True
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+
+            if in_flight[0] != fingerprint:
+                raise IdempotencyKeyReused()
+
+            # The first request resolves the future once it is done; if it failed, this one runs instead.
+            await asyncio.shield(in_flight[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            status_code, content, media_type = await produce()
+            cached = self._put(key, fingerprint, status_code, content, media_type)
+        finally:
+            del self._in_flight[key]
+            future.set_result(None)
+
+        return cached, False
+
+    # This method drops every cached response, e.g. once the state they describe has been reset.
+    # The entries are freed in the background so that the event loop is not held up.
+    def clear(self) -> None:
+        entries, self._entries = self._entries, OrderedDict()
+        self._bytes = 0
+        reclaimer.release(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_in_bytes(self) -> int:
+        return self._bytes
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+
+        if cached.expires_at <= self._clock():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return cached
+
+    def _put(self, key: str, fingerprint: Hashable, status_code: int, content: bytes, media_type: str) -> CachedResponse:
+        now = self._clock()
+        size = ENTRY_OVERHEAD + len(key) + len(content)
+        cached = CachedResponse(status_code, content, media_type, fingerprint, now + self._ttl, size)
+
+        # A response that cannot fit is still returned to its request, just not kept.
+        if size > self._max_bytes or self._max_entries <= 0:
+            return cached
+
+        if key in self._entries:
+            self._remove(key)
+
+        while self._entries and (
+            len(self._entries) >= self._max_entries
+            or self._bytes + size > self._max_bytes
+            or next(iter(self._entries.values())).expires_at <= now
+        ):
+            self._remove(next(iter(self._entries)))
+
+        self._entries[key] = cached
+        self._bytes += size
+        return cached
+
+    def _remove(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key).size
+
+
+# This class is the IdempotencyCache of workers that share a ledger (the shared_memory and sqlite repositories):
+# the responses are kept in a SQLite database every worker opens, so a retry is replayed whichever worker it
+# reaches. The first request with a key claims it by inserting a row owned by its process, in the same
+# transaction that checks the key is free; requests with that key, in any worker, then poll the row until
+# the response is stored in it. Rows of a process that died while processing a request are claimed again.
+#
+# Bounds and expiry are those of IdempotencyCache, except that entries are dropped in the order they were
+# stored rather than the order they were last used. Each operation is one short transaction on a local file,
+# so it runs on the event loop.
+class SharedIdempotencyCache:
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 86400.0,
+        clock=time.time,
+        busy_timeout: float = 5.0,
+    ):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        # Expiry times are compared across processes, so they are taken from the wall clock.
+        self._clock = clock
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+
+        with self._transaction() as connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            # Rows this process ID owns were left by an earlier process that had the same ID.
+            connection.execute("DELETE FROM responses WHERE owner = ?", (self._pid,))
+
+    # This method behaves like IdempotencyCache.run, across every process using the same database.
+    async def run(
+        self,
+        key: str,
+        fingerprint: Hashable,
+        produce: Callable[[], Awaitable[tuple[int, bytes, str]]],
+    ) -> tuple[CachedResponse, bool]:
+        encoded = json.dumps(fingerprint)
+        while True:
+            cached = self._claim(key, fingerprint, encoded)
+            if cached is True:
+                break
+            if cached is not None:
+                return cached, True
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+        try:
+            status_code, content, media_type = await produce()
+        except BaseException:
+            with self._transaction() as connection:
+                connection.execute("DELETE FROM responses WHERE key = ? AND owner = ?", (key, self._pid))
+            raise
+
+        return self._put(key, fingerprint, encoded, status_code, content, media_type), False
+
+    # This method drops every stored response, for every process. Requests being processed are not affected.
+    def clear(self) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM responses WHERE owner IS NULL")
+            connection.execute("UPDATE usage SET bytes = 0")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT count(*) FROM responses WHERE owner IS NULL").fetchone()[0]
+
+    @property
+    def size_in_bytes(self) -> int:
+        return self._connection.execute("SELECT bytes FROM usage").fetchone()[0]
+
+    # Returns the stored response of the key, None while another request is processing it, or True once
+    # this request has claimed it. It raises IdempotencyKeyReused if the key was used for another request.
+    def _claim(self, key: str, fingerprint: Hashable, encoded: str):
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT fingerprint, owner, status_code, content, media_type, expires_at, size FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is not None:
+                stored, owner, status_code, content, media_type, expires_at, size = row
+                if owner is None and expires_at <= self._clock() or owner is not None and not _alive(owner):
+                    self._delete(connection, key, size)
+                elif stored != encoded:
+                    raise IdempotencyKeyReused()
+                elif owner is None:
+                    return CachedResponse(status_code, content, media_type, fingerprint, expires_at, size)
+                else:
+                    return None
+
+            seq = connection.execute("UPDATE usage SET seq = seq + 1 RETURNING seq").fetchone()[0]
+            connection.execute(
+                "INSERT INTO responses (key, seq, fingerprint, owner, size) VALUES (?, ?, ?, ?, 0)",
+                (key, seq, encoded, self._pid),
+            )
+            return True
+
+    def _put(self, key: str, fingerprint: Hashable, encoded: str, status_code: int, content: bytes, media_type: str) -> CachedResponse:
+        now = self._clock()
+        size = ENTRY_OVERHEAD + len(key) + len(content)
+        cached = CachedResponse(status_code, content, media_type, fingerprint, now + self._ttl, size)
+
+        with self._transaction() as connection:
+            # A response that cannot fit is still returned to its request, just not kept.
+            if size > self._max_bytes or self._max_entries <= 0:
+                connection.execute("DELETE FROM responses WHERE key = ? AND owner = ?", (key, self._pid))
+                return cached
+
+            stored = connection.execute(
+                "UPDATE responses SET owner = NULL, status_code = ?, content = ?, media_type = ?, expires_at = ?, size = ? "
+                "WHERE key = ? AND owner = ? RETURNING seq",
+                (status_code, content, media_type, cached.expires_at, size, key, self._pid),
+            ).fetchone()
+            # The row is gone if it was claimed again meanwhile, which only happens to the rows of dead processes.
+            if stored is None:
+                return cached
+
+            connection.execute("UPDATE usage SET bytes = bytes + ?", (size,))
+            self._evict(connection, now)
+
+        return cached
+
+    # Drops the expired responses, then the oldest ones while the entries or the bytes kept exceed the bounds.
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        while True:
+            rows = connection.execute(
+                "SELECT key, size FROM responses WHERE expires_at <= ? LIMIT 64",
+                (now,),
+            ).fetchall()
+            for key, size in rows:
+                self._delete(connection, key, size)
+            if len(rows) < 64:
+                break
+
+        seq, used = connection.execute("SELECT seq, bytes FROM usage").fetchone()
+        freed = connection.execute(
+            "DELETE FROM responses WHERE owner IS NULL AND seq <= ? RETURNING size",
+            (seq - self._max_entries,),
+        ).fetchall()
+        used -= sum(size for size, in freed)
+
+        while used > self._max_bytes:
+            rows = connection.execute("SELECT key, size FROM responses WHERE owner IS NULL ORDER BY seq LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                used -= size
+                if used <= self._max_bytes:
+                    break
+
+        connection.execute("UPDATE usage SET bytes = ?", (used,))
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, key: str, size: int) -> None:
+        connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+        connection.execute("UPDATE usage SET bytes = bytes - ?", (size,))
+
+    # Runs the block in a write transaction, taking the write lock of the database up front.
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+
+# Whether the process `pid` is still running.
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,179 @@
+# This module profiles single requests on demand, to tell where the time of a slow request goes. A profiled request
+# is traced call by call on the event loop, and its profile is written as collapsed stacks (one `frame;frame;frame
+# microseconds` line per stack, the input of flamegraph.pl, speedscope and similar tools). The time of each stage
+# (validation, dependencies, service, encoding) is returned in a Server-Timing header.
+#
+# Requests are profiled when they carry the profiling token in an X-Profile header, or at random at a sampling
+# rate. The middleware is only installed when one of them is configured, so requests cost nothing otherwise.
+import asyncio
+import hmac
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Optional
+
+from anyio.to_thread import run_sync
+
+# Header carrying the profiling token of a request that asks to be profiled
+PROFILE_HEADER = b"x-profile"
+
+# Stages reported in Server-Timing. A stack is counted in the stage of its innermost frame matching one of the
+# prefixes; time spent suspended counts in the stage of the frame that awaited (e.g. a threadpool call).
+STAGES = (
+    ("service", ("app.services.", "app.api.event_processing:")),
+    ("encoding", ("fastapi.routing:serialize_response", "fastapi.encoders:", "app.api.responses:", "starlette.responses:")),
+    ("validation", ("pydantic", "fastapi.dependencies.utils:request_body_to_args", "app.api.schemas:")),
+    ("dependencies", ("fastapi.dependencies.utils:solve_dependencies",)),
+)
+
+# Frame appended to the stack a request was suspended at, for the time it waited to be resumed
+AWAIT_FRAME = "(await)"
+
+
+# This class records the calls made on behalf of one asyncio task, with the time spent in each stack. It is
+# installed with sys.setprofile on the thread of the event loop and ignores the calls of other tasks. When the
+# task is suspended, its frames return one by one; the time until it is resumed is counted under AWAIT_FRAME
+# on top of the stack it was suspended at.
+class TaskProfile:
+    def __init__(self, task: asyncio.Task, clock=time.perf_counter):
+        self.stacks: dict[tuple[str, ...], float] = {}
+        self._task = task
+        self._clock = clock
+        # Frames being executed, as [label, start time, time spent in callees]
+        self._frames: list[list] = []
+        # Stack the task was last suspended at, and since when
+        self._suspended: Optional[tuple[tuple[str, ...], float]] = None
+        self._unwinding_from: Optional[tuple[str, ...]] = None
+
+    def __call__(self, frame, event: str, arg) -> None:
+        if asyncio.current_task() is not self._task:
+            return
+
+        now = self._clock()
+        frames = self._frames
+
+        if event == "call" or event == "c_call":
+            if not frames and self._suspended is not None:
+                stack, since = self._suspended
+                self._add(stack + (AWAIT_FRAME,), now - since)
+                self._suspended = None
+            self._unwinding_from = None
+            frames.append([_label(frame, arg) if event == "c_call" else _label(frame), now, 0.0])
+            return
+
+        # "return", "c_return" and "c_exception": frames entered before profiling started are not tracked.
+        if not frames:
+            return
+
+        label, started, callees = frames.pop()
+        elapsed = now - started
+        stack = tuple(entry[0] for entry in frames) + (label,)
+        self._add(stack, elapsed - callees)
+
+        if self._unwinding_from is None:
+            self._unwinding_from = stack
+        if frames:
+            frames[-1][2] += elapsed
+        else:
+            self._suspended = (self._unwinding_from, now)
+
+    # This method returns the time spent in each stage, in seconds, and in none of them ("other").
+    def stages(self) -> dict[str, float]:
+        totals = {stage: 0.0 for stage, _ in STAGES}
+        totals["other"] = 0.0
+        for stack, seconds in self.stacks.items():
+            totals[_stage(stack)] += seconds
+        return totals
+
+    # This method renders the profile in the collapsed stack format, with times in microseconds.
+    def collapsed(self) -> str:
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            microseconds = round(seconds * 1e6)
+            if microseconds > 0:
+                lines.append(f"{';'.join(stack)} {microseconds}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, stack: tuple[str, ...], seconds: float) -> None:
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + seconds
+
+
+def _label(frame, function=None) -> str:
+    if function is not None:
+        module = getattr(function, "__module__", None) or type(getattr(function, "__self__", None)).__name__
+        return f"{module}:{getattr(function, '__qualname__', repr(function))}"
+
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+def _stage(stack: tuple[str, ...]) -> str:
+    for label in reversed(stack):
+        for stage, prefixes in STAGES:
+            if label.startswith(prefixes):
+                return stage
+    return "other"
+
+
+# This class is an ASGI middleware profiling the requests that carry `token` in their X-Profile header, and a
+# `sample_rate` fraction of the others. Profiles are written to `directory`, named after the X-Profile-Id header
+# of their response. A single request is profiled at a time per process: others are served unprofiled meanwhile.
+class ProfilingMiddleware:
+    def __init__(self, app, token: Optional[str] = None, sample_rate: float = 0.0, directory: str = "profiles"):
+        self.app = app
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self._active = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or self._active or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profile = TaskProfile(asyncio.current_task())
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        started = time.perf_counter()
+        previous = sys.getprofile()
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start" and sys.getprofile() is profile:
+                sys.setprofile(previous)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", _server_timing(profile.stages(), time.perf_counter() - started).encode()),
+                    (b"x-profile-id", profile_id.encode()),
+                ]
+            await send(message)
+
+        sys.setprofile(profile)
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if sys.getprofile() is profile:
+                sys.setprofile(previous)
+            self._active = False
+
+        await run_sync(self._write, profile_id, profile.collapsed())
+
+    # A request with a wrong token is treated like one without: it may still be sampled.
+    def _wanted(self, scope) -> bool:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and hmac.compare_digest(value, self.token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _write(self, profile_id: str, collapsed: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.collapsed"), "w", encoding="utf-8") as file:
+            file.write(collapsed)
+
+
+# Renders the stage times as a Server-Timing header, in milliseconds.
+def _server_timing(stages: dict[str, float], total: float) -> str:
+    metrics = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in stages.items()]
+    return ", ".join(metrics + [f"total;dur={total * 1000:.3f}"])
@@ -0,0 +1,54 @@
+# This module renders the bodies of the event endpoints directly to bytes.
+# The successful /event body always has one of three fixed shapes, so it is built from templates instead of
+# going through jsonable_encoder and JSONResponse. The output is byte-identical to FastAPI's default
+# encoding (compact separators, non-ASCII characters kept as UTF-8).
+import json
+
+
+def _encode_id(account_id) -> bytes:
+    # Plain alphanumeric IDs, by far the most common ones, need no escaping.
+    if isinstance(account_id, str) and account_id.isascii() and account_id.isalnum():
+        return b'"' + account_id.encode() + b'"'
+
+    return json.dumps(account_id, ensure_ascii=False).encode()
+
+
+# This function renders the body returned by apply_event for a deposit, withdraw or transfer.
+def encode_event_body(body: dict) -> bytes:
+    return b"{" + b",".join(
+        b'"' + key.encode() + b'":{"id":' + _encode_id(account["id"]) + b',"balance":' + str(account["balance"]).encode() + b"}"
+        for key, account in body.items()
+    ) + b"}"
+
+
+# This function renders one line of the /events response.
+def encode_event_result(status_code: int, body) -> bytes:
+    if status_code == 201:
+        encoded_body = encode_event_body(body)
+    else:
+        encoded_body = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+
+    return b'{"status":' + str(status_code).encode() + b',"body":' + encoded_body + b"}\n"
+
+
+# This function renders accounts as the lines of the /accounts response.
+def encode_accounts(accounts) -> bytes:
+    return b"".join(
+        b'{"id":' + _encode_id(account_id) + b',"balance":' + str(balance).encode() + b"}\n"
+        for account_id, balance in accounts
+    )
+
+
+# This function renders a BalanceUpdate as the server-sent events of the /subscribe stream: a `reset` event
+# when every account was reset, a `lagged` event with the number of changes dropped, and a `balances` event
+# with the latest balance of every changed account, in this order.
+def encode_balance_update(update) -> bytes:
+    events = []
+    if update.reset:
+        events.append(b"event: reset\ndata: {}\n\n")
+    if update.dropped:
+        events.append(b'event: lagged\ndata: {"dropped":' + str(update.dropped).encode() + b"}\n\n")
+    if update.balances:
+        balances = b",".join(_encode_id(account_id) + b":" + str(balance).encode() for account_id, balance in update.balances.items())
+        events.append(b"event: balances\ndata: {" + balances + b"}\n\n")
+    return b"".join(events)
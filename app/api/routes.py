@@ -1,38 +1,112 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Response
-from fastapi.responses import PlainTextResponse
-from pydantic import BaseModel
+import base64
+import binascii
+import hmac
+import json
+import tempfile
+import time
 from typing import Optional
 
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, status, Response, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+
+from app.config import Settings
+from app.container import build_service
+from app.utils.metrics import Metrics
 from app.services.account_service import AccountService
-from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
-from app.domain.exceptions import AccountNotFound, InsufficientFunds, NegativeValue
+from app.services.async_account_service import AsyncAccountService
+from app.api.schemas import EventRequest, parse_event
+from app.api.bulk_import import FORMATS, import_file
+from app.api.responses import encode_accounts, encode_balance_update, encode_event_body, encode_event_result
+from app.api.idempotency import IdempotencyCache, IdempotencyKeyReused, SharedIdempotencyCache
+from app.api.admission import AdmissionControl, Overloaded, RateLimiter
+from app.api.event_processing import (
+    EVENT_ERRORS,
+    InvalidEvent,
+    apply_event,
+    error_result,
+    event_account_ids,
+)
+from app.services.balance_history import parse_timestamp
+from app.services.balance_subscriptions import Subscription
+from app.domain.exceptions import (
+    AccountNotFound,
+    AggregatesUnavailable,
+    AtomicBatchesUnavailable,
+    HistoryUnavailable,
+    InvalidCursor,
+    SubscriptionsUnavailable,
+)
 
 # Create a router for the API endpoints
 router = APIRouter()
 
-#Oringinal in-memory global state
-repository = InMemoryAccountRepository()
-service = AccountService(repository)
+#Oringinal in-memory global state, rebuilt from the event log when one is configured
+settings = Settings()
+metrics = Metrics()
+service = build_service(settings, metrics)
+repository = service.repository
+async_service = AsyncAccountService(service)
+# Workers sharing a ledger share the responses too, or a retry reaching another worker would be applied again.
+if settings.account_repository in ("shared_memory", "sqlite"):
+    ledger_path = settings.shared_memory_path if settings.account_repository == "shared_memory" else settings.sqlite_path
+    idempotency = SharedIdempotencyCache(
+        settings.idempotency_path or ledger_path + "-idempotency",
+        max_entries=settings.idempotency_cache_size,
+        max_bytes=settings.idempotency_cache_bytes,
+        ttl=settings.idempotency_ttl,
+    )
+else:
+    idempotency = IdempotencyCache(
+        max_entries=settings.idempotency_cache_size,
+        max_bytes=settings.idempotency_cache_bytes,
+        ttl=settings.idempotency_ttl,
+    )
+metrics.gauge("ebanx_idempotency_cache_entries", "Responses kept for idempotent retries.", lambda: len(idempotency))
+
+# Load shedding of /event, when configured: refused requests get a 429 with a Retry-After header
+admission = None
+if settings.admission_max_concurrency > 0:
+    admission = AdmissionControl(
+        max_concurrency=settings.admission_max_concurrency,
+        max_queue=settings.admission_queue_size,
+        queue_timeout=settings.admission_queue_timeout,
+        retry_after=settings.admission_retry_after,
+    )
+    metrics.counter("ebanx_admission_rejected_total", "Events refused because too many were in progress.", lambda: admission.shed)
+    metrics.gauge("ebanx_admission_queued", "Events waiting to be processed.", lambda: admission.queued)
+
+rate_limiter = None
+if settings.rate_limit_per_account > 0:
+    rate_limiter = RateLimiter(
+        rate=settings.rate_limit_per_account,
+        burst=settings.rate_limit_burst,
+        max_keys=settings.rate_limit_accounts,
+    )
+    metrics.counter("ebanx_rate_limited_total", "Events refused because their account exceeded its rate.", lambda: rate_limiter.limited)
 
-# Dependency injection functions to provide the service and repository instances to the endpoints
-def get_service():
+# Longest Idempotency-Key accepted, so clients cannot make single cache entries arbitrarily large
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Dependency injection functions to provide the service and repository instances to the endpoints.
+# They are coroutines so that FastAPI resolves them on the event loop instead of the threadpool.
+async def get_service():
     return service
 
+# This function provides the async view of the service used by the async endpoints.
+async def get_async_service(service: AccountService = Depends(get_service)):
+    if service is async_service.service:
+        return async_service
+    return AsyncAccountService(service)
+
 # This function provides the repository instance for dependency injection.
-def get_repository():
+async def get_repository():
     return repository
 
-# Pydantic model for event request validation
-class EventRequest(BaseModel):
-    type: str
-    origin: Optional[str] = None
-    destination: Optional[str] = None
-    amount: int
-
 # Endpoint to reset the application state
 @router.post("/reset")
-def reset(service: AccountService = Depends(get_service)):
+async def reset(service: AsyncAccountService = Depends(get_async_service)):
     """
     Resets the application state.
 
@@ -44,15 +118,17 @@ def reset(service: AccountService = Depends(get_service)):
         PlainTextResponse: A plain text response with a status code of 200 indicating
         that the reset operation was successful.
     """
-    service.reset()
+    await service.reset()
+    idempotency.clear()
     return PlainTextResponse(content="OK", status_code=200)
 
 
 # Endpoint to get the balance of an account
 @router.get("/balance")
-def get_balance(
+async def get_balance(
     account_id: str,
-    service: AccountService = Depends(get_service),
+    at: Optional[str] = None,
+    service: AsyncAccountService = Depends(get_async_service),
 ):
     """
     Retrieves the balance of a specific account.
@@ -66,24 +142,41 @@ def get_balance(
     ----------
     account_id : str
         The unique identifier of the account whose balance is to be retrieved.
+    at : Optional[str]
+        When given, the balance the account had at that time instead of its current balance:
+        seconds since the epoch, or an ISO 8601 date and time (UTC unless it has an offset).
 
     Returns:
     -------
     PlainTextResponse:
         - If the account exists: The balance as plain text with a 200 status code.
         - If the account does not exist: "0" as plain text with a 404 status code.
+        - If `at` cannot be parsed: a 400 status code.
+        - If the balance at `at` is not recorded (history disabled, or older than the history kept):
+          a 410 status code.
     """
     try:
-        balance = service.get_balance(account_id)
+        if at is None:
+            balance = await service.get_balance(account_id)
+        else:
+            try:
+                timestamp = parse_timestamp(at)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid timestamp")
+            balance = await service.get_balance_at(account_id, timestamp)
+
         return PlainTextResponse(content=str(balance), status_code=200)
     except AccountNotFound:
         return PlainTextResponse(content="0", status_code=404)
+    except HistoryUnavailable as error:
+        return PlainTextResponse(content=str(error), status_code=410)
 
 # Endpoint to handle events (deposit, withdraw, and transfer)
 @router.post("/event", status_code=status.HTTP_201_CREATED)
-def handle_event(
+async def handle_event(
     event: EventRequest,
-    service: AccountService = Depends(get_service),
+    service: AsyncAccountService = Depends(get_async_service),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
 ):
     """
     Handles deposit, withdraw, and transfer events.
@@ -102,9 +195,16 @@ def handle_event(
         - destination (Optional[str]): The destination account ID for deposits or transfers.
         - amount (int): The amount to deposit, withdraw, or transfer.
 
-    service : AccountService
+    service : AsyncAccountService
         The account service dependency used to perform the operations.
 
+    idempotency_key : Optional[str]
+        Value of the `Idempotency-Key` header. The response to the first request with a key is
+        replayed, with an `Idempotent-Replayed: true` header, to later requests with the same key
+        instead of applying the event again; requests sent while the first one is still being
+        processed wait for its response. Keys are forgotten after `IDEMPOTENCY_TTL_SECONDS`, when
+        the cache is full, and on reset.
+
     Returns:
     -------
     dict:
@@ -115,64 +215,527 @@ def handle_event(
     Raises:
     ------
     HTTPException:
-        - 400: If the event type is invalid, the amount is negative, or required fields are missing.
+        - 400: If the event type is invalid, the amount is negative, required fields are missing,
+          an account ID cannot be stored by the repository, or a balance would exceed its range.
         - 404: If the account is not found or there are insufficient funds.
+        - 422: If the idempotency key was already used with a different event.
+        - 429: If the event is refused to shed load (too many events in progress, or too many for its
+          account), with a `Retry-After` header. Nothing is applied.
+        - 507: If the repository has no room left for a new account.
     """
+    if rate_limiter is not None:
+        rate_limiter.check(event.origin or event.destination)
+
+    if admission is None:
+        return await _handle_event(event, service, idempotency_key)
+
+    async with admission.admit():
+        return await _handle_event(event, service, idempotency_key)
+
+
+async def _handle_event(event: EventRequest, service: AsyncAccountService, idempotency_key: Optional[str]):
+    if idempotency_key is None:
+        return await _process_event(event, service)
+
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    async def produce():
+        try:
+            result = await _process_event(event, service)
+        except HTTPException as error:
+            return error.status_code, _encode_detail(error.detail), "application/json"
+
+        if isinstance(result, dict):
+            return 201, encode_event_body(result), "application/json"
+        return result.status_code, result.body, result.media_type
+
+    fingerprint = (event.type, event.origin, event.destination, event.amount)
     try:
+        cached, replayed = await idempotency.run(idempotency_key, fingerprint, produce)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different event")
 
-        if event.type == "deposit":
-            account = service.deposit(
-                destination_id=event.destination,
-                amount=event.amount,
-            )
-            return {
-                "destination": {
-                    "id": account.account_id,
-                    "balance": account.balance,
-                }
-            }
-
-        elif event.type == "withdraw":
-            account = service.withdraw(
-                origin_id=event.origin,
-                amount=event.amount,
-            )
-            return {
-                "origin": {
-                    "id": account.account_id,
-                    "balance": account.balance,
-                },
-            }
-
-        elif event.type == "transfer":
-            if not event.origin or not event.destination:
-                raise HTTPException(status_code=400, detail=0)
-
-            origin, destination = service.transfer(
-                origin_id=event.origin,
-                destination_id=event.destination,
-                amount=event.amount,
-            )
-
-            return {
-                "origin": {
-                    "id": origin.account_id,
-                    "balance": origin.balance,
-                },
-                "destination": {
-                    "id": destination.account_id,
-                    "balance": destination.balance,
-                },
-            }
+    response = Response(content=cached.content, status_code=cached.status_code, media_type=cached.media_type)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
 
-        else:
-            raise HTTPException(status_code=400, detail="Invalid event type")
 
-    except AccountNotFound:
-        return PlainTextResponse(content="0", status_code=404)
+# Applies an event and returns the response of /event. Rejected events return a 404 response or raise
+# an HTTPException, exactly like the endpoint.
+async def _process_event(event: EventRequest, service: AsyncAccountService):
+    started = time.perf_counter()
+
+    try:
+        body = await service.apply((event.origin, event.destination), apply_event, event)
+    except Exception as error:
+        metrics.observe_event(event.type, time.perf_counter() - started, error)
+        if isinstance(error, EVENT_ERRORS):
+            return _event_error_response(error)
+        raise
+
+    metrics.observe_event(event.type, time.perf_counter() - started)
+
+    if settings.fast_responses:
+        return Response(content=encode_event_body(body), status_code=201, media_type="application/json")
+    return body
+
 
-    except InsufficientFunds:
+# Converts an event rejected by apply_event into the response of /event
+def _event_error_response(error: Exception):
+    status_code, body = error_result(error)
+
+    if status_code == 404:
         return PlainTextResponse(content="0", status_code=404)
 
-    except NegativeValue:
-        raise HTTPException(status_code=400, detail="Amount must be positive")
+    raise HTTPException(status_code=status_code, detail=body["detail"])
+
+
+# Renders the body FastAPI responds with to an HTTPException, so it can be cached and replayed.
+def _encode_detail(detail) -> bytes:
+    return json.dumps({"detail": detail}, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+# Number of streamed events applied per threadpool dispatch by the batch endpoint
+EVENTS_CHUNK_SIZE = 256
+
+# Status reported for the events of an atomic batch that were not applied because another event failed
+NOT_APPLIED = (424, {"detail": "Not applied: another event of the atomic batch failed"})
+
+
+# Streaming response whose body generator may still be reading the request body. Starlette's
+# StreamingResponse listens for the client disconnect by reading from the same receive channel,
+# which would consume the body chunks the generator is waiting for; this response does not.
+class RequestStreamingResponse(StreamingResponse):
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+        if self.background is not None:
+            await self.background()
+
+
+def _encode_result(result: tuple[int, object]) -> bytes:
+    status_code, body = result
+    if settings.fast_responses:
+        return encode_event_result(status_code, body)
+    return json.dumps({"status": status_code, "body": body}, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+def _decode_event(raw: bytes):
+    try:
+        return parse_event(json.loads(raw))
+    except ValueError as error:
+        return (422, {"detail": str(error)})
+
+
+# Applies a chunk of decoded events in order and waits for the durability of all of them at once.
+# Each event is reported to the metrics with the time it took to apply, excluding the shared wait.
+def _apply_chunk(service: AccountService, events: list) -> list[tuple[int, object]]:
+    clock = time.perf_counter
+    results = []
+
+    with service.deferred_durability():
+        for event in events:
+            if isinstance(event, tuple):
+                results.append(event)
+                continue
+
+            started = clock()
+            try:
+                results.append((201, apply_event(service, event)))
+                metrics.observe_event(event.type, clock() - started)
+            except EVENT_ERRORS as error:
+                metrics.observe_event(event.type, clock() - started, error)
+                results.append(error_result(error))
+
+    return results
+
+
+# Applies every event or none of them. Results follow /event, except that when one event fails the
+# others report NOT_APPLIED. Events that cannot be decoded, or that lack an account their type
+# requires, abort the batch before anything is locked or applied.
+# Raises AtomicBatchesUnavailable, whatever the events, when the service cannot apply batches atomically.
+def _apply_atomically(service: AccountService, events: list) -> list[tuple[int, object]]:
+    account_ids = []
+    rejected = {}
+
+    for index, event in enumerate(events):
+        if isinstance(event, tuple):
+            rejected[index] = event
+            continue
+        try:
+            account_ids.extend(event_account_ids(event))
+        except InvalidEvent as error:
+            rejected[index] = error_result(error)
+
+    # The batch only locks the accounts once entered
+    atomic = service.atomic(*account_ids)
+    if rejected:
+        return [rejected.get(index, NOT_APPLIED) for index in range(len(events))]
+
+    results = []
+
+    try:
+        with atomic as batch:
+            for event in events:
+                results.append((201, apply_event(batch, event)))
+    except EVENT_ERRORS as error:
+        failed = error_result(error)
+        return [failed if index == len(results) else NOT_APPLIED for index in range(len(events))]
+
+    return results
+
+
+async def _read_lines(request: Request):
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+# Endpoint to apply many events in a single request
+@router.post("/events")
+async def handle_events(
+    request: Request,
+    atomic: bool = False,
+    service: AccountService = Depends(get_service),
+):
+    """
+    Applies a batch of deposit, withdraw and transfer events, in order.
+
+    The body is either a JSON array of events or, with an `application/x-ndjson` content type,
+    a stream of events with one JSON object per line. Streamed events are applied in chunks as
+    they are received. Each event is validated and applied exactly like in `/event`, without the
+    per-request overhead.
+
+    Parameters:
+    ----------
+    atomic : bool
+        When true, either every event is applied or none of them is. The whole batch is read
+        before being applied, with the locks of every involved account held at once.
+        Not available with sharded accounts (501).
+
+    Returns:
+    -------
+    StreamingResponse:
+        One JSON object per line and per event, in the order of the request, of the form
+        `{"status": <status /event would return>, "body": <body /event would return>}`.
+        Events that could not be decoded report status 422. In an atomic batch that failed,
+        the events that were not applied report status 424.
+    """
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+
+    if ndjson and atomic:
+        events = [_decode_event(line) async for line in _read_lines(request)]
+    elif ndjson:
+        events = None
+    else:
+        try:
+            raw_events = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of events")
+        if not isinstance(raw_events, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of events")
+        events = []
+        for raw in raw_events:
+            try:
+                events.append(parse_event(raw))
+            except ValueError as error:
+                events.append((422, {"detail": str(error)}))
+
+    async def chunks():
+        if events is None:
+            chunk = []
+            async for line in _read_lines(request):
+                chunk.append(_decode_event(line))
+                if len(chunk) >= EVENTS_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        else:
+            for start in range(0, len(events), EVENTS_CHUNK_SIZE):
+                yield events[start:start + EVENTS_CHUNK_SIZE]
+
+    # An atomic batch only has results once it has committed or rolled back, so they are all
+    # computed before the response starts.
+    if atomic:
+        try:
+            results = await run_in_threadpool(_apply_atomically, service, events)
+        except AtomicBatchesUnavailable as error:
+            return PlainTextResponse(content=str(error), status_code=501)
+        return Response(content=b"".join(map(_encode_result, results)), media_type="application/x-ndjson")
+
+    # Results of each chunk are sent as soon as the chunk is applied.
+    async def stream_results():
+        async for chunk in chunks():
+            results = await run_in_threadpool(_apply_chunk, service, chunk)
+            yield b"".join(map(_encode_result, results))
+
+    return RequestStreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+# Largest number of accounts /aggregates can list
+AGGREGATES_TOP_MAX = 1000
+
+
+# Endpoint to get the total balance and the largest balances
+@router.get("/aggregates")
+async def get_aggregates(
+    top: int = Query(default=10, ge=0, le=AGGREGATES_TOP_MAX),
+    service: AsyncAccountService = Depends(get_async_service),
+):
+    """
+    Returns the total balance, the number of accounts and the accounts with the largest balances.
+
+    The figures are maintained as events are applied, so they are answered in constant time whatever
+    the number of accounts, and all of them describe the same point in time.
+
+    Parameters:
+    ----------
+    top : int
+        Number of accounts with the largest balances to list (up to 1000), largest first.
+
+    Returns:
+    -------
+    dict:
+        `{"total": <sum of balances>, "accounts": <number of accounts>, "top": [{"id": ..., "balance": ...}]}`.
+        When aggregates are disabled or not available with the repository: a 501 status code.
+    """
+    try:
+        total, count, largest = await service.get_aggregates(top)
+    except AggregatesUnavailable as error:
+        return PlainTextResponse(content=str(error), status_code=501)
+
+    return {
+        "total": total,
+        "accounts": count,
+        "top": [{"id": account_id, "balance": balance} for account_id, balance in largest],
+    }
+
+
+# Accounts read per page while /accounts streams them
+ACCOUNTS_PAGE_SIZE = 1000
+
+# Largest page of accounts a client can ask for
+ACCOUNTS_LIMIT_MAX = 10000
+
+
+# Endpoint to list the accounts
+@router.get("/accounts")
+async def list_accounts(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=ACCOUNTS_LIMIT_MAX),
+    service: AsyncAccountService = Depends(get_async_service),
+):
+    """
+    Lists the accounts and their balances.
+
+    Accounts are read from the repository a page at a time, with no lock held between pages, so
+    listing millions of accounts neither builds them all in memory nor holds up events. Every account
+    that exists for the whole listing is returned exactly once; accounts created or removed in the
+    meantime may or may not be.
+
+    Parameters:
+    ----------
+    cursor : Optional[str]
+        Where to resume the listing: the `Next-Cursor` header of a previous page.
+    limit : Optional[int]
+        When given, at most this many accounts (up to 10000) are returned, and the `Next-Cursor`
+        header holds the cursor of the following page if there are accounts left. Otherwise, every
+        account from the cursor on is streamed.
+
+    Returns:
+    -------
+    StreamingResponse:
+        One JSON object per line and per account, of the form `{"id": <account ID>, "balance": <balance>}`.
+        An invalid cursor returns a 400 status code.
+    """
+    try:
+        position = _decode_cursor(cursor)
+        page, position = await service.scan(position, min(limit or ACCOUNTS_PAGE_SIZE, ACCOUNTS_PAGE_SIZE))
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if limit is None:
+        async def stream_accounts(page, position):
+            while True:
+                if page:
+                    yield encode_accounts(page)
+                if position is None:
+                    return
+                page, position = await service.scan(position, ACCOUNTS_PAGE_SIZE)
+
+        return StreamingResponse(stream_accounts(page, position), media_type="application/x-ndjson")
+
+    accounts = list(page)
+    while position is not None and len(accounts) < limit:
+        page, position = await service.scan(position, min(limit - len(accounts), ACCOUNTS_PAGE_SIZE))
+        accounts += page
+
+    response = Response(content=encode_accounts(accounts), media_type="application/x-ndjson")
+    if position is not None:
+        response.headers["Next-Cursor"] = _encode_cursor(position)
+    return response
+
+
+# Cursors of the repository are wrapped in URL-safe base64, so any account ID they hold fits in a query string.
+def _encode_cursor(position: str) -> str:
+    return base64.urlsafe_b64encode(position.encode("utf-8", "surrogatepass")).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    if cursor is None:
+        return None
+
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8", "surrogatepass")
+    except (binascii.Error, ValueError):
+        raise InvalidCursor()
+
+
+# Bytes of the request body written to the spooled file at a time by /admin/import
+IMPORT_SPOOL_CHUNK_SIZE = 1 << 20
+
+
+# Endpoint to import balances in bulk
+@router.post("/admin/import")
+async def import_balances(
+    request: Request,
+    format: Optional[str] = None,
+    service: AccountService = Depends(get_service),
+    import_token: Optional[str] = Header(default=None, alias="X-Import-Token"),
+):
+    """
+    Imports balances in bulk from a CSV or NDJSON body.
+
+    Every row credits its amount to its account, like a deposit, so importing into an empty instance
+    loads the balances of the file. The body is spooled to a temporary file and parsed a chunk at a
+    time; valid rows are applied in batches, and invalid rows are reported without stopping the import.
+
+    Parameters:
+    ----------
+    format : Optional[str]
+        "csv" (`account_id,amount` rows, with an optional header) or "ndjson" (`{"id": ..., "amount": ...}`
+        rows, `balance` accepted instead of `amount`). When not given, it follows the content type:
+        NDJSON for JSON content types, CSV otherwise.
+    import_token : Optional[str]
+        The import token configured with IMPORT_TOKEN, sent in an X-Import-Token header.
+
+    Returns:
+    -------
+    dict:
+        `{"rows", "imported", "rejected", "seconds", "rows_per_second", "errors"}`, where `errors` lists the
+        line and error of the first rejected rows. An unknown format returns a 400 status code, a missing or
+        wrong token a 403 status code, and a 404 status code is returned when no import token is configured.
+    """
+    if settings.import_token is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Header values are decoded as Latin-1: their raw bytes are compared with the UTF-8 bytes of the token.
+    if import_token is None or not hmac.compare_digest(import_token.encode("latin-1"), settings.import_token.encode()):
+        raise HTTPException(status_code=403, detail="A valid X-Import-Token header is required")
+
+    if format is None:
+        format = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(FORMATS)}")
+
+    with tempfile.TemporaryFile() as file:
+        pending = []
+        size = 0
+        async for chunk in request.stream():
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= IMPORT_SPOOL_CHUNK_SIZE:
+                file.write(b"".join(pending))
+                pending, size = [], 0
+        file.write(b"".join(pending))
+        file.flush()
+
+        report = await run_in_threadpool(import_file, service, file, format)
+
+    return report.as_dict()
+
+
+# Endpoint to subscribe to the balance changes of accounts
+@router.get("/subscribe")
+async def subscribe(
+    account_id: list[str] = Query(default=[]),
+    service: AsyncAccountService = Depends(get_async_service),
+):
+    """
+    Streams the balance changes of the given accounts as server-sent events.
+
+    The stream starts with the current balances of the accounts that exist, then pushes the new balance
+    of an account each time a deposit, withdrawal or transfer changes it. Changes a subscriber has not
+    read yet are kept per account, latest balance only, for a bounded number of accounts; when a slow
+    subscriber falls further behind, the oldest pending changes are dropped and reported, so writers
+    never wait for subscribers.
+
+    Parameters:
+    ----------
+    account_id : list[str]
+        The accounts to follow, repeated once per account (`?account_id=100&account_id=300`).
+
+    Returns:
+    -------
+    StreamingResponse:
+        A `text/event-stream` of `balances` events (`{"<account ID>": <balance>, ...}`), `lagged` events
+        (`{"dropped": <number of changes dropped>}`: balances not listed since may be stale until they change
+        again) and `reset` events (every account was reset). Idle streams receive a keep-alive comment.
+        Without accounts or with too many of them: a 400 status code. Over the subscriber limit: a 429
+        status code. When subscriptions are disabled or not available with the repository: a 501 status code.
+    """
+    if not account_id or len(set(account_id)) > settings.subscription_max_accounts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Between 1 and {settings.subscription_max_accounts} account_id parameters are required",
+        )
+
+    subscriptions = getattr(service.service, "subscriptions", None)
+    if subscriptions is not None and len(subscriptions) >= settings.subscription_max_subscribers:
+        raise Overloaded(settings.admission_retry_after, "Too many subscribers")
+
+    subscription = Subscription(account_id, buffer_size=settings.subscription_buffer_size)
+    try:
+        await service.subscribe(subscription)
+    except SubscriptionsUnavailable as error:
+        return PlainTextResponse(content=str(error), status_code=501)
+
+    async def stream_changes():
+        try:
+            while True:
+                update = await subscription.changes(timeout=settings.subscription_keepalive)
+                yield encode_balance_update(update) if update is not None else b": keepalive\n\n"
+        finally:
+            await service.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream_changes(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Endpoint exposing the application metrics to Prometheus
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Returns the application metrics in the Prometheus text exposition format.
+
+    Exposes per-event-type counts, rejected events by exception, event latency
+    histograms, the time spent waiting for account locks and the number of accounts.
+
+    Returns:
+    -------
+    PlainTextResponse:
+        The metrics, with a 200 status code.
+    """
+    return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,80 @@
+import re
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+# Pydantic model for event request validation
+class EventRequest(BaseModel):
+    type: str
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    amount: int
+
+
+# Integer strings as accepted by Pydantic: ASCII digits, optional sign, underscores between digits
+# and a fractional part made only of zeros, surrounded by optional whitespace.
+_INTEGER_STRING = re.compile(r"\s*([+-]?[0-9]+(?:_[0-9]+)*)(?:\.0+)?\s*")
+
+
+# This function converts an amount to an integer the way EventRequest validates it.
+def parse_amount(value) -> int:
+    if isinstance(value, int):
+        return int(value)
+
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    if isinstance(value, str):
+        match = _INTEGER_STRING.fullmatch(value)
+        if match:
+            return int(match.group(1))
+
+    raise ValueError("amount must be an integer")
+
+
+def _parse_account_id(raw: dict, field: str) -> Optional[str]:
+    value = raw.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+def parse_event(raw) -> EventRequest:
+    """
+    Builds an EventRequest from an already decoded JSON object without running Pydantic validation.
+
+    It accepts the same inputs as EventRequest for the values clients actually send, and is used
+    on the bulk paths where building one validated model per event would dominate the cost.
+
+    Parameters:
+    ----------
+    raw : dict
+        The decoded JSON object of a single event.
+
+    Returns:
+    -------
+    EventRequest:
+        The event, constructed without re-validation.
+
+    Raises:
+    ------
+    ValueError:
+        If the object is not a valid event.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("event must be a JSON object")
+
+    event_type = raw.get("type")
+    if not isinstance(event_type, str):
+        raise ValueError("type must be a string")
+
+    if "amount" not in raw:
+        raise ValueError("amount is required")
+
+    return EventRequest.model_construct(
+        type=event_type,
+        origin=_parse_account_id(raw, "origin"),
+        destination=_parse_account_id(raw, "destination"),
+        amount=parse_amount(raw["amount"]),
+    )
@@ -0,0 +1,255 @@
+# This module runs a benchmark and prints its report as JSON.
+#
+#   python -m app.benchmarks --target service --events 100000
+#   python -m app.benchmarks --target asgi --concurrency 32 --repository columnar
+#   python -m app.benchmarks --target fast-path --concurrency 32
+#   python -m app.benchmarks --target sharded --shards 4 --concurrency 32
+#
+# The "service" target calls AccountService directly; the "asgi" target sends HTTP requests to the
+# FastAPI app in process, through httpx's ASGI transport, so it measures routing, validation and
+# encoding as well; the "fast-path" target sends them to the raw ASGI fast path of app.fast_main
+# instead; the "sharded" target calls ShardedAccountService from `concurrency` threads.
+# Reports can be compared across commits to catch regressions before deploying.
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from app.benchmarks.workload import Workload
+from app.domain.exceptions import AccountNotFound, InsufficientFunds, NegativeValue
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.sharded_account_service import ShardedAccountService
+
+# Backends a benchmark can run against, by the name used for ACCOUNT_REPOSITORY
+REPOSITORIES = ("memory", "columnar", "sqlite")
+
+# Backends each shard process of the sharded target can build for itself
+SHARDED_REPOSITORIES = {"memory": InMemoryAccountRepository, "columnar": ColumnarAccountRepository}
+
+
+# Backends that store their data in files keep them in `directory`.
+def build_repository(name: str, directory: str):
+    if name == "memory":
+        return InMemoryAccountRepository()
+
+    if name == "columnar":
+        return ColumnarAccountRepository()
+
+    if name == "sqlite":
+        from app.infrastructure.sqlite_account_repository import SqliteAccountRepository
+        return SqliteAccountRepository(directory + "/accounts.db")
+
+    raise ValueError(f"Unknown repository: {name}")
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_report(target: str, workload: Workload, latencies: list[float], elapsed: float, outcomes: dict) -> dict:
+    latencies.sort()
+    return {
+        "target": target,
+        "events": len(latencies),
+        "seconds": round(elapsed, 6),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_us": {
+            "p50": round(percentile(latencies, 0.50) * 1e6, 2),
+            "p95": round(percentile(latencies, 0.95) * 1e6, 2),
+            "p99": round(percentile(latencies, 0.99) * 1e6, 2),
+            "max": round(latencies[-1] * 1e6, 2) if latencies else 0.0,
+        },
+        "outcomes": outcomes,
+        "workload": {
+            "accounts": workload.accounts,
+            "weights": workload.weights,
+            "hot_accounts": workload.hot_accounts,
+            "hot_share": workload.hot_share,
+            "seed": workload.seed,
+        },
+    }
+
+
+def apply(service: AccountService, event: dict):
+    if event["type"] == "deposit":
+        return service.deposit(event["destination"], event["amount"])
+    if event["type"] == "withdraw":
+        return service.withdraw(event["origin"], event["amount"])
+    return service.transfer(event["origin"], event["destination"], event["amount"])
+
+
+# This function replays the workload against AccountService alone, one event at a time.
+def run_service(workload: Workload, service: AccountService) -> dict:
+    for event in workload.setup():
+        apply(service, event)
+
+    events = list(workload)
+    latencies = []
+    outcomes = {"ok": 0, "rejected": 0}
+    clock = time.perf_counter
+
+    started = clock()
+    for event in events:
+        before = clock()
+        try:
+            apply(service, event)
+            outcomes["ok"] += 1
+        except (AccountNotFound, InsufficientFunds, NegativeValue):
+            outcomes["rejected"] += 1
+        latencies.append(clock() - before)
+    elapsed = clock() - started
+
+    return build_report("service", workload, latencies, elapsed, outcomes)
+
+
+# This function replays the workload against ShardedAccountService from `concurrency` threads, so that
+# requests to different shards are in flight at the same time.
+def run_sharded(workload: Workload, service: ShardedAccountService, concurrency: int) -> dict:
+    for event in workload.setup():
+        apply(service, event)
+
+    events = iter(list(workload))
+    events_lock = threading.Lock()
+    latencies = []
+    outcomes = {"ok": 0, "rejected": 0}
+    clock = time.perf_counter
+
+    def worker():
+        while True:
+            with events_lock:
+                event = next(events, None)
+            if event is None:
+                return
+
+            before = clock()
+            try:
+                apply(service, event)
+                outcome = "ok"
+            except (AccountNotFound, InsufficientFunds, NegativeValue):
+                outcome = "rejected"
+            latency = clock() - before
+
+            with events_lock:
+                latencies.append(latency)
+                outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = clock()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = clock() - started
+
+    return build_report("sharded", workload, latencies, elapsed, outcomes)
+
+
+# This function replays the workload as POST /event requests against the in-process ASGI app,
+# with `concurrency` requests in flight at any time.
+async def run_asgi(workload: Workload, service: AccountService, concurrency: int, fast_path: bool = False) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.api.fast_path import FastPathApp
+    from app.api.routes import get_service
+    from app.services.async_account_service import AsyncAccountService
+
+    app.dependency_overrides[get_service] = lambda: service
+    transport = httpx.ASGITransport(app=FastPathApp(app, AsyncAccountService(service)) if fast_path else app)
+    latencies = []
+    outcomes: dict[str, int] = {}
+    clock = time.perf_counter
+
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for event in workload.setup():
+                await client.post("/event", json=event)
+
+            events = iter(list(workload))
+
+            async def worker():
+                for event in events:
+                    before = clock()
+                    response = await client.post("/event", json=event)
+                    latencies.append(clock() - before)
+                    status = str(response.status_code)
+                    outcomes[status] = outcomes.get(status, 0) + 1
+
+            started = clock()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = clock() - started
+    finally:
+        app.dependency_overrides.pop(get_service, None)
+
+    return build_report("fast-path" if fast_path else "asgi", workload, latencies, elapsed, outcomes)
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks", description=__doc__)
+    parser.add_argument("--target", choices=("service", "asgi", "fast-path", "sharded"), default="service")
+    parser.add_argument("--repository", choices=REPOSITORIES, default="memory")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--deposit", type=float, default=0.6, help="relative weight of deposits")
+    parser.add_argument("--withdraw", type=float, default=0.2, help="relative weight of withdrawals")
+    parser.add_argument("--transfer", type=float, default=0.2, help="relative weight of transfers")
+    parser.add_argument("--hot-accounts", type=int, default=10)
+    parser.add_argument("--hot-share", type=float, default=0.5, help="probability of picking a hot account")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight (asgi, fast-path and sharded targets)")
+    parser.add_argument("--shards", type=int, default=0, help="worker processes (sharded target, default: one per core)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    workload = Workload(
+        events=args.events,
+        accounts=args.accounts,
+        deposit=args.deposit,
+        withdraw=args.withdraw,
+        transfer=args.transfer,
+        hot_accounts=args.hot_accounts,
+        hot_share=args.hot_share,
+        seed=args.seed,
+    )
+
+    if args.target == "sharded":
+        if args.repository not in SHARDED_REPOSITORIES:
+            parser.error(f"the sharded target supports the {', '.join(SHARDED_REPOSITORIES)} repositories")
+
+        service = ShardedAccountService(args.shards, repository_factory=SHARDED_REPOSITORIES[args.repository])
+        try:
+            report = run_sharded(workload, service, args.concurrency)
+        finally:
+            service.close()
+
+        report["repository"] = args.repository
+        report["shards"] = service.shards
+        return report
+
+    with tempfile.TemporaryDirectory(prefix="ebanx-benchmark-") as directory:
+        service = AccountService(build_repository(args.repository, directory))
+        try:
+            if args.target == "service":
+                report = run_service(workload, service)
+            else:
+                report = asyncio.run(run_asgi(workload, service, args.concurrency, args.target == "fast-path"))
+        finally:
+            close = getattr(service.repository, "close", None)
+            if close is not None:
+                close()
+
+    report["repository"] = args.repository
+    return report
+
+
+if __name__ == "__main__":
+    json.dump(main(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,75 @@
+import random
+from typing import Iterator
+
+
+# This class describes the mix of events replayed by a benchmark.
+class Workload:
+    """
+        A reproducible stream of deposit, withdraw and transfer events.
+
+        Attributes:
+        ----------
+        events : int
+            Number of events to generate.
+        accounts : int
+            Number of distinct accounts the events are spread over.
+        deposit, withdraw, transfer : float
+            Relative weights of each event type.
+        hot_accounts : int
+            Number of accounts that receive a disproportionate share of the traffic.
+        hot_share : float
+            Probability that an account picked for an event is one of the hot accounts.
+        amount : int
+            Maximum amount of an event; amounts are drawn uniformly from 1 to this value.
+        seed : int
+            Seed of the random generator, so that runs replay the same events.
+    """
+
+    def __init__(
+        self,
+        events: int = 10000,
+        accounts: int = 1000,
+        deposit: float = 0.6,
+        withdraw: float = 0.2,
+        transfer: float = 0.2,
+        hot_accounts: int = 10,
+        hot_share: float = 0.5,
+        amount: int = 100,
+        seed: int = 42,
+    ):
+        self.events = events
+        self.accounts = accounts
+        self.weights = (deposit, withdraw, transfer)
+        self.hot_accounts = min(hot_accounts, accounts)
+        self.hot_share = hot_share
+        self.amount = amount
+        self.seed = seed
+
+    # This method yields the accounts that are funded before the measured events, so that withdrawals
+    # and transfers mostly succeed instead of measuring the AccountNotFound path.
+    def setup(self) -> Iterator[dict]:
+        for account in range(self.accounts):
+            yield {"type": "deposit", "destination": str(account), "amount": self.amount * 10}
+
+    def __iter__(self) -> Iterator[dict]:
+        generator = random.Random(self.seed)
+        types = generator.choices(("deposit", "withdraw", "transfer"), weights=self.weights, k=self.events)
+
+        def pick_account() -> str:
+            if self.hot_accounts and generator.random() < self.hot_share:
+                return str(generator.randrange(self.hot_accounts))
+            return str(generator.randrange(self.accounts))
+
+        for event_type in types:
+            amount = generator.randint(1, self.amount)
+            if event_type == "deposit":
+                yield {"type": "deposit", "destination": pick_account(), "amount": amount}
+            elif event_type == "withdraw":
+                yield {"type": "withdraw", "origin": pick_account(), "amount": amount}
+            else:
+                yield {
+                    "type": "transfer",
+                    "origin": pick_account(),
+                    "destination": pick_account(),
+                    "amount": amount,
+                }
@@ -0,0 +1,180 @@
+# This module centralizes the runtime configuration of the application.
+# Every setting is read from an environment variable so the same image can be tuned from docker-compose.
+import os
+from typing import Optional
+
+
+def _env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class Settings:
+    """
+        Application settings loaded from environment variables.
+
+        Attributes:
+        ----------
+        account_repository : str
+            Storage backend of the accounts: "memory" (per process), "columnar" (per process,
+            compact storage for large numbers of accounts), "shared_memory" (one ledger shared
+            by every worker process) or "sqlite" (persisted in a SQLite database).
+        shared_memory_path : str
+            Path of the memory-mapped file backing the "shared_memory" repository.
+        shared_memory_capacity : int
+            Maximum number of accounts the shared memory region can hold.
+        shared_memory_key_size : int
+            Maximum length, in UTF-8 bytes, of an account ID in the shared memory region.
+        account_shards : int
+            Number of worker processes the accounts are partitioned over, by hash of the account ID, so that
+            events are applied on several cores. 0 keeps every account in the request process. Only
+            available with the "memory" and "columnar" repositories, without event log, snapshots or
+            balance history.
+        sqlite_path : str
+            Path of the database of the "sqlite" repository.
+        sqlite_synchronous : str
+            SQLite synchronous mode: "NORMAL" survives a crash of the process, "FULL" a loss of power.
+        event_log_path : Optional[str]
+            Path of the append-only event log. When unset, events are not persisted.
+        event_log_commit_window : float
+            Time in seconds the log writer waits to group events into a single fsync.
+        event_log_fsync : bool
+            Whether each group commit is followed by an fsync of the log file.
+        event_log_replay_workers : int
+            Number of processes the event log is replayed on at startup, each summing the events of one part of
+            the log by account. 0 replays it in the request process, one event at a time.
+        event_log_replay_verify : bool
+            Whether a parallel replay is checked against a sequential one, failing startup if they differ.
+        fast_responses : bool
+            Whether event responses are rendered from pre-built templates instead of FastAPI's JSON encoder.
+        balance_view : bool
+            Whether balance reads are served from a copy of the committed balances, without taking locks.
+            Costs an entry per account and time on every write. Not available with the "shared_memory" and
+            "sqlite" repositories, which other processes write to.
+        balance_aggregates : bool
+            Whether the total balance, the number of accounts and the largest balances are maintained as
+            balances change, for GET /aggregates. Requires the balance view. Seeding the sorted index at startup
+            sorts every account.
+        balance_history : bool
+            Whether the balance of every account is recorded after each event, for point-in-time queries.
+            Not available with the "shared_memory" repository, whose events are applied by several processes.
+        balance_history_limit : int
+            Maximum number of balances kept per account; the oldest half is dropped when it is exceeded.
+        event_pipeline : bool
+            Whether /event operations are applied by a single writer thread in micro-batches, taking the locks
+            of a batch once and reading and writing each of its accounts once, instead of locking per request.
+        event_pipeline_batch_size : int
+            Maximum number of operations the writer applies in one batch.
+        balance_subscriptions : bool
+            Whether clients can subscribe to the balance changes of accounts with GET /subscribe. Not available
+            with the "shared_memory" and "sqlite" repositories, which other processes write to.
+        subscription_buffer_size : int
+            Maximum number of accounts whose latest balance waits for a slow subscriber; beyond it, the oldest
+            pending change is dropped.
+        subscription_max_accounts : int
+            Maximum number of accounts a single subscription can follow.
+        subscription_max_subscribers : int
+            Maximum number of open subscriptions per worker; further ones are refused with a 429 status code.
+        subscription_keepalive : float
+            Time in seconds after which an idle subscription stream receives a keep-alive comment.
+        snapshot_path : Optional[str]
+            Path of the binary snapshot of the accounts. When set, the state is loaded from it on startup
+            (replaying only the events logged after it) and a new snapshot is written periodically.
+            Not available with the "shared_memory" repository.
+        snapshot_interval : float
+            Time in seconds between two snapshots.
+        idempotency_cache_size : int
+            Maximum number of /event responses kept for requests retried with the same Idempotency-Key.
+        idempotency_cache_bytes : int
+            Maximum memory, in bytes, taken by the kept responses; the least recently used are dropped first.
+        idempotency_ttl : float
+            Time in seconds a response is replayed for after the request that produced it.
+        idempotency_path : Optional[str]
+            Database the responses are kept in when workers share a ledger (the "shared_memory" and "sqlite"
+            repositories), so a retry is replayed whichever worker it reaches. Defaults to the path of the
+            ledger followed by "-idempotency".
+        profile_token : Optional[str]
+            Token that requests send in an X-Profile header to be profiled. When unset, no request asks for it.
+        profile_sample_rate : float
+            Fraction of requests profiled at random, from 0 to 1.
+        profile_dir : str
+            Directory the profiles are written to, in the collapsed stack format of flame graph tools.
+        import_token : Optional[str]
+            Token that requests to POST /admin/import send in an X-Import-Token header. When unset, the endpoint
+            is disabled and returns a 404.
+        admission_max_concurrency : int
+            Maximum number of /event requests processed at the same time by a worker. 0 disables admission control.
+        admission_queue_size : int
+            Requests that wait for one of those to finish; further requests are refused with a 429.
+        admission_queue_timeout : float
+            Time in seconds a request waits in that queue before being refused with a 429.
+        admission_retry_after : float
+            Time in seconds refused requests are told to wait before retrying (Retry-After header).
+        rate_limit_per_account : float
+            Events per second accepted for each account (the origin of withdrawals and transfers, the destination
+            of deposits); further events are refused with a 429. 0 disables the limit.
+        rate_limit_burst : int
+            Events an account can send at once before being held to that rate.
+        rate_limit_accounts : int
+            Accounts whose rate is tracked; the least recently seen are forgotten first.
+    """
+
+    def __init__(self):
+        self.account_repository = _env_str("ACCOUNT_REPOSITORY", "memory")
+        self.shared_memory_path = _env_str("SHARED_MEMORY_PATH", "/dev/shm/ebanx-accounts")
+        self.shared_memory_capacity = _env_int("SHARED_MEMORY_CAPACITY", 262144)
+        self.shared_memory_key_size = _env_int("SHARED_MEMORY_KEY_SIZE", 64)
+        self.account_shards = _env_int("ACCOUNT_SHARDS", 0)
+        self.sqlite_path = _env_str("SQLITE_PATH", "ebanx.db")
+        self.sqlite_synchronous = _env_str("SQLITE_SYNCHRONOUS", "NORMAL")
+        self.event_log_path = _env_str("EVENT_LOG_PATH")
+        self.event_log_commit_window = _env_float("EVENT_LOG_COMMIT_WINDOW_MS", 2.0) / 1000
+        self.event_log_fsync = _env_bool("EVENT_LOG_FSYNC", True)
+        self.event_log_replay_workers = _env_int("EVENT_LOG_REPLAY_WORKERS", 0)
+        self.event_log_replay_verify = _env_bool("EVENT_LOG_REPLAY_VERIFY", False)
+        self.fast_responses = _env_bool("FAST_RESPONSES", True)
+        self.balance_view = _env_bool("BALANCE_VIEW", False)
+        self.balance_aggregates = _env_bool("BALANCE_AGGREGATES", False)
+        self.balance_history = _env_bool("BALANCE_HISTORY", False)
+        self.balance_history_limit = _env_int("BALANCE_HISTORY_LIMIT", 4096)
+        self.event_pipeline = _env_bool("EVENT_PIPELINE", False)
+        self.event_pipeline_batch_size = _env_int("EVENT_PIPELINE_BATCH_SIZE", 256)
+        self.balance_subscriptions = _env_bool("BALANCE_SUBSCRIPTIONS", True)
+        self.subscription_buffer_size = _env_int("SUBSCRIPTION_BUFFER_SIZE", 256)
+        self.subscription_max_accounts = _env_int("SUBSCRIPTION_MAX_ACCOUNTS", 1000)
+        self.subscription_max_subscribers = _env_int("SUBSCRIPTION_MAX_SUBSCRIBERS", 1000)
+        self.subscription_keepalive = _env_float("SUBSCRIPTION_KEEPALIVE_SECONDS", 15.0)
+        self.snapshot_path = _env_str("SNAPSHOT_PATH")
+        self.snapshot_interval = _env_float("SNAPSHOT_INTERVAL_SECONDS", 300.0)
+        self.idempotency_cache_size = _env_int("IDEMPOTENCY_CACHE_SIZE", 100000)
+        self.idempotency_cache_bytes = _env_int("IDEMPOTENCY_CACHE_MB", 64) * 1024 * 1024
+        self.idempotency_ttl = _env_float("IDEMPOTENCY_TTL_SECONDS", 86400.0)
+        self.idempotency_path = _env_str("IDEMPOTENCY_PATH")
+        self.profile_token = _env_str("PROFILE_TOKEN")
+        self.profile_sample_rate = _env_float("PROFILE_SAMPLE_RATE", 0.0)
+        self.profile_dir = _env_str("PROFILE_DIR", "profiles")
+        self.import_token = _env_str("IMPORT_TOKEN")
+        self.admission_max_concurrency = _env_int("ADMISSION_MAX_CONCURRENCY", 0)
+        self.admission_queue_size = _env_int("ADMISSION_QUEUE_SIZE", 64)
+        self.admission_queue_timeout = _env_float("ADMISSION_QUEUE_TIMEOUT_MS", 500.0) / 1000
+        self.admission_retry_after = _env_float("ADMISSION_RETRY_AFTER_SECONDS", 1.0)
+        self.rate_limit_per_account = _env_float("RATE_LIMIT_PER_ACCOUNT", 0.0)
+        self.rate_limit_burst = _env_int("RATE_LIMIT_BURST", 20)
+        self.rate_limit_accounts = _env_int("RATE_LIMIT_ACCOUNTS", 100000)
@@ -0,0 +1,224 @@
+# This module wires the application objects together from the settings.
+# It is the single place that decides which repository and persistence components the API uses.
+import gc
+import os
+from typing import Optional
+
+from app.config import Settings
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.infrastructure.shared_memory_account_repository import SharedMemoryAccountRepository
+from app.infrastructure.snapshot import SnapshotError, read_snapshot
+from app.infrastructure.sqlite_account_repository import SqliteAccountRepository
+from app.domain.account_repository import AccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_aggregates import BalanceAggregates
+from app.services.balance_history import BalanceHistory
+from app.services.balance_subscriptions import BalanceSubscriptions
+from app.services.balance_view import BalanceView
+from app.services.event_pipeline import EventPipeline
+from app.services.log_replay import replay_log
+from app.services.sharded_account_service import ShardedAccountService
+from app.services.snapshotter import Snapshotter
+from app.utils.metrics import Metrics
+from app.utils.striped_lock import StripedLock
+
+
+# This function builds the account repository selected by the settings.
+def build_repository(settings: Settings) -> AccountRepository:
+    if settings.account_repository == "memory":
+        return InMemoryAccountRepository()
+
+    if settings.account_repository == "columnar":
+        return ColumnarAccountRepository()
+
+    if settings.account_repository == "shared_memory":
+        return SharedMemoryAccountRepository(
+            settings.shared_memory_path,
+            capacity=settings.shared_memory_capacity,
+            key_size=settings.shared_memory_key_size,
+        )
+
+    if settings.account_repository == "sqlite":
+        return SqliteAccountRepository(settings.sqlite_path, synchronous=settings.sqlite_synchronous)
+
+    raise ValueError(f"Unknown account repository: {settings.account_repository}")
+
+
+# This function loads the snapshot configured by the settings into the repository and returns the offset of
+# the event log from which events still have to be replayed. When a log is configured, it is the source of
+# truth: a snapshot that does not belong to it (taken without a log, ahead of it, or unreadable) is ignored
+# and the whole log is replayed.
+def load_snapshot(settings: Settings, repository: AccountRepository) -> int:
+    try:
+        snapshot = read_snapshot(settings.snapshot_path)
+    except SnapshotError:
+        if settings.event_log_path:
+            return 0
+        raise
+
+    if snapshot is None:
+        return 0
+
+    if settings.event_log_path:
+        log_size = os.path.getsize(settings.event_log_path) if os.path.exists(settings.event_log_path) else 0
+        if not 0 <= snapshot.log_offset <= log_size:
+            return 0
+
+    # Millions of objects are allocated at once: the collector would scan them over and over while they are.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        repository.load(snapshot.account_ids, snapshot.balances)
+    finally:
+        if collecting:
+            gc.enable()
+
+    return max(snapshot.log_offset, 0)
+
+
+# This function builds the service spreading the accounts over ACCOUNT_SHARDS worker processes.
+# Each process builds its own repository of the configured kind.
+def build_sharded_service(settings: Settings, metrics: Optional[Metrics] = None) -> ShardedAccountService:
+    repositories = {"memory": InMemoryAccountRepository, "columnar": ColumnarAccountRepository}
+    if settings.account_repository not in repositories:
+        raise ValueError(f"Sharded accounts are not available with the {settings.account_repository} repository")
+
+    if settings.event_log_path or settings.snapshot_path:
+        raise ValueError("Sharded accounts are not available with an event log or snapshots")
+
+    service = ShardedAccountService(settings.account_shards, repository_factory=repositories[settings.account_repository])
+
+    if metrics is not None:
+        metrics.gauge("ebanx_accounts", "Number of accounts in the repository.", lambda: len(service))
+
+    return service
+
+
+# This function builds the account service described by the settings.
+# When an event log is configured, the repository is rebuilt by replaying it before new events are accepted.
+# When a snapshot is configured, it is loaded first and only the events logged after it are replayed.
+# When metrics are given, they record the time spent waiting for account locks and the number of accounts.
+def build_service(settings: Settings, metrics: Optional[Metrics] = None) -> AccountService:
+    if settings.account_shards > 0:
+        return build_sharded_service(settings, metrics)
+
+    repository = build_repository(settings)
+    service = AccountService(repository, locks=StripedLock(metrics=metrics))
+
+    if metrics is not None:
+        metrics.gauge("ebanx_accounts", "Number of accounts in the repository.", lambda: len(service.repository))
+
+    # Snapshots copy a repository owned by this process; a shared one is changed by other workers too.
+    # A persistent repository already holds the state: it is neither loaded from snapshots nor replayed.
+    persistent = getattr(repository, "persistent", False)
+    snapshots = settings.snapshot_path is not None and settings.account_repository != "shared_memory" and not persistent
+
+    if snapshots and not settings.event_log_path:
+        load_snapshot(settings, repository)
+
+    if settings.event_log_path:
+        # The log is opened (and locked) before it is replayed: a second process configured with the
+        # same file, such as another uvicorn worker with its own in-memory ledger, fails here.
+        # Workers of a shared repository share the log: each writes events while it holds the locks
+        # of the accounts involved, so the file keeps the order in which they were applied.
+        shared = settings.account_repository == "shared_memory"
+        event_log = EventLog(
+            settings.event_log_path,
+            commit_window=settings.event_log_commit_window,
+            fsync=settings.event_log_fsync,
+            shared=shared,
+        )
+
+        def replay():
+            offset = load_snapshot(settings, repository) if snapshots else 0
+            if settings.event_log_replay_workers > 0:
+                replay_log(
+                    service,
+                    settings.event_log_path,
+                    offset,
+                    workers=settings.event_log_replay_workers,
+                    verify=settings.event_log_replay_verify,
+                )
+            else:
+                service.replay(EventLog.read(settings.event_log_path, offset))
+
+        # A shared repository is rebuilt once, by the first worker attaching to it.
+        if shared:
+            repository.initialize(replay)
+        elif not persistent:
+            replay()
+
+        service.event_log = event_log
+
+    # History starts after the replay, from the balances the log rebuilt. Workers sharing a repository
+    # each see only the events they applied, so they cannot answer point-in-time queries.
+    if settings.balance_history and settings.account_repository != "shared_memory":
+        history = BalanceHistory(limit=settings.balance_history_limit)
+        history.seed(repository.items())
+        service.history = history
+        service.observers.append(history)
+
+    # The view starts from the rebuilt balances too. It only sees the writes of this process, so it cannot
+    # serve the reads of a repository other processes write to.
+    if settings.balance_view and settings.account_repository != "shared_memory" and not persistent:
+        aggregates = BalanceAggregates() if settings.balance_aggregates else None
+        view = BalanceView(service.locks, aggregates=aggregates)
+        view.seed(repository.items())
+        service.view = view
+        service.observers.append(view)
+
+        if aggregates is not None and metrics is not None:
+            metrics.gauge("ebanx_total_balance", "Sum of the balances of every account.", lambda: aggregates.read(0)[0])
+
+    # Subscribers are pushed the changes this process applies, so a repository other processes write to is left out.
+    if settings.balance_subscriptions and settings.account_repository != "shared_memory" and not persistent:
+        subscriptions = BalanceSubscriptions()
+        service.subscriptions = subscriptions
+        service.observers.append(subscriptions)
+
+        if metrics is not None:
+            metrics.gauge("ebanx_subscriptions", "Open balance subscriptions.", lambda: len(subscriptions))
+
+    if settings.event_pipeline:
+        pipeline = EventPipeline(service, max_batch=settings.event_pipeline_batch_size)
+        service.pipeline = pipeline
+
+        if metrics is not None:
+            metrics.counter("ebanx_pipeline_batches_total", "Batches applied by the event pipeline.", lambda: pipeline.batches)
+            metrics.counter("ebanx_pipeline_operations_total", "Operations applied by the event pipeline.", lambda: pipeline.operations)
+
+    if snapshots:
+        snapshotter = Snapshotter(service, settings.snapshot_path, interval=settings.snapshot_interval)
+        service.observers.append(snapshotter)
+        snapshotter.start()
+
+        if metrics is not None:
+            metrics.gauge("ebanx_snapshot_skipped_accounts", "Accounts the last snapshot could not hold.", lambda: len(snapshotter.skipped))
+
+    return service
+
+
+# This function releases the resources held by the service, flushing any pending log writes.
+# Observers that hold resources (such as the snapshotter, which writes a last snapshot) are closed first,
+# and the repository and the service itself (the processes of sharded accounts) last.
+def close_service(service: AccountService) -> None:
+    try:
+        # Operations still queued are applied before anything they need is closed.
+        pipeline = getattr(service, "pipeline", None)
+        if pipeline is not None:
+            pipeline.close()
+
+        for observer in service.observers:
+            close = getattr(observer, "close", None)
+            if close is not None:
+                close()
+    finally:
+        if service.event_log is not None:
+            service.event_log.close()
+
+        for resource in (service.repository, service):
+            close = getattr(resource, "close", None)
+            if close is not None:
+                close()
@@ -15,6 +15,9 @@ class Account:
             The current balance of the account, default is 0.
     """
 
+    # Accounts carry no instance dictionary, which keeps repositories holding millions of them small.
+    __slots__ = ("account_id", "balance")
+
     def __init__(self, account_id: str, balance: int = 0):
         """
             Constructs all the necessary attributes for the Account object.
@@ -0,0 +1,67 @@
+# This module defines the interface the AccountService expects from an account repository.
+from typing import Optional, Protocol, runtime_checkable
+
+from app.domain.account import Account
+from app.domain.exceptions import InvalidCursor
+
+
+@runtime_checkable
+class AccountRepository(Protocol):
+    """
+        Storage of the accounts used by the AccountService.
+
+        get() may return the stored Account or a copy of it, so callers always write a changed account
+        back with save(). Besides the methods below, a repository can offer optional capabilities, which
+        callers look up with getattr():
+
+        blocking : bool
+            False when operations never wait on I/O or other processes, so that async callers can run
+            them on the event loop. Repositories without the attribute are treated as blocking.
+        persistent : bool
+            True when the repository keeps its state across restarts by itself, so that it must not be
+            rebuilt from the event log or from snapshots.
+        lock(*account_ids), lock_all()
+            Context managers held by the AccountService, inside its own locks, around every operation on
+            the given accounts (or on all of them, for a reset). They let a repository shared with other
+            processes exclude them, or group the writes of one operation in a single transaction.
+        items()
+            Iterator over (account ID, balance) pairs, used to seed balance history and take snapshots.
+        scan(cursor, count)
+            Returns a page of (account ID, balance) pairs and the cursor of the next page, or None after the
+            last one; a None cursor starts from the first page. A page covers at most `count` accounts and
+            holds no lock once returned, so accounts can be listed a page at a time while they are changed.
+            Every account that exists for the whole scan is returned exactly once, in the same order on
+            every scan; accounts created or deleted in the meantime may or may not be. Cursors are opaque
+            strings, and a cursor the repository did not return raises InvalidCursor.
+        load(account_ids, balances)
+            Replaces every account at once, e.g. from a snapshot.
+        close()
+            Releases the resources of the repository when the application stops.
+    """
+
+    def reset(self) -> None:
+        ...
+
+    def get(self, account_id: str) -> Optional[Account]:
+        ...
+
+    def save(self, account: Account) -> None:
+        ...
+
+    def delete(self, account_id: str) -> None:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+
+# This function decodes the cursor of a repository that scans its accounts by position: the position of
+# the next account to return, starting from 0.
+def parse_position(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+
+    if not (cursor.isascii() and cursor.isdigit()):
+        raise InvalidCursor()
+
+    return int(cursor)
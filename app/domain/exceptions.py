@@ -8,4 +8,36 @@ class InsufficientFunds(Exception):
 
 class NegativeValue(Exception):
     """Raised when a negative value is provided for a transaction amount."""
-    pass
\ No newline at end of file
+    pass
+
+class InvalidAccountId(Exception):
+    """Raised when an account ID cannot be stored, e.g. because it exceeds the size supported by the repository."""
+    pass
+
+class BalanceOutOfRange(Exception):
+    """Raised when a balance exceeds the range the repository can store."""
+    pass
+
+class HistoryUnavailable(Exception):
+    """Raised when the balance of an account at a given time is no longer, or was never, recorded."""
+    pass
+
+class InvalidCursor(Exception):
+    """Raised when a cursor given to list accounts was not returned by a previous page."""
+    pass
+
+class AggregatesUnavailable(Exception):
+    """Raised when the total balance and the largest balances are not maintained for the accounts."""
+    pass
+
+class SubscriptionsUnavailable(Exception):
+    """Raised when balance changes cannot be pushed to subscribers, because no single process sees all of them."""
+    pass
+
+class AtomicBatchesUnavailable(Exception):
+    """Raised when a batch of operations cannot be applied all together or not at all."""
+    pass
+
+class RepositoryFull(Exception):
+    """Raised when the repository has no room left for a new account."""
+    pass
@@ -0,0 +1,9 @@
+# Entry point of the fast path: POST /event, GET /balance and POST /reset are served by a bare ASGI handler, and
+# every other request by the FastAPI app of app.main, which still serves the docs and the other endpoints.
+#
+#   uvicorn app.fast_main:app --host 0.0.0.0 --port 8000
+from app.api.fast_path import FastPathApp
+from app.api.routes import async_service
+from app.main import app as fastapi_app
+
+app = FastPathApp(fastapi_app, async_service)
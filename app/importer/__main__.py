@@ -0,0 +1,43 @@
+# This module imports balances in bulk from a file into the configured storage and prints the report as JSON.
+#
+#   python -m app.importer balances.csv
+#   ACCOUNT_REPOSITORY=sqlite python -m app.importer accounts.ndjson
+#   EVENT_LOG_PATH=/data/events.log python -m app.importer export.txt --format ndjson
+#
+# The storage is configured by the same environment variables as the API, and rows are applied like deposits
+# (see app.api.bulk_import), so the imported balances are found by the API on its next start. Run it while the
+# API is stopped, unless the repository is "shared_memory". To import into a running API, send the file to
+# POST /admin/import instead.
+import argparse
+import json
+import sys
+
+from app.api.bulk_import import FORMATS, detect_format, import_file
+from app.config import Settings
+from app.container import build_service, close_service
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m app.importer", description="Imports balances in bulk.")
+    parser.add_argument("file", help="CSV (account_id,amount) or NDJSON ({\"id\": ..., \"amount\": ...}) file")
+    parser.add_argument("--format", choices=FORMATS, help="format of the file, by default from its extension")
+    args = parser.parse_args(argv)
+
+    settings = Settings()
+    persistent = settings.event_log_path or settings.snapshot_path or settings.account_repository in ("sqlite", "shared_memory")
+    if not persistent:
+        parser.error("imported balances would be lost: set EVENT_LOG_PATH or SNAPSHOT_PATH, or use the sqlite or shared_memory repository")
+
+    service = build_service(settings)
+    try:
+        with open(args.file, "rb") as file:
+            report = import_file(service, file, args.format or detect_format(args.file))
+    finally:
+        close_service(service)
+
+    return report.as_dict()
+
+
+if __name__ == "__main__":
+    json.dump(main(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,245 @@
+import asyncio
+import fcntl
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+
+# Time a process sharing the log waits for another one to finish dropping a partial tail
+SHARED_LOCK_TIMEOUT = 5.0
+
+
+class EventLogError(Exception):
+    """Raised when the event log cannot be used, either because a write failed or because it is held by another process."""
+    pass
+
+
+# This class implements a durable, append-only log of the events applied by the AccountService.
+# Events are written as one JSON object per line. Each append is written to the file right away, so
+# the order of the file is the order in which events were appended, even when several processes share
+# it. Only the fsync is deferred: a background thread syncs the file once per commit window, so every
+# event appended within the window shares a single fsync and durability is amortized across requests.
+#
+# The file is locked while it is open. An exclusive log (the default) can only be opened by one
+# process, since two processes with separate ledgers appending to it would make it impossible to replay.
+# A shared log can be opened by every process that applies events to one shared ledger.
+class EventLog:
+    def __init__(self, path: str, commit_window: float = 0.002, fsync: bool = True, shared: bool = False):
+        self.path = path
+        self._commit_window = commit_window
+        self._fsync = fsync
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        # The partial tail left by a crash is only dropped by a process that has the file to itself:
+        # with a shared log, other processes may be appending to it at the same time. A worker sharing the log
+        # may find it held exclusively by another one that is dropping the tail: it waits for that to end.
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._truncate_partial_tail(path)
+            if shared:
+                fcntl.flock(self._fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not (shared and self._lock_shared(self._fd)):
+                os.close(self._fd)
+                raise EventLogError(f"Event log {path} is already in use by another process")
+
+        self._lock = threading.Lock()
+        self._appended_changed = threading.Condition(self._lock)
+        self._durable_changed = threading.Condition(self._lock)
+        self._appended = 0
+        self._durable = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._async_waiters: list = []
+        self._async_waiter_ids = itertools.count()
+
+        self._syncer = threading.Thread(target=self._run, name="event-log-syncer", daemon=True)
+        self._syncer.start()
+
+    # This method raises if the log can no longer accept events. Callers check it before applying an
+    # event, so that no change is made to the accounts once it is known that it could not be persisted.
+    def check(self) -> None:
+        if self._error is not None:
+            raise EventLogError("Event log write failed") from self._error
+
+        if self._closed:
+            raise EventLogError("Event log is closed")
+
+    # This method writes events to the log, to be made durable by the next group commit. Several events
+    # are written with a single write, so they are either all in the file or none of them is.
+    # It returns a sequence number that can be passed to wait() to block until the events are durable.
+    def append(self, *events: dict) -> int:
+        line = b"".join(json.dumps(event, separators=(",", ":")).encode() + b"\n" for event in events)
+
+        with self._lock:
+            self.check()
+
+            try:
+                written = os.write(self._fd, line)
+                if written != len(line):
+                    raise OSError(f"Short write to event log: {written} of {len(line)} bytes")
+            except OSError as error:
+                self._error = error
+                self._durable_changed.notify_all()
+                self._release_async_waiters()
+                raise EventLogError("Event log write failed") from error
+
+            self._appended += 1
+            self._appended_changed.notify()
+            return self._appended
+
+    # This method blocks until the event with the given sequence number has been fsynced.
+    def wait(self, sequence: int) -> None:
+        with self._lock:
+            while self._durable < sequence and self._error is None:
+                self._durable_changed.wait()
+
+            if self._durable < sequence:
+                raise EventLogError("Event log write failed") from self._error
+
+    # This method waits until the event with the given sequence number has been fsynced, without blocking
+    # the event loop: the syncer thread resolves the returned future when the group commit completes.
+    async def wait_async(self, sequence: int) -> None:
+        with self._lock:
+            if self._durable >= sequence:
+                return
+
+            if self._error is not None:
+                raise EventLogError("Event log write failed") from self._error
+
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            heapq.heappush(self._async_waiters, (sequence, next(self._async_waiter_ids), loop, future))
+
+        await future
+
+    # This method returns the size of the file and the sequence number of the last appended event.
+    # Taken while every account lock is held, it is the position of a state no event is half applied to.
+    def position(self) -> tuple[int, int]:
+        with self._lock:
+            self.check()
+            return os.fstat(self._fd).st_size, self._appended
+
+    # This method appends an event and waits for it to be durable before returning.
+    def commit(self, event: dict) -> None:
+        self.wait(self.append(event))
+
+    # This method syncs every appended event and stops the background thread.
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._appended_changed.notify()
+
+        self._syncer.join()
+        os.close(self._fd)
+
+    # Takes a shared lock on the log, waiting up to SHARED_LOCK_TIMEOUT seconds for a process holding it
+    # exclusively, and returns whether it got it. A process that keeps an exclusive lock (one that does not
+    # share the log) is not waited for forever.
+    @staticmethod
+    def _lock_shared(fd: int) -> bool:
+        deadline = time.monotonic() + SHARED_LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    # A crash in the middle of a write can leave an incomplete last line. It is dropped before
+    # appending so that new events are never glued to a partial one.
+    @staticmethod
+    def _truncate_partial_tail(path: str) -> None:
+        with open(path, "r+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+
+            file.seek(size - 1)
+            if file.read(1) == b"\n":
+                return
+
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                file.seek(start)
+                newline = file.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    file.truncate(start + newline + 1)
+                    return
+                end = start
+
+            file.truncate(0)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while self._durable == self._appended and not self._closed and self._error is None:
+                    self._appended_changed.wait()
+
+                if self._error is not None or (self._durable == self._appended and self._closed):
+                    return
+
+            # Give concurrent requests a chance to join this group before paying for the fsync.
+            if self._commit_window > 0 and not self._closed:
+                time.sleep(self._commit_window)
+
+            with self._lock:
+                sequence = self._appended
+
+            try:
+                if self._fsync:
+                    os.fsync(self._fd)
+            except OSError as error:
+                with self._lock:
+                    self._error = error
+                    self._durable_changed.notify_all()
+                    self._release_async_waiters()
+                return
+
+            with self._lock:
+                self._durable = sequence
+                self._durable_changed.notify_all()
+                self._release_async_waiters()
+
+    # Resolves the futures of wait_async() calls whose events are now durable, or fails all of them
+    # after an error. Must be called while holding the lock.
+    def _release_async_waiters(self) -> None:
+        while self._async_waiters and (self._error is not None or self._async_waiters[0][0] <= self._durable):
+            _, _, loop, future = heapq.heappop(self._async_waiters)
+            loop.call_soon_threadsafe(self._resolve, future, self._error)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[BaseException]) -> None:
+        if future.done():
+            return
+
+        if error is None:
+            future.set_result(None)
+        else:
+            failure = EventLogError("Event log write failed")
+            failure.__cause__ = error
+            future.set_exception(failure)
+
+    # This function reads the events stored in a log file, in the order they were written, starting at
+    # `offset` (a position returned by position()). A truncated last line (left by a crash in the middle
+    # of a write) is ignored.
+    @staticmethod
+    def read(path: str, offset: int = 0) -> Iterator[dict]:
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    return
+                yield json.loads(line)
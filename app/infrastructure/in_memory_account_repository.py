@@ -1,16 +1,28 @@
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Sequence
 from app.domain.account import Account
+from app.domain.account_repository import parse_position
+from app.utils.reclaimer import reclaimer
 
 # This class implements an in-memory repository for managing Account objects.
 # It provides methods to reset the repository, retrieve an account by its ID, and save an account to the repository.
 # The accounts are stored in a dictionary, where the keys are account IDs and the values are Account instances.
+# The IDs are also appended to a list in creation order, which gives every account a fixed position for scan()
+# cursors; a deleted account leaves a None in its place.
 class InMemoryAccountRepository:
+    # Operations never wait on I/O or other processes, so they can run directly on the event loop.
+    blocking = False
+
     def __init__(self):
         self._accounts: dict[str, Account] = {}
+        self._order: list[Optional[str]] = []
 
     # This method clears all accounts from the repository, effectively resetting its state.
+    # The accounts are swapped for an empty generation at once and the old one is freed in the background,
+    # so a reset takes the same time with millions of accounts as with none.
     def reset(self) -> None:
-        self._accounts.clear()
+        accounts, self._accounts = self._accounts, {}
+        order, self._order = self._order, []
+        reclaimer.release(accounts, order)
 
     # This method retrieves an account from the repository based on the provided account ID.
     def get(self, account_id: str) -> Optional[Account]:
@@ -18,6 +30,49 @@ class InMemoryAccountRepository:
 
     # This method saves an account to the repository. If an account with the same ID already exists, it will be overwritten.
     def save(self, account: Account) -> None:
-        self._accounts[account.account_id] = account
+        accounts = self._accounts
+        if account.account_id not in accounts:
+            self._order.append(account.account_id)
+        accounts[account.account_id] = account
+
+    # This method removes an account from the repository, if it exists.
+    # Accounts are only deleted when the batch that created them is rolled back, so the search for its
+    # position starts from the most recently created accounts.
+    def delete(self, account_id: str) -> None:
+        if self._accounts.pop(account_id, None) is None:
+            return
+
+        order = self._order
+        for position in range(len(order) - 1, -1, -1):
+            if order[position] == account_id:
+                order[position] = None
+                return
+
+    # This method replaces every account with the given ones, e.g. from a snapshot, in a single pass.
+    def load(self, account_ids: Sequence[str], balances: Iterable[int]) -> None:
+        self._accounts = dict(zip(account_ids, map(Account, account_ids, balances)))
+        self._order = list(self._accounts)
+
+    # This method yields the ID and balance of every account.
+    def items(self) -> Iterator[tuple[str, int]]:
+        for account in list(self._accounts.values()):
+            yield account.account_id, account.balance
+
+    # This method returns the accounts in the next `count` positions after the cursor (None to start from the
+    # first one) and the cursor of the positions after them, or None once every position was scanned.
+    def scan(self, cursor: Optional[str], count: int) -> tuple[list[tuple[str, int]], Optional[str]]:
+        position = parse_position(cursor)
+        accounts = self._accounts
+        order = self._order
+
+        page = []
+        for account_id in order[position:position + count]:
+            account = accounts.get(account_id) if account_id is not None else None
+            if account is not None:
+                page.append((account_id, account.balance))
 
+        position += count
+        return page, str(position) if position < len(order) else None
 
+    def __len__(self) -> int:
+        return len(self._accounts)
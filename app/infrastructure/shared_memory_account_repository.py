@@ -0,0 +1,265 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from app.domain.account import Account
+from app.domain.account_repository import parse_position
+from app.domain.exceptions import BalanceOutOfRange, InvalidAccountId, RepositoryFull
+
+
+class SharedMemoryFull(RepositoryFull):
+    """Raised when the shared memory region has no free slot left for a new account."""
+    pass
+
+
+# Header: magic, capacity, key size, number of accounts, initialized flag.
+_HEADER = struct.Struct("<8sqqqq")
+_MAGIC = b"EBXSHM02"
+_COUNT_OFFSET = 24
+_INITIALIZED_OFFSET = 32
+
+# Slot: state, key length, balance, key bytes (appended after the fixed part).
+_SLOT = struct.Struct("<BB6xq")
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+# Range of the balances a slot can hold, as a signed 64-bit integer
+_BALANCE_MIN = -(1 << 63)
+_BALANCE_MAX = (1 << 63) - 1
+
+
+# This class implements an account repository stored in a memory-mapped file, so that every
+# uvicorn worker process attached to the same file reads and writes one shared ledger.
+# Accounts live in fixed-width slots of an open-addressing hash table keyed by the account ID.
+# Cross-process locking uses byte-range locks on a companion lock file, combined with thread
+# locks because fcntl locks are owned by the process and do not exclude threads of the same worker.
+class SharedMemoryAccountRepository:
+    # Operations may wait on locks held by other processes, so async callers run them on the threadpool.
+    blocking = True
+
+    def __init__(self, path: str, capacity: int = 262144, key_size: int = 64, lock_stripes: int = 1024):
+        self._capacity = capacity
+        self._key_size = key_size
+        self._slot_size = _SLOT.size + key_size
+        self._lock_stripes = lock_stripes
+        # Byte N of the lock file guards account stripe N; the byte after the last stripe guards the
+        # hash index. It sorts last, so it can be taken while account stripes are held without deadlock.
+        # The next byte serializes the initialization of the region by the first worker that attaches.
+        self._index_lock = lock_stripes
+        self._initialization_lock = lock_stripes + 1
+        self._thread_locks = [threading.Lock() for _ in range(lock_stripes + 2)]
+        self._local = threading.local()
+        self._lock_file = open(path + ".lock", "a+b")
+
+        with self._locked_stripes([self._index_lock]):
+            self._file = open(path, "a+b")
+            size = _HEADER.size + capacity * self._slot_size
+            existing = os.fstat(self._file.fileno()).st_size
+
+            if existing == 0:
+                self._file.truncate(size)
+                self._map = mmap.mmap(self._file.fileno(), size)
+                _HEADER.pack_into(self._map, 0, _MAGIC, capacity, key_size, 0, 0)
+            else:
+                self._map = mmap.mmap(self._file.fileno(), existing)
+                magic, stored_capacity, stored_key_size, _, _ = _HEADER.unpack_from(self._map, 0)
+                if (magic, stored_capacity, stored_key_size) != (_MAGIC, capacity, key_size):
+                    raise ValueError(f"Shared memory file {path} has an incompatible layout")
+
+    # This method runs `populate` if no process attached to the region has initialized it yet, e.g. to
+    # rebuild it from the event log. Workers starting together wait for the first one to finish, and
+    # workers restarted later find the region already populated.
+    def initialize(self, populate: Callable[[], None]) -> None:
+        with self._locked_stripes([self._initialization_lock]):
+            if struct.unpack_from("<q", self._map, _INITIALIZED_OFFSET)[0]:
+                return
+
+            populate()
+            struct.pack_into("<q", self._map, _INITIALIZED_OFFSET, 1)
+
+    # This method clears all accounts from the repository, effectively resetting its state.
+    # It excludes every other operation on the region, unless the caller already holds lock_all().
+    def reset(self) -> None:
+        if getattr(self._local, "holding_all", False):
+            with self._locked_stripes([self._index_lock]):
+                self._clear()
+        else:
+            with self._locked_stripes(range(self._lock_stripes + 1)):
+                self._clear()
+
+    # This method retrieves an account from the repository based on the provided account ID.
+    # The returned Account is a copy: changes must be written back with save().
+    def get(self, account_id: str) -> Optional[Account]:
+        if not isinstance(account_id, str):
+            return None
+
+        offset = self._find(account_id.encode())
+        if offset is None:
+            return None
+
+        _, _, balance = _SLOT.unpack_from(self._map, offset)
+        return Account(account_id, balance)
+
+    # This method saves an account to the repository. If an account with the same ID already exists, it will be overwritten.
+    # The balance is checked before a slot is claimed, so a rejected account leaves nothing behind.
+    def save(self, account: Account) -> None:
+        key = self._key(account.account_id)
+        if not _BALANCE_MIN <= account.balance <= _BALANCE_MAX:
+            raise BalanceOutOfRange()
+
+        offset = self._find(key)
+
+        if offset is None:
+            with self._locked_stripes([self._index_lock]):
+                offset = self._insert(key)
+
+        struct.pack_into("<q", self._map, offset + 8, account.balance)
+
+    # This method removes an account from the repository, if it exists.
+    # The slot is marked as deleted rather than emptied so that probe chains running through it stay intact.
+    def delete(self, account_id: str) -> None:
+        if not isinstance(account_id, str):
+            return
+
+        with self._locked_stripes([self._index_lock]):
+            offset = self._find(account_id.encode())
+            if offset is not None:
+                self._map[offset] = _DELETED
+                struct.pack_into("<q", self._map, _COUNT_OFFSET, len(self) - 1)
+
+    # This method returns the accounts in the next `count` slots of the hash table after the cursor (None to
+    # start from the first slot) and the cursor of the slots after them, or None once every slot was scanned.
+    # The table never grows, so accounts keep their slot and cursors stay valid in every worker.
+    def scan(self, cursor: Optional[str], count: int) -> tuple[list[tuple[str, int]], Optional[str]]:
+        index = parse_position(cursor)
+        end = min(index + count, self._capacity)
+
+        page = []
+        for offset in range(_HEADER.size + index * self._slot_size, _HEADER.size + end * self._slot_size, self._slot_size):
+            state, length, balance = _SLOT.unpack_from(self._map, offset)
+            if state == _USED:
+                key_offset = offset + _SLOT.size
+                page.append((self._map[key_offset:key_offset + length].decode(), balance))
+
+        return page, str(end) if end < self._capacity else None
+
+    # This method yields the ID and balance of every account, scanning the hash table a page of slots at a time.
+    def items(self) -> Iterator[tuple[str, int]]:
+        cursor = None
+        while True:
+            page, cursor = self.scan(cursor, 4096)
+            yield from page
+            if cursor is None:
+                return
+
+    # This method holds the cross-process locks of the given accounts for the duration of a multi-step operation.
+    # Stripes are always acquired in ascending order so concurrent operations can never deadlock.
+    @contextmanager
+    def lock(self, *account_ids: str) -> Iterator[None]:
+        stripes = sorted({self._stripe(account_id) for account_id in account_ids})
+        with self._locked_stripes(stripes):
+            yield
+
+    # This method holds the locks of every account, excluding all other operations on the region.
+    @contextmanager
+    def lock_all(self) -> Iterator[None]:
+        with self._locked_stripes(range(self._lock_stripes)):
+            self._local.holding_all = True
+            try:
+                yield
+            finally:
+                self._local.holding_all = False
+
+    def __len__(self) -> int:
+        return struct.unpack_from("<q", self._map, _COUNT_OFFSET)[0]
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+        self._lock_file.close()
+
+    def _stripe(self, account_id: str) -> int:
+        return zlib.crc32(str(account_id).encode()) % self._lock_stripes
+
+    # Encodes an account ID into the bytes stored in a slot, rejecting IDs the slots cannot hold.
+    def _key(self, account_id: str) -> bytes:
+        if not isinstance(account_id, str):
+            raise InvalidAccountId("Account ID must be a string")
+
+        key = account_id.encode()
+        if len(key) > self._key_size:
+            raise InvalidAccountId(f"Account IDs longer than {self._key_size} bytes are not supported")
+
+        return key
+
+    def _clear(self) -> None:
+        self._map[_HEADER.size:] = bytes(self._capacity * self._slot_size)
+        struct.pack_into("<q", self._map, _COUNT_OFFSET, 0)
+
+    @contextmanager
+    def _locked_stripes(self, stripes) -> Iterator[None]:
+        acquired = []
+        try:
+            for stripe in stripes:
+                self._thread_locks[stripe].acquire()
+                try:
+                    fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, stripe)
+                except BaseException:
+                    self._thread_locks[stripe].release()
+                    raise
+                acquired.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, stripe)
+                self._thread_locks[stripe].release()
+
+    # Probes the hash table for a key. The key bytes of a slot are written before its state is
+    # set to used, so lookups can run concurrently with inserts without taking the index lock.
+    def _find(self, key: bytes) -> Optional[int]:
+        if len(key) > self._key_size:
+            return None
+
+        index = zlib.crc32(key) % self._capacity
+        for _ in range(self._capacity):
+            offset = _HEADER.size + index * self._slot_size
+            state, length, _ = _SLOT.unpack_from(self._map, offset)
+
+            if state == _EMPTY:
+                return None
+
+            key_offset = offset + _SLOT.size
+            if state == _USED and length == len(key) and self._map[key_offset:key_offset + length] == key:
+                return offset
+
+            index = (index + 1) % self._capacity
+
+        return None
+
+    # Claims a slot for a new key. Must be called while holding the index lock.
+    def _insert(self, key: bytes) -> int:
+        existing = self._find(key)
+        if existing is not None:
+            return existing
+
+        index = zlib.crc32(key) % self._capacity
+        for _ in range(self._capacity):
+            offset = _HEADER.size + index * self._slot_size
+            if self._map[offset] != _USED:
+                key_offset = offset + _SLOT.size
+                self._map[key_offset:key_offset + len(key)] = key
+                self._map[offset + 1] = len(key)
+                struct.pack_into("<q", self._map, offset + 8, 0)
+                self._map[offset] = _USED
+                struct.pack_into("<q", self._map, _COUNT_OFFSET, len(self) + 1)
+                return offset
+
+            index = (index + 1) % self._capacity
+
+        raise SharedMemoryFull()
@@ -0,0 +1,150 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Optional, Sequence
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is not a complete snapshot written by this version."""
+    pass
+
+
+class UnsupportedAccounts(ValueError):
+    """Raised when accounts cannot be written in a snapshot: the account without ID, or balances beyond 64 bits."""
+
+    def __init__(self, account_ids: list):
+        super().__init__(f"{len(account_ids)} accounts cannot be written in a snapshot, e.g. {account_ids[:5]}")
+        self.account_ids = account_ids
+
+
+# Header: magic, number of accounts, log offset, size of the account ID block, flags, CRC-32 of everything after the header.
+_HEADER = struct.Struct("<8sqqqII")
+_MAGIC = b"EBXSNP01"
+
+# The account IDs are separated by newlines and there is no block of lengths
+_SEPARATED = 1
+
+# Range of the balances a snapshot holds
+BALANCE_MIN = -(2 ** 63)
+BALANCE_MAX = 2 ** 63 - 1
+
+
+# The state of every account at one point of the event log, as loaded from a snapshot file.
+class Snapshot:
+    """
+        Balances of every account at a given position of the event log.
+
+        Attributes:
+        ----------
+        account_ids : list[str]
+            The ID of every account.
+        balances : array
+            The balance of every account, in the order of `account_ids`, as 64-bit integers.
+        log_offset : int
+            Size of the event log when the snapshot was taken: the events after this offset are not
+            part of it. -1 when no event log was configured.
+    """
+
+    def __init__(self, account_ids: list[str], balances: array, log_offset: int):
+        self.account_ids = account_ids
+        self.balances = balances
+        self.log_offset = log_offset
+
+
+# This function writes a snapshot file. The layout is a fixed header followed by three blocks that are loaded
+# with one copy each: the balances as little-endian 64-bit integers, the length in characters of every account
+# ID as 32-bit integers, and the account IDs concatenated in UTF-8. When no ID contains a newline, which is the
+# usual case, the IDs are joined with newlines instead and the lengths are left out, so loading them is a
+# single split. The file is written next to its destination, fsynced and renamed over it, so a crash leaves
+# either the previous snapshot or the new one. The account without ID has no place in the file:
+# UnsupportedAccounts is raised for it.
+def write_snapshot(path: str, account_ids: Sequence[str], balances: array, log_offset: int) -> None:
+    if None in account_ids:
+        raise UnsupportedAccounts([None])
+
+    text = "".join(account_ids)
+    if "\n" not in text:
+        flags, lengths, text = _SEPARATED, array("I"), "\n".join(account_ids)
+    else:
+        flags, lengths = 0, array("I", map(len, account_ids))
+    blob = text.encode()
+
+    if sys.byteorder == "big":
+        balances, lengths = array("q", balances), array("I", lengths)
+        balances.byteswap()
+        lengths.byteswap()
+
+    checksum = zlib.crc32(blob, zlib.crc32(lengths, zlib.crc32(balances)))
+    temporary = path + ".tmp"
+
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(account_ids), log_offset, len(blob), flags, checksum))
+        file.write(balances)
+        file.write(lengths)
+        file.write(blob)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary, path)
+
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+# This function loads a snapshot file by memory-mapping it and copying each block at once, without parsing
+# accounts one by one. It returns None when there is no snapshot and raises SnapshotError when the file is
+# truncated or corrupted.
+def read_snapshot(path: str) -> Optional[Snapshot]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if len(view) < _HEADER.size:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+
+        magic, count, log_offset, blob_size, flags, checksum = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC:
+            raise SnapshotError(f"Snapshot {path} has an unknown format")
+
+        lengths_start = _HEADER.size + count * 8
+        blob_start = lengths_start + (0 if flags & _SEPARATED else count * 4)
+        if len(view) != blob_start + blob_size:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+
+        with memoryview(view) as buffer:
+            body = buffer[_HEADER.size:]
+            try:
+                if zlib.crc32(body) != checksum:
+                    raise SnapshotError(f"Snapshot {path} is corrupted")
+            finally:
+                body.release()
+
+            balances = array("q")
+            balances.frombytes(buffer[_HEADER.size:lengths_start])
+            lengths = array("I")
+            lengths.frombytes(buffer[lengths_start:blob_start])
+            text = str(buffer[blob_start:], "utf-8")
+
+    if sys.byteorder == "big":
+        balances.byteswap()
+        lengths.byteswap()
+
+    if flags & _SEPARATED:
+        account_ids = text.split("\n") if count else []
+        if len(account_ids) != count:
+            raise SnapshotError(f"Snapshot {path} is corrupted")
+        return Snapshot(account_ids, balances, log_offset)
+
+    # The IDs are sliced out of the decoded text, with the loops running in C.
+    ends = list(accumulate(lengths))
+    starts = [0] + ends[:-1]
+    account_ids = list(map(text.__getitem__, map(slice, starts, ends)))
+
+    return Snapshot(account_ids, balances, log_offset)
@@ -0,0 +1,284 @@
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Sequence
+
+from app.domain.account import Account
+from app.domain.exceptions import BalanceOutOfRange, InvalidAccountId
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS accounts (id TEXT PRIMARY KEY, balance INTEGER NOT NULL) WITHOUT ROWID"
+_SELECT = "SELECT balance FROM accounts WHERE id = ?"
+_UPSERT = "INSERT INTO accounts (id, balance) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET balance = excluded.balance"
+_DELETE = "DELETE FROM accounts WHERE id = ?"
+_FIRST_PAGE = "SELECT id, balance FROM accounts ORDER BY id LIMIT ?"
+_NEXT_PAGE = "SELECT id, balance FROM accounts WHERE id > ? ORDER BY id LIMIT ?"
+
+# Number of accounts read per query by items()
+PAGE_SIZE = 1000
+
+# Most operations committed together when threads queue up for the database
+GROUP_COMMIT_SIZE = 64
+
+
+# This class implements an account repository persisted in a SQLite database.
+# The database runs in WAL mode, so readers never wait for the writer. Writes go through a single writer
+# connection; reads outside of an operation use a connection of the calling thread, opened on first use and
+# reused afterwards, so they only ever see committed balances. The statements are the same on every call, so
+# each connection compiles them once and keeps them in its statement cache. A thread's connection is closed
+# when the thread exits, so the threadpool retiring and starting workers does not pile up open connections.
+#
+# The AccountService holds lock() around every operation, and here that is a transaction on the writer
+# connection: the reads and the saves of a deposit, a transfer or a whole atomic batch are applied together,
+# and the write lock of the database is taken up front, so the operation is also serialized with the workers
+# of other processes sharing the file. Operations are committed in groups: an operation that ends while other
+# threads wait for the writer leaves the transaction open for them, in a savepoint each so that a failed one
+# is undone alone, and the last of them (or the GROUP_COMMIT_SIZE-th) commits the group. Each operation
+# returns once its group is committed, so a thread running alone commits every operation, and concurrent
+# ones share the cost of a commit. Saves outside of lock() are single operations, and load() writes every
+# account with one batched statement in a single transaction.
+class SqliteAccountRepository:
+    # Operations wait on the disk and on the database lock, so async callers run them on the threadpool.
+    blocking = True
+    # The database is the durable state: it is not rebuilt from the event log or from snapshots.
+    persistent = True
+
+    def __init__(self, path: str, synchronous: str = "NORMAL", busy_timeout: float = 5.0):
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unknown SQLite synchronous mode: {synchronous}")
+
+        self._path = path
+        self._synchronous = synchronous
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: set[sqlite3.Connection] = set()
+        self._registration = threading.Lock()
+
+        self._writer = self._open()
+        # Held by the thread running an operation on the writer connection
+        self._writing = threading.Lock()
+        # Guards the number of threads waiting for the writer, and signals committed groups
+        self._state = threading.Condition()
+        self._queued = 0
+        # Operations applied in the open transaction, and the group they are committed with
+        self._pending = 0
+        self._group = _Group()
+        # Transactions committed on the writer connection
+        self.commits = 0
+
+        with self._transaction() as connection:
+            connection.execute(_SCHEMA)
+
+    # This method clears all accounts from the repository, effectively resetting its state.
+    def reset(self) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM accounts")
+
+    # This method retrieves an account from the repository based on the provided account ID.
+    # The returned Account is a copy: changes must be written back with save().
+    def get(self, account_id: str) -> Optional[Account]:
+        row = self._connection().execute(_SELECT, (account_id,)).fetchone()
+        if row is None:
+            return None
+
+        return Account(account_id, row[0])
+
+    # This method saves an account to the repository. If an account with the same ID already exists, it will be overwritten.
+    # Inside lock(), the save joins the transaction of the operation; otherwise it is committed on its own.
+    def save(self, account: Account) -> None:
+        if not isinstance(account.account_id, str):
+            raise InvalidAccountId("Account ID must be a string")
+
+        if not getattr(self._local, "writing", False):
+            with self._transaction():
+                return self.save(account)
+
+        try:
+            self._writer.execute(_UPSERT, (account.account_id, account.balance))
+        except OverflowError:
+            raise BalanceOutOfRange()
+
+    # This method removes an account from the repository, if it exists.
+    def delete(self, account_id: str) -> None:
+        with self._transaction() as connection:
+            connection.execute(_DELETE, (account_id,))
+
+    # This method replaces every account with the given ones in a single transaction.
+    def load(self, account_ids: Sequence[str], balances: Iterable[int]) -> None:
+        if not all(isinstance(account_id, str) for account_id in account_ids):
+            raise InvalidAccountId("Account ID must be a string")
+
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM accounts")
+            try:
+                connection.executemany(_UPSERT, zip(account_ids, balances))
+            except OverflowError:
+                raise BalanceOutOfRange()
+
+    # This method yields the ID and balance of every account, in ID order. Accounts are read a page at a
+    # time, each page in its own short read, so that no read transaction stays open while the caller iterates.
+    def items(self) -> Iterator[tuple[str, int]]:
+        page, cursor = self.scan(None, PAGE_SIZE)
+        while True:
+            yield from page
+            if cursor is None:
+                return
+            page, cursor = self.scan(cursor, PAGE_SIZE)
+
+    # This method returns the next `count` accounts in ID order after the cursor (None to start from the first
+    # one) and the cursor of the accounts after them, or None after the last one. The cursor is the ID of the
+    # last account returned, so it stays valid across restarts and in every worker.
+    def scan(self, cursor: Optional[str], count: int) -> tuple[list[tuple[str, int]], Optional[str]]:
+        if cursor is None:
+            page = self._connection().execute(_FIRST_PAGE, (count,)).fetchall()
+        else:
+            page = self._connection().execute(_NEXT_PAGE, (cursor, count)).fetchall()
+
+        return page, page[-1][0] if len(page) == count else None
+
+    # This method groups every read and save of an operation on the given accounts in one transaction.
+    @contextmanager
+    def lock(self, *account_ids: str) -> Iterator[None]:
+        with self._transaction():
+            yield
+
+    # This method groups the operations of the block, such as a reset, in one transaction.
+    @contextmanager
+    def lock_all(self) -> Iterator[None]:
+        with self._transaction():
+            yield
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM accounts").fetchone()[0]
+
+    def close(self) -> None:
+        with self._registration:
+            connections = list(self._connections)
+            self._connections.clear()
+
+        for connection in connections:
+            connection.close()
+        self._writer.close()
+
+    # Returns the connection reads go through: the writer inside an operation, so that it sees its own saves,
+    # and otherwise the connection of the calling thread, opened on first use.
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, "writing", False):
+            return self._writer
+
+        holder = getattr(self._local, "holder", None)
+        if holder is not None:
+            return holder.connection
+
+        connection = self._open()
+        with self._registration:
+            self._connections.add(connection)
+        # The holder is only referenced by the thread's local storage, which is released when the thread exits.
+        holder = self._local.holder = _ConnectionHolder(connection)
+        weakref.finalize(holder, _release, connection, self._connections, self._registration)
+        return connection
+
+    def _open(self) -> sqlite3.Connection:
+        # Transactions are started and committed explicitly, so the connection runs in autocommit mode.
+        connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(f"PRAGMA synchronous = {self._synchronous}")
+        return connection
+
+    # Runs the block as one operation on the writer connection, and returns once it is committed. Nested
+    # blocks are part of the operation that is already running; it is undone if the outermost block raises.
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        if getattr(self._local, "writing", False):
+            yield self._writer
+            return
+
+        with self._state:
+            self._queued += 1
+        self._writing.acquire()
+        with self._state:
+            self._queued -= 1
+
+        self._local.writing = True
+        connection = self._writer
+        group = committed = None
+        try:
+            # Operations of a group that is not committed yet each get a savepoint, to be undone alone.
+            joined = connection.in_transaction
+            connection.execute("SAVEPOINT operation" if joined else "BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                if joined:
+                    connection.execute("ROLLBACK TO operation")
+                    connection.execute("RELEASE operation")
+                else:
+                    connection.rollback()
+                raise
+
+            if joined:
+                connection.execute("RELEASE operation")
+            group = self._group
+            self._pending += 1
+        finally:
+            try:
+                if connection.in_transaction:
+                    with self._state:
+                        last = self._pending >= GROUP_COMMIT_SIZE or not self._queued
+                    if last:
+                        committed = self._commit()
+            finally:
+                self._local.writing = False
+                self._writing.release()
+
+        if group is not None:
+            if group is not committed:
+                with self._state:
+                    while not group.committed:
+                        self._state.wait()
+            if group.error is not None:
+                raise group.error
+
+    # Commits the open transaction and wakes up the operations of its group. Called with the writer held.
+    def _commit(self) -> "_Group":
+        group, error = self._group, None
+        try:
+            self._writer.commit()
+        except Exception as failure:
+            self._writer.rollback()
+            error = failure
+
+        self._pending = 0
+        self._group = _Group()
+        self.commits += 1
+        with self._state:
+            group.error = error
+            group.committed = True
+            self._state.notify_all()
+        return group
+
+
+# The operations committed by the same transaction of the writer connection.
+class _Group:
+    __slots__ = ("committed", "error")
+
+    def __init__(self):
+        self.committed = False
+        self.error: Optional[BaseException] = None
+
+
+# The connection of one thread, stored in the thread's local storage.
+class _ConnectionHolder:
+    __slots__ = ("connection", "__weakref__")
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+
+# Closes the connection of a thread that exited, unless close() already took it.
+def _release(connection: sqlite3.Connection, connections: set, registration: threading.Lock) -> None:
+    with registration:
+        if connection not in connections:
+            return
+        connections.discard(connection)
+    connection.close()
@@ -1,5 +1,41 @@
-from fastapi import FastAPI
-from app.api.routes import router
+from contextlib import asynccontextmanager
 
-app = FastAPI()
-app.include_router(router)
\ No newline at end of file
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from app.api.profiling import ProfilingMiddleware
+from app.api.routes import router, service, settings
+from app.container import close_service
+from app.api.admission import Overloaded
+from app.infrastructure.event_log import EventLogError
+
+
+# Flushes pending event log writes when the server shuts down
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    close_service(service)
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(router)
+
+# Profiling is opt-in: without a token or a sampling rate the middleware is not installed at all.
+if settings.profile_token or settings.profile_sample_rate > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=settings.profile_token,
+        sample_rate=settings.profile_sample_rate,
+        directory=settings.profile_dir,
+    )
+
+
+# Events cannot be made durable anymore: refuse them instead of acknowledging changes that would be lost
+@app.exception_handler(EventLogError)
+async def event_log_error_handler(request: Request, error: EventLogError):
+    return PlainTextResponse(content="Event log unavailable", status_code=503)
+
+
+# Events refused to shed load: tell the client when to retry
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, error: Overloaded):
+    return PlainTextResponse(content=str(error), status_code=429, headers={"Retry-After": error.retry_after_header})
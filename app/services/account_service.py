@@ -1,19 +1,70 @@
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator, Optional, Sequence
+
 from app.domain.account import Account
-from app.domain.exceptions import AccountNotFound, InsufficientFunds
+from app.domain.account_repository import AccountRepository
+from app.domain.exceptions import (
+    AccountNotFound,
+    AggregatesUnavailable,
+    BalanceOutOfRange,
+    HistoryUnavailable,
+    InsufficientFunds,
+    InvalidAccountId,
+    NegativeValue,
+    RepositoryFull,
+    SubscriptionsUnavailable,
+)
+from app.infrastructure.event_log import EventLog, EventLogError
+from app.utils.striped_lock import StripedLock
 
 # This class defines the AccountService, which provides methods to manage bank accounts.
+# Every operation holds the striped locks of the accounts it touches, so concurrent requests on the
+# same account are serialized while requests on unrelated accounts run in parallel.
+#
+# Observers are notified of every applied change while the locks of the changed accounts are still held,
+# so they see the changes of each account in order. An observer implements balances_changed(accounts),
+# called with the accounts changed by an operation, and reset().
 class AccountService:
 
-    def __init__(self, repository):
+    def __init__(self, repository: AccountRepository, event_log: Optional[EventLog] = None, locks: Optional[StripedLock] = None):
         self.repository = repository
+        self.event_log = event_log
+        self.locks = locks if locks is not None else StripedLock()
+        self.observers: list = []
+        # BalanceHistory answering point-in-time balance queries, when enabled
+        self.history = None
+        # BalanceView serving balance reads from the committed balances, when enabled
+        self.view = None
+        # EventPipeline applying the events of /event in micro-batches, when enabled
+        self.pipeline = None
+        # BalanceSubscriptions pushing balance changes to subscribers, when enabled
+        self.subscriptions = None
+        self._deferred = _DeferredState()
 
     # This method resets the state of the account repository by calling the reset method of the repository.
     def reset(self) -> None:
-        self.repository.reset()
+        repository_lock_all = getattr(self.repository, "lock_all", None)
+
+        with self.locks.acquire_all(blocking=self._blocking()), repository_lock_all() if repository_lock_all is not None else nullcontext():
+            # A reset cannot fail, so it is logged first and nothing has to be undone if the write fails.
+            sequence = self._record({"type": "reset"})
+            self.repository.reset()
+
+            self._notify("reset")
+
+        self._wait_durable(sequence)
 
     # This method retrieves the balance of a specific account based on the provided account ID.
     # If the account does not exist in the repository, it raises an AccountNotFound exception.
+    # With a balance view, the committed balance is read without any lock.
     def get_balance(self, account_id: str) -> int:
+        if self.view is not None:
+            balance = self.view.balance(account_id)
+            if balance is None:
+                raise AccountNotFound()
+            return balance
+
         account = self.repository.get(account_id)
 
         if account is None:
@@ -21,9 +72,240 @@ class AccountService:
 
         return account.balance
 
+    # This method retrieves the balances of several accounts as they were at a single point in time, so that
+    # no operation between them (such as a transfer) is seen half-applied. Missing accounts are left out.
+    # Without a balance view, the accounts are locked while they are read.
+    def get_balances(self, *account_ids: str) -> dict[str, int]:
+        if self.view is not None:
+            return self.view.balances(account_ids)
+
+        with self._locked(*account_ids):
+            accounts = [self.repository.get(account_id) for account_id in account_ids]
+
+        return {account.account_id: account.balance for account in accounts if account is not None}
+
+    # This method returns a page of at most `count` accounts, as (account ID, balance) pairs, and the cursor of
+    # the next page, or None after the last one (see AccountRepository.scan). No lock is held between pages,
+    # so listing every account does not hold up operations. With a balance view, committed balances are listed.
+    def scan(self, cursor: Optional[str] = None, count: int = 1000) -> tuple[list[tuple[str, int]], Optional[str]]:
+        page, cursor = self.repository.scan(cursor, count)
+
+        if self.view is None:
+            return page, cursor
+
+        committed = []
+        for account_id, _ in page:
+            balance = self.view.balance(account_id)
+            if balance is not None:
+                committed.append((account_id, balance))
+
+        return committed, cursor
+
+    # This method returns the total balance, the number of accounts and the `top` accounts with the largest
+    # balances, as (account ID, balance) pairs. They are maintained as balances change, so the answer takes
+    # the same time with millions of accounts as with none. It raises AggregatesUnavailable if they are not.
+    def get_aggregates(self, top: int = 10) -> tuple[int, int, list[tuple[str, int]]]:
+        if self.view is None or self.view.aggregates is None:
+            raise AggregatesUnavailable("Aggregates are not enabled")
+
+        return self.view.aggregates.read(top)
+
+    # This method registers a subscription to the balance changes of its accounts, starting with their current
+    # balances. The accounts are locked meanwhile, so every later change is delivered and no earlier one is.
+    # It raises SubscriptionsUnavailable if subscriptions are disabled.
+    def subscribe(self, subscription) -> None:
+        if self.subscriptions is None:
+            raise SubscriptionsUnavailable("Balance subscriptions are not enabled")
+
+        with self._locked(*subscription.account_ids):
+            balances = {}
+            for account_id in subscription.account_ids:
+                if self.view is not None:
+                    balance = self.view.balance(account_id)
+                else:
+                    account = self.repository.get(account_id)
+                    balance = None if account is None else account.balance
+                if balance is not None:
+                    balances[account_id] = balance
+
+            self.subscriptions.add(subscription, balances)
+
+    # This method stops delivering balance changes to a subscription.
+    def unsubscribe(self, subscription) -> None:
+        if self.subscriptions is not None:
+            self.subscriptions.remove(subscription)
+
+    # This method retrieves the balance a specific account had at the given time, in seconds since the epoch.
+    # It raises AccountNotFound if the account did not exist at that time, and HistoryUnavailable if
+    # balance history is disabled or does not go back that far.
+    def get_balance_at(self, account_id: str, timestamp: float) -> int:
+        if self.history is None:
+            raise HistoryUnavailable("Balance history is not enabled")
+
+        return self.history.balance_at(account_id, timestamp)
+
     # This method handles the deposit operation for a specific account.
     # It takes the destination account ID and the amount to be deposited as parameters.
     def deposit(self, destination_id: str, amount: int) -> Account:
+        with self._locked(destination_id):
+            snapshot = self._snapshot_for_log(destination_id)
+            account = self._deposit(destination_id, amount)
+            sequence = self._record([{"type": "deposit", "destination": destination_id, "amount": amount}], snapshot)
+            self._changed(account)
+
+        self._wait_durable(sequence)
+        return account
+
+    # This method applies many independent deposits at once, e.g. for a bulk import: the locks of their accounts
+    # are taken once, their events are logged together and observers are notified once. A deposit the repository
+    # rejects (an ID it cannot store, a balance out of its range) does not stop the others; the position and the
+    # exception of each rejected deposit are returned. Any other error undoes the deposits already applied, as
+    # in atomic(), so the repository never holds changes its observers and the log were not told about.
+    def deposit_many(self, deposits: Sequence[tuple[str, int]]) -> list[tuple[int, Exception]]:
+        account_ids = [account_id for account_id, _ in deposits]
+        rejected = []
+
+        with self._locked(*account_ids):
+            self._check_log()
+            snapshot = self._snapshot(*account_ids)
+            events = []
+            changed = {}
+
+            try:
+                for index, (account_id, amount) in enumerate(deposits):
+                    try:
+                        changed[account_id] = self._deposit(account_id, amount)
+                    except (NegativeValue, BalanceOutOfRange, InvalidAccountId, RepositoryFull) as error:
+                        rejected.append((index, error))
+                        continue
+                    events.append({"type": "deposit", "destination": account_id, "amount": amount})
+            except BaseException:
+                self._restore(snapshot)
+                raise
+
+            sequence = self._record(events, snapshot) if events else None
+            if changed:
+                self._changed(*changed.values())
+
+        self._wait_durable(sequence)
+        return rejected
+
+    # This method handles the withdrawal operation for a specific account.
+    # It takes the origin account ID and the amount to be withdrawn as parameters.
+    def withdraw (self, origin_id: str, amount: int) -> Account:
+        with self._locked(origin_id):
+            snapshot = self._snapshot_for_log(origin_id)
+            account = self._withdraw(origin_id, amount)
+            sequence = self._record([{"type": "withdraw", "origin": origin_id, "amount": amount}], snapshot)
+            self._changed(account)
+
+        self._wait_durable(sequence)
+        return account
+
+    # This method handles the transfer operation between two accounts.
+    # It takes the origin account ID, destination account ID, and the amount to be transferred
+    # as parameters. It checks if the origin account exists and has sufficient funds before performing the transfer.
+    # If the destination account does not exist, it creates a new account with a balance of 0 before performing the transfer.
+    def transfer(self, origin_id: str, destination_id: str, amount: int):
+        with self._locked(origin_id, destination_id):
+            snapshot = self._snapshot_for_log(origin_id, destination_id)
+            origin, destination = self._transfer(origin_id, destination_id, amount)
+            sequence = self._record([{
+                "type": "transfer",
+                "origin": origin_id,
+                "destination": destination_id,
+                "amount": amount,
+            }], snapshot)
+            self._changed(origin, destination)
+
+        self._wait_durable(sequence)
+        return origin, destination
+
+    # This method applies several operations on the given accounts as a single all-or-nothing unit.
+    # The locks of every account are held for the whole block and the yielded batch exposes deposit,
+    # withdraw and transfer. If the block raises, every account is restored to its previous balance
+    # (accounts created by the batch are removed) and nothing is written to the event log.
+    @contextmanager
+    def atomic(self, *account_ids: str) -> Iterator["AtomicBatch"]:
+        with self._locked(*account_ids):
+            self._check_log()
+            snapshot = self._snapshot(*account_ids)
+
+            batch = AtomicBatch(self)
+            try:
+                yield batch
+            except BaseException:
+                self._restore(snapshot)
+                raise
+
+            sequence = self._record(batch.events, snapshot) if batch.events else None
+            if batch.events and self.observers:
+                self._changed(*filter(None, map(self.repository.get, snapshot)))
+
+        self._wait_durable(sequence)
+
+    # This method lets the calling thread issue many operations and wait for their durability only once.
+    # Operations inside the block return as soon as they are applied; the block exits once every event
+    # it recorded is durable, so callers must not acknowledge any of them before leaving it.
+    @contextmanager
+    def deferred_durability(self) -> Iterator[None]:
+        if self._deferred.active:
+            yield
+            return
+
+        self._deferred.active = True
+        self._deferred.sequence = None
+        try:
+            yield
+        finally:
+            self._deferred.active = False
+
+        self._wait_durable(self._deferred.sequence)
+
+    # This method runs an operation (a method of this service, or a function taking it) without waiting
+    # for its events to be durable. It returns the result and the log sequence number the caller must
+    # wait for before acknowledging it (None when nothing was logged).
+    # When `blocking` is false, the operation raises LockUnavailable instead of waiting for a lock held
+    # by another thread; it does so before changing anything, so it can be retried on another thread.
+    def run_deferred(self, operation, *args, blocking: bool = True, **kwargs):
+        if self._deferred.active:
+            raise RuntimeError("run_deferred cannot be nested in another deferred operation")
+
+        self._deferred.active = True
+        self._deferred.sequence = None
+        self._deferred.blocking = blocking
+        try:
+            result = operation(*args, **kwargs)
+            return result, self._deferred.sequence
+        finally:
+            self._deferred.active = False
+            self._deferred.blocking = True
+
+    # This method rebuilds the repository state by applying previously logged events, in order.
+    # Events are not written back to the log while they are being replayed.
+    def replay(self, events: Iterable[dict]) -> int:
+        event_log, self.event_log = self.event_log, None
+        applied = 0
+
+        try:
+            for event in events:
+                if event["type"] == "reset":
+                    self.reset()
+                elif event["type"] == "deposit":
+                    self.deposit(event["destination"], event["amount"])
+                elif event["type"] == "withdraw":
+                    self.withdraw(event["origin"], event["amount"])
+                elif event["type"] == "transfer":
+                    self.transfer(event["origin"], event["destination"], event["amount"])
+                else:
+                    raise ValueError(f"Unknown event type in log: {event['type']}")
+                applied += 1
+        finally:
+            self.event_log = event_log
+
+        return applied
+
+    def _deposit(self, destination_id: str, amount: int) -> Account:
         account = self.repository.get(destination_id)
 
         if not account:
@@ -34,9 +316,7 @@ class AccountService:
 
         return account
 
-    # This method handles the withdrawal operation for a specific account.
-    # It takes the origin account ID and the amount to be withdrawn as parameters.
-    def withdraw (self, origin_id: str, amount: int) -> Account:
+    def _withdraw(self, origin_id: str, amount: int) -> Account:
         account = self.repository.get(origin_id)
 
         if not account:
@@ -50,11 +330,7 @@ class AccountService:
 
         return account
 
-    # This method handles the transfer operation between two accounts.
-    # It takes the origin account ID, destination account ID, and the amount to be transferred
-    # as parameters. It checks if the origin account exists and has sufficient funds before performing the transfer.
-    # If the destination account does not exist, it creates a new account with a balance of 0 before performing the transfer.
-    def transfer(self, origin_id: str, destination_id: str, amount: int):
+    def _transfer(self, origin_id: str, destination_id: str, amount: int):
         origin = self.repository.get(origin_id)
 
         if not origin:
@@ -63,14 +339,175 @@ class AccountService:
         if origin.balance < amount:
             raise InsufficientFunds()
 
-        destination = self.repository.get(destination_id)
+        # Repositories may return copies, so a transfer to the same account must reuse the origin object
+        # or saving the destination would overwrite the withdrawal.
+        destination = origin if destination_id == origin_id else self.repository.get(destination_id)
         if not destination:
             destination = Account(destination_id, 0)
 
         origin.withdraw(amount)
         destination.deposit(amount)
 
-        self.repository.save(origin)
+        # The destination is saved first: a repository with bounded balances rejects it before the
+        # origin has been debited.
         self.repository.save(destination)
+        self.repository.save(origin)
 
         return origin, destination
+
+    # This method holds the locks of the given accounts so that a read-check-save sequence is applied atomically.
+    # The striped locks serialize the threads of this process; when the repository is shared with other
+    # processes and provides its own locks, those are held as well.
+    # It returns plain context managers rather than being a generator, since every operation goes through it.
+    def _locked(self, *account_ids: str):
+        locks = self.locks.acquire(*account_ids, blocking=self._blocking())
+        repository_lock = getattr(self.repository, "lock", None)
+        if repository_lock is None:
+            return locks
+
+        return _LockedWithRepository(locks, repository_lock(*account_ids))
+
+    def _blocking(self) -> bool:
+        return self._deferred.blocking
+
+    # This method fails before an operation is applied if the log can no longer persist it. Once a log
+    # write has failed, every further operation is refused instead of changing balances that would be lost.
+    def _check_log(self) -> None:
+        if self.event_log is not None:
+            self.event_log.check()
+
+    # This method captures the balances of the given accounts (None for missing ones) so they can be restored.
+    def _snapshot(self, *account_ids: str) -> dict:
+        snapshot = {}
+        for account_id in set(account_ids):
+            account = self.repository.get(account_id)
+            snapshot[account_id] = None if account is None else account.balance
+        return snapshot
+
+    def _restore(self, snapshot: dict) -> None:
+        for account_id, balance in snapshot.items():
+            if balance is None:
+                self.repository.delete(account_id)
+            else:
+                self.repository.save(Account(account_id, balance))
+
+    # This method checks that the log is usable and captures the accounts an operation is about to change,
+    # so that they can be restored if the write of its event fails. Without a log there is nothing to undo.
+    def _snapshot_for_log(self, *account_ids: str) -> Optional[dict]:
+        if self.event_log is None:
+            return None
+
+        self._check_log()
+        return self._snapshot(*account_ids)
+
+    # This method writes applied events to the log. It is called while the account locks are held,
+    # so the order of the log matches the order in which events were applied to each account.
+    # If the write fails, the accounts are restored from the snapshot taken before the events were applied.
+    def _record(self, events, snapshot: Optional[dict] = None) -> Optional[int]:
+        if self.event_log is None:
+            return None
+
+        if isinstance(events, dict):
+            events = [events]
+
+        try:
+            return self.event_log.append(*events)
+        except EventLogError:
+            if snapshot is not None:
+                self._restore(snapshot)
+            raise
+
+    # This method notifies the observers of the accounts changed by an applied operation.
+    def _changed(self, *accounts: Account) -> None:
+        if not self.observers:
+            return
+
+        if len(accounts) == 2 and accounts[0] is accounts[1]:
+            accounts = accounts[:1]
+
+        self._notify("balances_changed", accounts)
+
+    # This method calls a callback of every observer. The change is already applied and logged, so an observer
+    # that fails does not keep the others from being told: the first error is raised once all of them were.
+    def _notify(self, callback: str, *args) -> None:
+        error = None
+        for observer in self.observers:
+            try:
+                getattr(observer, callback)(*args)
+            except Exception as failure:
+                error = error or failure
+
+        if error is not None:
+            raise error
+
+    # This method makes a recorded event durable before the operation is acknowledged to the caller.
+    # It runs after the locks are released, so other operations are not held up by the fsync.
+    def _wait_durable(self, sequence: Optional[int]) -> None:
+        if sequence is not None and self._deferred.active:
+            self._deferred.sequence = sequence
+            return
+
+        if sequence is not None and self.event_log is not None:
+            self.event_log.wait(sequence)
+
+
+# This class exposes the account operations inside AccountService.atomic().
+# The accounts are already locked by the enclosing block, and the events are only recorded
+# in the log once the whole block has succeeded.
+class AtomicBatch:
+
+    def __init__(self, service: AccountService):
+        self._service = service
+        self.events: list[dict] = []
+
+    def deposit(self, destination_id: str, amount: int) -> Account:
+        account = self._service._deposit(destination_id, amount)
+        self.events.append({"type": "deposit", "destination": destination_id, "amount": amount})
+        return account
+
+    def withdraw(self, origin_id: str, amount: int) -> Account:
+        account = self._service._withdraw(origin_id, amount)
+        self.events.append({"type": "withdraw", "origin": origin_id, "amount": amount})
+        return account
+
+    def transfer(self, origin_id: str, destination_id: str, amount: int):
+        accounts = self._service._transfer(origin_id, destination_id, amount)
+        self.events.append({
+            "type": "transfer",
+            "origin": origin_id,
+            "destination": destination_id,
+            "amount": amount,
+        })
+        return accounts
+
+
+# This class holds the per-thread state of deferred operations. Its defaults are class attributes, so
+# reading them on a thread that never deferred anything does not go through a failed lookup.
+class _DeferredState(threading.local):
+    active = False
+    sequence = None
+    blocking = True
+
+
+# This class holds the striped locks of some accounts and then the repository's own locks on them,
+# releasing them in the reverse order.
+class _LockedWithRepository:
+    __slots__ = ("_locks", "_repository_lock")
+
+    def __init__(self, locks, repository_lock):
+        self._locks = locks
+        self._repository_lock = repository_lock
+
+    def __enter__(self) -> None:
+        self._locks.__enter__()
+        try:
+            self._repository_lock.__enter__()
+        except BaseException:
+            self._locks.__exit__(None, None, None)
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            return self._repository_lock.__exit__(*exc_info)
+        finally:
+            self._locks.__exit__(None, None, None)
@@ -0,0 +1,106 @@
+import asyncio
+from functools import partial
+from operator import methodcaller
+from typing import Optional
+
+from anyio.to_thread import run_sync
+
+from app.domain.account import Account
+from app.services.account_service import AccountService
+from app.utils.striped_lock import LockUnavailable
+
+# This class exposes the AccountService to async code, so request handlers can run on the event loop.
+# With a repository that never blocks (such as the in-memory one), operations run directly on the loop:
+# their locks are tried without waiting and, only if one is held by another thread, the operation is
+# retried on the threadpool. Repositories that may block (marked with `blocking = True`, or without the
+# marker) keep the sync path and always run on the threadpool. In both cases the wait for the event log
+# group commit is awaited, not blocked on.
+class AsyncAccountService:
+
+    # `service` is an AccountService, or any service offering its operations (such as ShardedAccountService).
+    def __init__(self, service: AccountService):
+        self.service = service
+        self._inline = getattr(service.repository, "blocking", True) is False
+
+    # This method resets the state of the account repository.
+    async def reset(self) -> None:
+        await self.run(methodcaller("reset"))
+
+    # This method retrieves the balance of a specific account. Reads take no lock, so it never waits.
+    async def get_balance(self, account_id: str) -> int:
+        if self._inline:
+            return self.service.get_balance(account_id)
+
+        return await run_sync(self.service.get_balance, account_id)
+
+    # This method retrieves the balance of an account at a past time. History lookups never wait.
+    async def get_balance_at(self, account_id: str, timestamp: float) -> int:
+        return self.service.get_balance_at(account_id, timestamp)
+
+    # This method returns the total balance, the number of accounts and the largest balances. They are
+    # maintained incrementally and read under a short lock, so it never waits.
+    async def get_aggregates(self, top: int):
+        return self.service.get_aggregates(top)
+
+    # This method returns a page of accounts and the cursor of the next one (see AccountService.scan).
+    async def scan(self, cursor: Optional[str], count: int) -> tuple[list[tuple[str, int]], Optional[str]]:
+        if self._inline:
+            return self.service.scan(cursor, count)
+
+        return await run_sync(self.service.scan, cursor, count)
+
+    # This method registers a subscription to the balance changes of its accounts (see AccountService.subscribe).
+    async def subscribe(self, subscription) -> None:
+        await self.run(methodcaller("subscribe", subscription))
+
+    # This method stops delivering balance changes to a subscription. It only takes a short lock, so it never waits.
+    async def unsubscribe(self, subscription) -> None:
+        self.service.unsubscribe(subscription)
+
+    async def deposit(self, destination_id: str, amount: int) -> Account:
+        return await self.run(methodcaller("deposit", destination_id=destination_id, amount=amount))
+
+    async def withdraw(self, origin_id: str, amount: int) -> Account:
+        return await self.run(methodcaller("withdraw", origin_id=origin_id, amount=amount))
+
+    async def transfer(self, origin_id: str, destination_id: str, amount: int):
+        return await self.run(methodcaller(
+            "transfer",
+            origin_id=origin_id,
+            destination_id=destination_id,
+            amount=amount,
+        ))
+
+    # This method applies `operation(operations, *args)`, a function that only deposits, withdraws and transfers
+    # between the given accounts, and returns its result once its events are durable. When the service has an
+    # event pipeline, the operation is queued to its writer and applied in a micro-batch with the operations of
+    # other requests; otherwise it runs like `run`.
+    async def apply(self, account_ids: tuple, operation, *args):
+        pipeline = getattr(self.service, "pipeline", None)
+        if pipeline is None:
+            return await self.run(operation, *args)
+
+        result, sequence = await asyncio.wrap_future(pipeline.submit(account_ids, operation, *args))
+
+        if sequence is not None and self.service.event_log is not None:
+            await self.service.event_log.wait_async(sequence)
+
+        return result
+
+    # This method runs `operation(service, *args, **kwargs)`, a method of AccountService or any function
+    # taking the service first, and returns its result once its events are durable.
+    async def run(self, operation, *args, **kwargs):
+        service = self.service
+
+        if self._inline:
+            try:
+                result, sequence = service.run_deferred(operation, service, *args, blocking=False, **kwargs)
+            except LockUnavailable:
+                result, sequence = await run_sync(partial(service.run_deferred, operation, service, *args, **kwargs))
+        else:
+            result, sequence = await run_sync(partial(service.run_deferred, operation, service, *args, **kwargs))
+
+        if sequence is not None and service.event_log is not None:
+            await service.event_log.wait_async(sequence)
+
+        return result
@@ -0,0 +1,130 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+from app.utils.reclaimer import reclaimer
+
+# Entries per bucket of the sorted index, once it is split: an insert or a removal moves at most
+# twice as many entries, while finding the bucket is a binary search over the buckets.
+BUCKET_SIZE = 512
+
+
+# Every account ordered by descending balance (then by ID), as entries built by _entry kept in a list of
+# sorted buckets. Adding or removing an entry is a binary search for its bucket and an insertion in that bucket,
+# so it costs O(log n) comparisons however many accounts there are, and the largest balances are at the front.
+class _SortedBalances:
+    def __init__(self):
+        self._buckets: list[list[tuple]] = []
+        # Last entry of each bucket, searched to find the bucket of an entry
+        self._lasts: list[tuple] = []
+
+    def load(self, entries: Iterable[tuple]) -> None:
+        entries = sorted(entries)
+        self._buckets = [entries[start:start + BUCKET_SIZE] for start in range(0, len(entries), BUCKET_SIZE)]
+        self._lasts = [bucket[-1] for bucket in self._buckets]
+
+    def add(self, entry: tuple) -> None:
+        buckets, lasts = self._buckets, self._lasts
+        if not buckets:
+            buckets.append([entry])
+            lasts.append(entry)
+            return
+
+        index = bisect_left(lasts, entry)
+        if index == len(lasts):
+            index -= 1
+            bucket = buckets[index]
+            bucket.append(entry)
+            lasts[index] = entry
+        else:
+            bucket = buckets[index]
+            insort(bucket, entry)
+
+        if len(bucket) > 2 * BUCKET_SIZE:
+            buckets[index:index + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            lasts[index:index + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def remove(self, entry: tuple) -> None:
+        buckets, lasts = self._buckets, self._lasts
+        index = bisect_left(lasts, entry)
+        bucket = buckets[index]
+        position = bisect_left(bucket, entry)
+        del bucket[position]
+
+        if not bucket:
+            del buckets[index]
+            del lasts[index]
+        elif position == len(bucket):
+            lasts[index] = bucket[-1]
+
+    # Hands the buckets to the reclaimer, once the index is no longer used.
+    def release(self) -> None:
+        reclaimer.release(self._buckets, self._lasts)
+
+    def first(self, count: int) -> list[tuple]:
+        entries = []
+        for bucket in self._buckets:
+            entries.extend(bucket[:count - len(entries)])
+            if len(entries) == count:
+                break
+        return entries
+
+
+# Entry of an account in the sorted index. The API accepts deposits without a destination, which create the
+# account None: the ID is compared as a flag and a string, so entries with equal balances always order (None first).
+def _entry(account_id: Optional[str], balance: int) -> tuple[int, bool, str]:
+    return -balance, account_id is not None, account_id or ""
+
+
+def _account(entry: tuple[int, bool, str]) -> tuple[Optional[str], int]:
+    balance, has_id, account_id = entry
+    return (account_id if has_id else None), -balance
+
+
+# This class maintains the total balance, the number of accounts and the accounts with the largest balances as
+# balances change, so that they are read in constant time instead of by scanning every account. It is fed by the
+# BalanceView, which knows the previous balance of every account it publishes: each change adjusts the total by
+# the difference and moves the account in a sorted index, in O(log n). The aggregates have a lock of their own,
+# held for a few microseconds per operation, so they always describe the balances after a whole operation.
+class BalanceAggregates:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = 0
+        self._count = 0
+        self._sorted = _SortedBalances()
+
+    # This method replaces the aggregates with those of the given accounts, e.g. when the view is seeded.
+    def seed(self, balances: Iterable[tuple[str, int]]) -> None:
+        entries = [_entry(account_id, balance) for account_id, balance in balances]
+        with self._lock:
+            self._sorted.load(entries)
+            self._total = -sum(entry[0] for entry in entries)
+            self._count = len(entries)
+
+    # This method applies the changes of one operation, given as (account ID, previous balance or None for a
+    # new account, new balance).
+    def apply(self, changes: Iterable[tuple[str, Optional[int], int]]) -> None:
+        with self._lock:
+            for account_id, previous, balance in changes:
+                if previous is None:
+                    self._count += 1
+                    self._total += balance
+                else:
+                    self._total += balance - previous
+                    self._sorted.remove(_entry(account_id, previous))
+                self._sorted.add(_entry(account_id, balance))
+
+    # This method forgets every account. The sorted index is swapped for an empty one and freed in the background.
+    def reset(self) -> None:
+        with self._lock:
+            index, self._sorted = self._sorted, _SortedBalances()
+            self._total = 0
+            self._count = 0
+        index.release()
+
+    # This method returns the total balance, the number of accounts and the `top` accounts with the largest
+    # balances, as (account ID, balance) pairs, all as of the same point in time.
+    def read(self, top: int = 10) -> tuple[int, int, list[tuple[str, int]]]:
+        with self._lock:
+            largest = self._sorted.first(top)
+            return self._total, self._count, [_account(entry) for entry in largest]
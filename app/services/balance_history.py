@@ -0,0 +1,144 @@
+import math
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from app.domain.account import Account
+from app.domain.exceptions import AccountNotFound, HistoryUnavailable
+
+
+# Balances of one account over time. Entry i is the balance right after the event applied at times[i],
+# so every entry is a checkpoint and a lookup is a single binary search, without replaying deltas.
+# Both arrays are only appended to in place; compaction builds new arrays and swaps them in at once,
+# so readers that captured `entries` keep a consistent view.
+class _AccountHistory:
+    __slots__ = ("entries", "horizon")
+
+    def __init__(self):
+        self.entries = (array("d"), array("q"))
+        # Time of the oldest entry kept after a compaction; None while nothing has been dropped.
+        self.horizon: Optional[float] = None
+
+
+# This class records the balance of every account after each applied event, so that the balance of an
+# account at any past time can be looked up. It is registered as an observer of the AccountService and
+# notified while the locks of the changed accounts are held, so each account's entries are in order.
+# History starts when the object is created (seeded with the balances at that time) and each account
+# keeps at most `limit` entries: when it has more, its oldest half is dropped and lookups before the
+# oldest remaining entry raise HistoryUnavailable.
+#
+# History is kept back to the second to last reset: at each reset, the history before the previous one
+# is given up, and the accounts that did not change since the previous reset (so that no longer exist
+# and were only in that older history) are dropped. Accounts removed by resets are therefore not kept
+# forever, and lookups before the previous reset raise HistoryUnavailable.
+class BalanceHistory:
+    def __init__(self, limit: int = 4096, clock=time.time):
+        self._limit = max(2, limit)
+        self._clock = clock
+        self._accounts: dict[str, _AccountHistory] = {}
+        self._resets = array("d")
+        self.started_at = clock()
+
+    # This method records the balances of existing accounts as the starting point of the history.
+    def seed(self, balances: Iterable[tuple[str, int]]) -> None:
+        for account_id, balance in balances:
+            self._append(account_id, balance, self.started_at)
+
+    # Observer callback: the given accounts were changed by an event applied now.
+    def balances_changed(self, accounts: Iterable[Account]) -> None:
+        now = self._clock()
+        for account in accounts:
+            self._append(account.account_id, account.balance, now)
+
+    # Observer callback: every account was removed. It is called while every account is locked.
+    def reset(self) -> None:
+        now = self._clock()
+        if self._resets:
+            previous = self._resets[-1]
+            now = max(now, previous)
+            # Readers keep using the accounts and resets they looked up; the new ones are swapped in at once.
+            self._accounts = {
+                account_id: history
+                for account_id, history in self._accounts.items()
+                if history.entries[0][-1] > previous
+            }
+            self._resets = array("d", (previous, now))
+            self.started_at = max(self.started_at, previous)
+        else:
+            self._resets.append(now)
+
+    # This method returns the balance of an account at the given time (seconds since the epoch).
+    # It raises AccountNotFound if the account did not exist at that time, and HistoryUnavailable
+    # if that time is before the history started or before the entries that were kept for the account.
+    def balance_at(self, account_id: str, timestamp: float) -> int:
+        if timestamp < self.started_at:
+            raise HistoryUnavailable("History starts at " + _format(self.started_at))
+
+        history = self._accounts.get(account_id)
+        if history is None:
+            raise AccountNotFound()
+
+        times, balances = history.entries
+        # Balances are appended after times, so only entries whose balance is written are considered.
+        count = len(balances)
+        index = bisect_right(times, timestamp, 0, count) - 1
+
+        if index < 0:
+            if history.horizon is not None:
+                raise HistoryUnavailable("History of this account starts at " + _format(history.horizon))
+            raise AccountNotFound()
+
+        # A reset between the last event before the given time and that time removed the account.
+        if bisect_right(self._resets, timestamp) > bisect_right(self._resets, times[index]):
+            raise AccountNotFound()
+
+        return balances[index]
+
+    def _append(self, account_id: str, balance: int, now: float) -> None:
+        history = self._accounts.get(account_id)
+        if history is None:
+            history = self._accounts.setdefault(account_id, _AccountHistory())
+
+        times, balances = history.entries
+        if times and now < times[-1]:
+            now = times[-1]
+
+        if len(times) >= self._limit:
+            keep = self._limit // 2
+            times, balances = times[-keep:], balances[-keep:]
+            history.entries = (times, balances)
+            history.horizon = times[0]
+
+        times.append(now)
+        try:
+            balances.append(balance)
+        except OverflowError:
+            # Balances beyond 64 bits (possible with the dictionary-backed repository) are kept in a list.
+            balances = list(balances)
+            balances.append(balance)
+            history.entries = (times, balances)
+
+
+def _format(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+# This function parses the time of a point-in-time query: seconds since the epoch, or an ISO 8601
+# date and time (UTC unless it has an offset). It raises ValueError for anything else.
+def parse_timestamp(value: str) -> float:
+    try:
+        timestamp = float(value)
+    except ValueError:
+        timestamp = None
+
+    if timestamp is not None:
+        if not math.isfinite(timestamp):
+            raise ValueError("Timestamp must be finite")
+        return timestamp
+
+    moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from typing import Iterable, Optional
+
+from app.domain.account import Account
+
+
+# The balance changes a subscriber has not received yet, as returned by Subscription.changes().
+class BalanceUpdate:
+    """
+        Changes to the accounts of a subscription since its last update.
+
+        Attributes:
+        ----------
+        reset : bool
+            Whether every account was reset since the last update: balances from before it are gone.
+        dropped : int
+            Number of account changes discarded because the subscriber did not keep up. Its balances
+            may be stale, for accounts other than those in `balances`, until they change again.
+        balances : dict[str, int]
+            Latest balance of every subscribed account changed since the last update (or the reset).
+    """
+
+    def __init__(self, reset: bool, dropped: int, balances: dict[str, int]):
+        self.reset = reset
+        self.dropped = dropped
+        self.balances = balances
+
+
+# This class is the subscription of one consumer to the balance changes of some accounts. Changes wait in a
+# buffer until the consumer takes them with changes(). The buffer holds the latest balance of each account,
+# so a burst of changes to an account costs one entry, and it holds at most `buffer_size` accounts: when a
+# change to yet another account arrives, the oldest pending change is dropped and counted instead. A slow
+# consumer therefore loses intermediate balances, never the memory or the time of the writers.
+class Subscription:
+    def __init__(self, account_ids: Iterable[str], buffer_size: int = 256):
+        self.account_ids = frozenset(account_ids)
+        self._buffer_size = buffer_size
+        self._pending: dict[str, int] = {}
+        self._dropped = 0
+        self._reset = False
+        # Set on the event loop of the consumer once there is something to take
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._signalled = False
+        # The lock of the BalanceSubscriptions the subscription is registered with
+        self._lock: Optional[threading.Lock] = None
+
+    # This method waits for the next changes, for at most `timeout` seconds, and returns them (None if none came).
+    async def changes(self, timeout: Optional[float] = None) -> Optional[BalanceUpdate]:
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+            with self._lock:
+                self._ready.clear()
+                self._signalled = False
+                if self._pending or self._dropped or self._reset:
+                    update = BalanceUpdate(self._reset, self._dropped, self._pending)
+                    self._pending, self._dropped, self._reset = {}, 0, False
+                    return update
+
+    # Records the latest balance of an account. Called with the lock held, from the thread of the writer.
+    def _push(self, account_id: str, balance: int) -> None:
+        pending = self._pending
+        if account_id not in pending and len(pending) >= self._buffer_size:
+            del pending[next(iter(pending))]
+            self._dropped += 1
+        pending[account_id] = balance
+        self._signal()
+
+    # Discards the pending changes, which the reset made obsolete. Called with the lock held.
+    def _clear(self) -> None:
+        self._pending.clear()
+        self._dropped = 0
+        self._reset = True
+        self._signal()
+
+    # Wakes the consumer up, once until it takes the changes: writers only ever schedule a callback on its loop.
+    def _signal(self) -> None:
+        if self._signalled:
+            return
+
+        self._signalled = True
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop of the consumer is closed: it will never take the changes.
+            pass
+
+
+# This class pushes the balance changes applied by an AccountService to the subscriptions of the accounts
+# changed. It is registered as an observer of the service, which notifies it once an operation has been
+# applied and logged, while the locks of the changed accounts are still held, so each subscription receives
+# the changes of an account in order, and both sides of a transfer together.
+#
+# Writers never wait for subscribers: notifying them is a lookup per changed account and, for each of their
+# subscriptions, a store in its bounded buffer under a lock no one holds for longer.
+class BalanceSubscriptions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_account: dict[str, list[Subscription]] = {}
+        self._subscriptions: set[Subscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    # This method registers a subscription and records the current balances of its accounts in it. It must be
+    # called while the accounts are locked (see AccountService.subscribe), so no change is missed or seen twice.
+    def add(self, subscription: Subscription, balances: dict[str, int]) -> None:
+        with self._lock:
+            subscription._lock = self._lock
+            for account_id in subscription.account_ids:
+                self._by_account.setdefault(account_id, []).append(subscription)
+            self._subscriptions.add(subscription)
+            for account_id, balance in balances.items():
+                subscription._push(account_id, balance)
+
+    # This method stops delivering changes to a subscription.
+    def remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+
+            self._subscriptions.discard(subscription)
+            for account_id in subscription.account_ids:
+                subscriptions = self._by_account[account_id]
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del self._by_account[account_id]
+
+    # Observer callback: the given accounts were changed by an applied operation.
+    def balances_changed(self, accounts: tuple[Account, ...]) -> None:
+        by_account = self._by_account
+        if not by_account:
+            return
+
+        with self._lock:
+            for account in accounts:
+                for subscription in by_account.get(account.account_id, ()):
+                    subscription._push(account.account_id, account.balance)
+
+    # Observer callback: every account was removed.
+    def reset(self) -> None:
+        with self._lock:
+            for subscription in self._subscriptions:
+                subscription._clear()
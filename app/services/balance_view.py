@@ -0,0 +1,115 @@
+import time
+from typing import Iterable, Optional
+
+from app.domain.account import Account
+from app.services.balance_aggregates import BalanceAggregates
+from app.utils.reclaimer import reclaimer
+from app.utils.striped_lock import StripedLock
+
+
+# This class keeps the committed balance of every account, so that balance reads never touch the repository
+# nor take a lock. It is registered as an observer of the AccountService, which notifies it once an operation
+# has been applied and logged, while the locks of the changed accounts are still held. Balances an operation
+# writes before it fails (a rejected atomic batch, a failed log write) are never published here.
+#
+# Each entry is an immutable int replaced by a single store, so a read of one account is a dictionary lookup
+# that never waits for a writer. Reads of several accounts are made consistent seqlock-style: each stripe of
+# the service's locks has a sequence number, odd while balances of that stripe are being published, and a
+# reader retries until none of the sequences of its accounts moved while it read them. The accounts of an
+# operation are published together, so a transfer is seen with both sides applied or with neither.
+#
+# When given BalanceAggregates, the view feeds them the previous and new balance of every account it publishes.
+class BalanceView:
+    def __init__(self, locks: StripedLock, aggregates: Optional[BalanceAggregates] = None):
+        self.aggregates = aggregates
+        self._stripe_of = locks.stripe_of
+        self._balances: dict[str, int] = {}
+        # Writers of a stripe hold its lock, so each sequence is only ever changed by one thread at a time.
+        self._sequences = [0] * len(locks)
+        # Incremented by every reset, which swaps in an empty generation of balances
+        self._generation = 0
+
+    # This method records the balances of existing accounts, e.g. after the state was rebuilt on startup.
+    def seed(self, balances: Iterable[tuple[str, int]]) -> None:
+        self._balances.update(balances)
+        if self.aggregates is not None:
+            self.aggregates.seed(self._balances.items())
+
+    # Observer callback: the given accounts were changed by an applied operation.
+    def balances_changed(self, accounts: tuple[Account, ...]) -> None:
+        sequences = self._sequences
+        balances = self._balances
+        aggregates = self.aggregates
+
+        if len(accounts) == 1:
+            account = accounts[0]
+            stripe = self._stripe_of(account.account_id)
+            sequences[stripe] += 1
+            try:
+                changes = ((account.account_id, balances.get(account.account_id), account.balance),)
+                balances[account.account_id] = account.balance
+                if aggregates is not None:
+                    self._aggregate(changes)
+            finally:
+                sequences[stripe] += 1
+            return
+
+        stripes = {self._stripe_of(account.account_id) for account in accounts}
+        for stripe in stripes:
+            sequences[stripe] += 1
+        try:
+            changes = [(account.account_id, balances.get(account.account_id), account.balance) for account in accounts]
+            for account in accounts:
+                balances[account.account_id] = account.balance
+            if aggregates is not None:
+                self._aggregate(changes)
+        finally:
+            for stripe in stripes:
+                sequences[stripe] += 1
+
+    # Feeds the aggregates the changes just published. The balances are published first, so a failure here
+    # cannot hide them; the aggregates are then rebuilt from the published balances, so they never disagree.
+    def _aggregate(self, changes) -> None:
+        try:
+            self.aggregates.apply(changes)
+        except Exception:
+            self.aggregates.seed(self._balances.items())
+            raise
+
+    # Observer callback: every account was removed. The balances are swapped for an empty generation at once
+    # and the old one is freed in the background.
+    def reset(self) -> None:
+        balances, self._balances = self._balances, {}
+        self._generation += 1
+        reclaimer.release(balances)
+        if self.aggregates is not None:
+            self.aggregates.reset()
+
+    # This method returns the committed balance of an account, or None if it does not exist.
+    def balance(self, account_id: str) -> Optional[int]:
+        return self._balances.get(account_id)
+
+    # This method returns the balances of the given accounts as they were at a single point in time, leaving
+    # out the accounts that did not exist then. It only retries while one of them is being published.
+    def balances(self, account_ids: Iterable[str]) -> dict[str, int]:
+        account_ids = list(account_ids)
+        stripes = list({self._stripe_of(account_id) for account_id in account_ids})
+        sequences = self._sequences
+
+        while True:
+            generation = self._generation
+            before = [sequences[stripe] for stripe in stripes]
+
+            if not any(sequence & 1 for sequence in before):
+                balances = self._balances
+                found = {}
+                for account_id in account_ids:
+                    balance = balances.get(account_id)
+                    if balance is not None:
+                        found[account_id] = balance
+
+                if generation == self._generation and before == [sequences[stripe] for stripe in stripes]:
+                    return found
+
+            # A writer is publishing: let it finish.
+            time.sleep(0)
@@ -0,0 +1,169 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from app.domain.account import Account
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+# Smallest part of the log worth handing to a worker process: below it, starting the process costs more
+MIN_RANGE_SIZE = 1 << 20
+
+
+class ReplayMismatch(Exception):
+    """Raised when the balances rebuilt by a parallel replay differ from those of a sequential one."""
+    pass
+
+
+# This function rebuilds the accounts of `service` from the events logged in `path` after `offset`, like
+# AccountService.replay, on `workers` processes.
+#
+# Only events that were applied are logged, so replaying them can never fail a check: the balance an account
+# ends with is its balance before the replay plus the amounts of its own legs (a deposit, a withdrawal and
+# the two sides of a transfer), whatever the order of the events of other accounts. The log is cut into one
+# byte range per worker; each worker parses its range and sums the legs of every account it finds, starting
+# over at each reset. The sums are then added up range by range, from the last range holding a reset (or onto
+# the balances the repository already holds, when there is none), and the result is loaded in one go.
+# Accounts keep the order in which the sequential replay would have created them.
+#
+# A log that was not written by this application (an event that would be rejected) is not detected: with
+# `verify`, the events are replayed sequentially as well, into a separate in-memory repository, and
+# ReplayMismatch is raised if that fails or the balances differ. It returns the number of events replayed.
+def replay_log(
+    service: AccountService,
+    path: str,
+    offset: int = 0,
+    workers: int = 0,
+    verify: bool = False,
+    start_method: str = "spawn",
+) -> int:
+    repository = service.repository
+    initial = list(repository.items()) if verify else None
+    ranges = _split(path, offset, workers or os.cpu_count() or 1)
+
+    if len(ranges) > 1:
+        context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as pool:
+            folds = list(pool.map(_fold_range, [path] * len(ranges), *zip(*ranges)))
+    else:
+        folds = [_fold_range(path, start, end) for start, end in ranges]
+
+    applied = sum(events for events, _, _ in folds)
+    if applied:
+        _merge(repository, folds)
+
+    if verify:
+        _verify(repository, initial, path, offset)
+
+    return applied
+
+
+# This function cuts the complete lines of the log after `offset` into at most `count` byte ranges of about
+# the same size, each ending with a newline. A truncated last line is left out, as EventLog.read does.
+def _split(path: str, offset: int, count: int) -> list[tuple[int, int]]:
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        end = _line_end(file, size)
+        count = max(1, min(count, (end - offset) // MIN_RANGE_SIZE))
+
+        ranges = []
+        start = offset
+        for index in range(1, count + 1):
+            stop = end if index == count else _line_end(file, max(start, offset + (end - offset) * index // count))
+            if stop > start:
+                ranges.append((start, stop))
+                start = stop
+        return ranges
+
+
+# Returns the position just after the last newline at or before `position`, or 0 if there is none.
+def _line_end(file, position: int) -> int:
+    while position > 0:
+        start = max(0, position - 65536)
+        file.seek(start)
+        newline = file.read(position - start).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+# This function sums the legs of every account in the events of one range. It returns the number of events,
+# whether the range holds a reset, and the sums of the events after its last reset, by account, in the order
+# the accounts first appear.
+def _fold_range(path: str, start: int, end: int) -> tuple[int, bool, dict[str, int]]:
+    sums: dict[str, int] = {}
+    get = sums.get
+    loads = json.loads
+    reset = False
+    events = 0
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        position = start
+        for line in file:
+            position += len(line)
+            if position > end:
+                break
+            event = loads(line)
+            kind = event["type"]
+            if kind == "deposit":
+                destination = event["destination"]
+                sums[destination] = get(destination, 0) + event["amount"]
+            elif kind == "withdraw":
+                origin = event["origin"]
+                sums[origin] = get(origin, 0) - event["amount"]
+            elif kind == "transfer":
+                origin, destination, amount = event["origin"], event["destination"], event["amount"]
+                sums[origin] = get(origin, 0) - amount
+                sums[destination] = get(destination, 0) + amount
+            elif kind == "reset":
+                sums.clear()
+                reset = True
+            else:
+                raise ValueError(f"Unknown event type in log: {kind}")
+            events += 1
+
+    return events, reset, sums
+
+
+# This function adds up the sums of every range onto the starting balances and loads the result.
+def _merge(repository, folds: list[tuple[int, bool, dict[str, int]]]) -> None:
+    first = max((index for index, (_, reset, _) in enumerate(folds) if reset), default=None)
+    balances = {} if first is not None else dict(repository.items())
+    get = balances.get
+
+    for _, _, sums in folds[first or 0:]:
+        for account_id, amount in sums.items():
+            balances[account_id] = get(account_id, 0) + amount
+
+    load = getattr(repository, "load", None)
+    if load is not None:
+        load(list(balances), list(balances.values()))
+        return
+
+    # Repositories without bulk loading get the changed accounts one by one.
+    if first is not None:
+        repository.reset()
+    for account_id in {account_id for _, _, sums in folds[first or 0:] for account_id in sums}:
+        repository.save(Account(account_id, balances[account_id]))
+
+
+def _verify(repository, initial: list[tuple[str, int]], path: str, offset: int) -> None:
+    expected = InMemoryAccountRepository()
+    expected.load([account_id for account_id, _ in initial], [balance for _, balance in initial])
+    try:
+        AccountService(expected).replay(EventLog.read(path, offset))
+    except Exception as error:
+        raise ReplayMismatch(f"The log cannot be replayed sequentially: {type(error).__name__} {error}") from error
+
+    actual = dict(repository.items())
+    wanted = dict(expected.items())
+    if actual != wanted:
+        differing = sorted(account_id for account_id in actual.keys() | wanted.keys() if actual.get(account_id) != wanted.get(account_id))
+        raise ReplayMismatch(f"Parallel replay differs from the sequential one for {len(differing)} accounts, e.g. {differing[:5]}")
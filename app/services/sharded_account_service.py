@@ -0,0 +1,371 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Sequence
+
+from app.domain.account import Account
+from app.domain.exceptions import (
+    AggregatesUnavailable,
+    AtomicBatchesUnavailable,
+    HistoryUnavailable,
+    InvalidCursor,
+    SubscriptionsUnavailable,
+)
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+
+class ShardUnavailable(Exception):
+    """Raised when the process owning a shard of the accounts has stopped."""
+    pass
+
+
+# This function returns the shard owning an account. It must give the same answer in every process,
+# so it uses CRC-32 rather than hash(), which is salted per process for strings.
+def shard_of(account_id: str, shards: int) -> int:
+    return zlib.crc32(str(account_id).encode("utf-8", "surrogatepass")) % shards
+
+
+# This function is the main loop of a shard process. It owns an AccountService over its own repository and
+# applies the requests it receives one at a time, so the accounts of a shard need no locking across
+# processes. Every message is a list of (request ID, operation, arguments); the requests already waiting
+# in the pipe are applied along with it, and all of their results are sent back in one message.
+#
+# Cross-shard transfers are applied in two phases. prepare_debit withdraws the amount from the origin and
+# keeps it as a hold of the transaction; once the destination has been credited, commit drops the hold,
+# and if the destination rejected the credit, abort gives the amount back to the origin. Money is never
+# created: at any time, the balances plus the holds of every shard add up to the same total.
+def _serve(connection, repository_factory: Callable) -> None:
+    service = AccountService(repository_factory())
+    holds: dict[int, tuple[str, int]] = {}
+
+    def prepare_debit(transaction: int, origin_id: str, amount: int) -> int:
+        account = service.withdraw(origin_id, amount)
+        holds[transaction] = (origin_id, amount)
+        return account.balance
+
+    def commit(transaction: int) -> None:
+        holds.pop(transaction, None)
+
+    def abort(transaction: int) -> None:
+        hold = holds.pop(transaction, None)
+        if hold is not None:
+            service.deposit(*hold)
+
+    def transfer(origin_id: str, destination_id: str, amount: int) -> tuple[int, int]:
+        origin, destination = service.transfer(origin_id, destination_id, amount)
+        return origin.balance, destination.balance
+
+    def reset() -> None:
+        service.reset()
+        holds.clear()
+
+    operations = {
+        "balance": service.get_balance,
+        "deposit": lambda destination_id, amount: service.deposit(destination_id, amount).balance,
+        "withdraw": lambda origin_id, amount: service.withdraw(origin_id, amount).balance,
+        "deposit_many": service.deposit_many,
+        "transfer": transfer,
+        "prepare_debit": prepare_debit,
+        "commit": commit,
+        "abort": abort,
+        "reset": reset,
+        "count": lambda: len(service.repository),
+        "scan": service.scan,
+        "holds": lambda: sum(amount for _, amount in holds.values()),
+    }
+
+    while True:
+        try:
+            batch = connection.recv()
+            while connection.poll():
+                batch += connection.recv()
+        except EOFError:
+            return
+
+        results = []
+        for request in batch:
+            if request is None:
+                connection.send(results)
+                return
+
+            request_id, operation, args = request
+            try:
+                results.append((request_id, True, operations[operation](*args)))
+            except Exception as error:
+                results.append((request_id, False, error))
+
+        connection.send(results)
+
+
+# The side of a shard held by the coordinating process. Requests are pipelined: every caller gets a future
+# and a reader thread resolves them as results come back. Concurrent callers are combined into one message:
+# while a thread is sending, requests from other threads queue up and are sent together in the next message.
+class _Shard:
+    def __init__(self, context, repository_factory: Callable, index: int):
+        connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_serve,
+            args=(child_connection, repository_factory),
+            name=f"account-shard-{index}",
+            daemon=True,
+        )
+        self._process.start()
+        child_connection.close()
+
+        self._connection = connection
+        self._lock = threading.Lock()
+        self._outgoing: list = []
+        self._sending = False
+        self._futures: dict[int, Future] = {}
+        self._request_ids = itertools.count()
+        self._error = None
+        self._reader = threading.Thread(target=self._read, name=f"account-shard-{index}-reader", daemon=True)
+        self._reader.start()
+
+    # This method sends a request to the shard and returns the future of its result.
+    def call(self, operation: str, *args) -> Future:
+        future = Future()
+        request_id = next(self._request_ids)
+        self._futures[request_id] = future
+
+        if self._error is not None:
+            self._futures.pop(request_id, None)
+            future.set_exception(ShardUnavailable())
+            return future
+
+        self._send((request_id, operation, args))
+        return future
+
+    # This method stops the shard process once it has applied every request sent before.
+    def close(self) -> None:
+        self._send(None)
+        self._process.join()
+        self._reader.join()
+        self._connection.close()
+
+    def _send(self, request) -> None:
+        with self._lock:
+            self._outgoing.append(request)
+            if self._sending:
+                return
+            self._sending = True
+
+        while True:
+            with self._lock:
+                batch, self._outgoing = self._outgoing, []
+                if not batch:
+                    self._sending = False
+                    return
+
+            try:
+                self._connection.send(batch)
+            except (OSError, ValueError) as error:
+                self._fail(error)
+
+    def _read(self) -> None:
+        while True:
+            try:
+                results = self._connection.recv()
+            except (EOFError, OSError) as error:
+                self._fail(error)
+                return
+
+            for request_id, succeeded, value in results:
+                future = self._futures.pop(request_id)
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    # Fails every pending request once the shard process can no longer be reached.
+    def _fail(self, error: BaseException) -> None:
+        self._error = error
+        for request_id in list(self._futures):
+            future = self._futures.pop(request_id, None)
+            if future is not None and not future.done():
+                failure = ShardUnavailable()
+                failure.__cause__ = error
+                future.set_exception(failure)
+
+
+# This class spreads the accounts over a pool of worker processes, each owning the accounts whose ID hashes
+# to it, so that events are applied by as many cores as there are shards instead of by a single interpreter.
+# It offers the operations of AccountService: deposits and withdrawals go to the shard of their account, and
+# transfers between two accounts of the same shard are applied by that shard alone. A transfer between shards
+# debits the origin into a hold, credits the destination and then commits the hold, or gives the amount back
+# to the origin if the credit is rejected (see _serve).
+#
+# Operations on one shard are applied in the order they were sent. A reset waits for the cross-shard transfers
+# in progress and holds new ones back, so each of them lands wholly before or after it.
+# Balance history, the event log and atomic batches are not available: they need a single ordered view of
+# every account, which the shards do not share.
+class ShardedAccountService:
+    # Accounts live in the shard processes: there is no repository in this process, and every operation waits
+    # for a shard, so async callers run them on the threadpool.
+    repository = None
+    event_log = None
+    history = None
+    view = None
+    # Each shard process already applies its operations one at a time, in the order they were sent
+    pipeline = None
+    subscriptions = None
+
+    def __init__(self, shards: int = 0, repository_factory: Callable = InMemoryAccountRepository, start_method: str = "spawn"):
+        context = multiprocessing.get_context(start_method)
+        self.observers: list = []
+        self._shards = [_Shard(context, repository_factory, index) for index in range(shards or os.cpu_count() or 1)]
+        self._transactions = itertools.count()
+        self._gate = threading.Condition()
+        self._transfers_in_progress = 0
+        self._resetting = False
+
+    # This method resets the state of every shard.
+    def reset(self) -> None:
+        with self._exclusive():
+            for future in [shard.call("reset") for shard in self._shards]:
+                future.result()
+
+    # This method retrieves the balance of a specific account, raising AccountNotFound if it does not exist.
+    def get_balance(self, account_id: str) -> int:
+        return self._shard(account_id).call("balance", account_id).result()
+
+    # This method lists the accounts of each shard in turn. The cursor is the index of the shard followed by
+    # the cursor within it.
+    def scan(self, cursor: Optional[str] = None, count: int = 1000) -> tuple[list[tuple[str, int]], Optional[str]]:
+        shard, inner = 0, None
+        if cursor is not None:
+            index, _, position = cursor.partition(":")
+            if not (index.isascii() and index.isdigit()) or int(index) >= len(self._shards):
+                raise InvalidCursor()
+            shard, inner = int(index), position or None
+
+        page, inner = self._shards[shard].call("scan", inner, count).result()
+        if inner is not None:
+            return page, f"{shard}:{inner}"
+        if shard + 1 < len(self._shards):
+            return page, f"{shard + 1}:"
+        return page, None
+
+    def get_balance_at(self, account_id: str, timestamp: float) -> int:
+        raise HistoryUnavailable("Balance history is not available with sharded accounts")
+
+    def get_aggregates(self, top: int = 10):
+        raise AggregatesUnavailable("Aggregates are not available with sharded accounts")
+
+    def subscribe(self, subscription) -> None:
+        raise SubscriptionsUnavailable("Balance subscriptions are not available with sharded accounts")
+
+    def unsubscribe(self, subscription) -> None:
+        pass
+
+    def deposit(self, destination_id: str, amount: int) -> Account:
+        return Account(destination_id, self._shard(destination_id).call("deposit", destination_id, amount).result())
+
+    # This method sends the deposits of each shard to it in one request, and returns the rejected deposits with
+    # their position among all of them (see AccountService.deposit_many).
+    def deposit_many(self, deposits: Sequence[tuple[str, int]]) -> list[tuple[int, Exception]]:
+        positions: dict[int, list[int]] = {}
+        for position, (account_id, _) in enumerate(deposits):
+            positions.setdefault(shard_of(account_id, len(self._shards)), []).append(position)
+
+        futures = [
+            (shard_positions, self._shards[shard].call("deposit_many", [deposits[position] for position in shard_positions]))
+            for shard, shard_positions in positions.items()
+        ]
+
+        rejected = []
+        for shard_positions, future in futures:
+            rejected.extend((shard_positions[index], error) for index, error in future.result())
+        return sorted(rejected, key=lambda item: item[0])
+
+    def withdraw(self, origin_id: str, amount: int) -> Account:
+        return Account(origin_id, self._shard(origin_id).call("withdraw", origin_id, amount).result())
+
+    def transfer(self, origin_id: str, destination_id: str, amount: int):
+        origin_shard = self._shard(origin_id)
+        destination_shard = self._shard(destination_id)
+
+        if origin_shard is destination_shard:
+            origin_balance, destination_balance = origin_shard.call("transfer", origin_id, destination_id, amount).result()
+            return Account(origin_id, origin_balance), Account(destination_id, destination_balance)
+
+        with self._shared():
+            transaction = next(self._transactions)
+            origin_balance = origin_shard.call("prepare_debit", transaction, origin_id, amount).result()
+
+            try:
+                destination_balance = destination_shard.call("deposit", destination_id, amount).result()
+            except Exception:
+                origin_shard.call("abort", transaction).result()
+                raise
+
+            # Requests to a shard are applied in order, so nothing has to wait for the hold to be dropped.
+            origin_shard.call("commit", transaction)
+
+        return Account(origin_id, origin_balance), Account(destination_id, destination_balance)
+
+    # Every operation waits for its shard, so operations issued together are simply applied in order.
+    @contextmanager
+    def deferred_durability(self) -> Iterator[None]:
+        yield
+
+    # This method runs an operation, a method of this service or a function taking it; nothing is logged,
+    # so there is never a sequence number to wait for.
+    def run_deferred(self, operation, *args, blocking: bool = True, **kwargs):
+        return operation(*args, **kwargs), None
+
+    def atomic(self, *account_ids: str):
+        raise AtomicBatchesUnavailable("Atomic batches are not available with sharded accounts")
+
+    @property
+    def shards(self) -> int:
+        return len(self._shards)
+
+    # This method returns the total amount held by cross-shard transfers in progress.
+    def holds(self) -> int:
+        return sum(future.result() for future in [shard.call("holds") for shard in self._shards])
+
+    def __len__(self) -> int:
+        return sum(future.result() for future in [shard.call("count") for shard in self._shards])
+
+    # This method stops every shard process.
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
+
+    def _shard(self, account_id: str) -> _Shard:
+        return self._shards[shard_of(account_id, len(self._shards))]
+
+    @contextmanager
+    def _shared(self) -> Iterator[None]:
+        with self._gate:
+            while self._resetting:
+                self._gate.wait()
+            self._transfers_in_progress += 1
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._transfers_in_progress -= 1
+                if self._transfers_in_progress == 0:
+                    self._gate.notify_all()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self._gate:
+            while self._resetting:
+                self._gate.wait()
+            self._resetting = True
+            while self._transfers_in_progress:
+                self._gate.wait()
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._resetting = False
+                self._gate.notify_all()
@@ -0,0 +1,165 @@
+import threading
+import time
+from array import array
+from typing import Iterable, Optional
+
+from app.domain.account import Account
+from app.infrastructure.snapshot import BALANCE_MAX, BALANCE_MIN, UnsupportedAccounts, write_snapshot
+
+# Number of accounts whose locks are held together while their balances are copied
+SCAN_CHUNK_SIZE = 1024
+
+
+# This class writes snapshots of the accounts of an AccountService, periodically from a background thread.
+# Writers are never paused for the whole copy: accounts are read in chunks, each under the locks of its
+# accounts only, and the snapshotter (registered as an observer of the service) records the balance of
+# every account changed while the copy runs. Once it is done, every lock is held just long enough to read
+# the position of the event log; the copied balances, updated with the recorded ones, are then the state
+# of every account at that position, and replaying the log from there on top of the snapshot rebuilds
+# the current state. The snapshot is published only once the events it includes are durable.
+#
+# The format cannot hold the account without ID nor balances beyond 64 bits. Without an event log, they are
+# left out of the snapshot (and listed in `skipped`), since it is the only copy of the other accounts. With
+# one, the snapshot is not written and UnsupportedAccounts is raised: leaving them out would drop their
+# events before the snapshot, while the previous snapshot and the log after it still rebuild them.
+class Snapshotter:
+    def __init__(self, service, path: str, interval: float = 300.0, clock=time.time):
+        self._service = service
+        self._path = path
+        self._interval = interval
+        self._clock = clock
+        # Balances of the accounts changed during the running copy; None when no copy is running
+        self._changes: Optional[dict[str, int]] = None
+        self._reset = False
+        # Serializes snapshots taken by the background thread and by callers of take()
+        self._taking = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.taken_at: Optional[float] = None
+        # Accounts left out of the last snapshot because the format cannot hold them
+        self.skipped: list[Optional[str]] = []
+        # Last error raised by a periodic snapshot, cleared by the next successful one
+        self.error: Optional[BaseException] = None
+
+    # This method starts taking a snapshot every `interval` seconds in a background thread.
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="snapshotter", daemon=True)
+        self._thread.start()
+
+    # This method stops the background thread and takes a last snapshot, so the next start replays nothing.
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.take()
+        except UnsupportedAccounts as error:
+            # Nothing is lost: the previous snapshot and the log after it still hold every account.
+            self.error = error
+
+    # This method writes a snapshot of the current state and returns the number of accounts in it.
+    def take(self) -> int:
+        with self._taking:
+            service = self._service
+            self._reset = False
+            self._changes = {}
+            try:
+                account_ids, balances = self._copy()
+
+                with service.locks.acquire_all():
+                    changes, self._changes = self._changes, None
+                    reset = self._reset
+                    offset, sequence = service.event_log.position() if service.event_log is not None else (-1, None)
+            finally:
+                self._changes = None
+
+            # After a reset, only the accounts changed since then exist, and each of them was recorded.
+            if reset:
+                account_ids, balances = [], []
+            _merge(account_ids, balances, changes)
+
+            account_ids, balances, self.skipped = _storable(account_ids, balances)
+            if self.skipped and offset >= 0:
+                raise UnsupportedAccounts(self.skipped)
+
+            if sequence is not None:
+                service.event_log.wait(sequence)
+
+            write_snapshot(self._path, account_ids, balances, offset)
+            self.taken_at = self._clock()
+            return len(account_ids)
+
+    # Observer callback: records the balances changed while a copy is running.
+    def balances_changed(self, accounts: Iterable[Account]) -> None:
+        changes = self._changes
+        if changes is not None:
+            for account in accounts:
+                changes[account.account_id] = account.balance
+
+    # Observer callback: every account was removed.
+    def reset(self) -> None:
+        changes = self._changes
+        if changes is not None:
+            changes.clear()
+            self._reset = True
+
+    # Copies the balance of every account, holding the locks of one chunk of accounts at a time so that no
+    # balance is read in the middle of an operation that could still be rolled back.
+    def _copy(self) -> tuple[list[str], list[int]]:
+        repository = self._service.repository
+        known_ids = [account_id for account_id, _ in repository.items()]
+        account_ids = []
+        balances = []
+
+        for start in range(0, len(known_ids), SCAN_CHUNK_SIZE):
+            chunk = known_ids[start:start + SCAN_CHUNK_SIZE]
+            with self._service.locks.acquire(*chunk):
+                for account_id in chunk:
+                    account = repository.get(account_id)
+                    if account is not None:
+                        account_ids.append(account_id)
+                        balances.append(account.balance)
+
+        return account_ids, balances
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            try:
+                self.take()
+                self.error = None
+            except Exception as error:
+                self.error = error
+
+
+# Applies the balances recorded during a copy to the copied ones, adding the accounts created meanwhile.
+def _merge(account_ids: list[str], balances: list[int], changes: dict[str, int]) -> None:
+    if not changes:
+        return
+
+    for index, account_id in enumerate(account_ids):
+        balance = changes.pop(account_id, None)
+        if balance is not None:
+            balances[index] = balance
+
+    for account_id, balance in changes.items():
+        account_ids.append(account_id)
+        balances.append(balance)
+
+
+# Splits off the accounts a snapshot cannot hold. It returns the others, with their balances as 64-bit
+# integers, and the IDs of those left out.
+def _storable(account_ids: list[str], balances: list[int]) -> tuple[list[str], array, list[Optional[str]]]:
+    if None not in account_ids:
+        try:
+            return account_ids, array("q", balances), []
+        except OverflowError:
+            pass
+
+    stored_ids, stored, skipped = [], array("q"), []
+    for account_id, balance in zip(account_ids, balances):
+        if account_id is None or not BALANCE_MIN <= balance <= BALANCE_MAX:
+            skipped.append(account_id)
+        else:
+            stored_ids.append(account_id)
+            stored.append(balance)
+    return stored_ids, stored, skipped
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from app.services.account_service import AccountService
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.domain.exceptions import InsufficientFunds
+
+
+class SlowInMemoryAccountRepository(InMemoryAccountRepository):
+    """
+    In-memory repository that yields the GIL on every read, so unsynchronized
+    read-check-save sequences would interleave between threads.
+    """
+
+    def get(self, account_id):
+        account = super().get(account_id)
+        time.sleep(0.0001)
+        return account
+
+
+def create_service():
+    repository = SlowInMemoryAccountRepository()
+    return AccountService(repository), repository
+
+
+def run_in_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_concurrent_withdrawals_never_overdraw():
+    """
+    Tests that concurrent withdrawals from the same account cannot all pass the
+    balance check: exactly as many succeed as the balance allows.
+    """
+    service, _ = create_service()
+    service.deposit(destination_id="100", amount=10)
+    succeeded = []
+
+    def withdraw():
+        try:
+            service.withdraw(origin_id="100", amount=1)
+            succeeded.append(True)
+        except InsufficientFunds:
+            pass
+
+    run_in_threads(withdraw, 30)
+
+    assert len(succeeded) == 10
+    assert service.get_balance("100") == 0
+
+
+def test_opposite_transfers_conserve_money_without_deadlock():
+    """
+    Tests that transfers A->B and B->A running concurrently neither deadlock
+    nor create or destroy money.
+    """
+    service, _ = create_service()
+    service.deposit(destination_id="A", amount=100)
+    service.deposit(destination_id="B", amount=100)
+
+    def transfer_back_and_forth():
+        for _ in range(20):
+            for origin, destination in (("A", "B"), ("B", "A")):
+                try:
+                    service.transfer(origin_id=origin, destination_id=destination, amount=7)
+                except InsufficientFunds:
+                    pass
+
+    run_in_threads(transfer_back_and_forth, 8)
+
+    assert service.get_balance("A") + service.get_balance("B") == 200
+    assert service.get_balance("A") >= 0
+    assert service.get_balance("B") >= 0
+
+
+def test_concurrent_deposits_are_all_applied():
+    """
+    Tests that no deposit is lost when many threads deposit into the same account.
+    """
+    service, _ = create_service()
+
+    def deposit():
+        for _ in range(10):
+            service.deposit(destination_id="100", amount=1)
+
+    run_in_threads(deposit, 10)
+
+    assert service.get_balance("100") == 100
@@ -1,8 +1,13 @@
+import threading
+import time
+
 import pytest
 
 from app.services.account_service import AccountService
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
 from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
-from app.domain.exceptions import AccountNotFound
+from app.domain.exceptions import AccountNotFound, InsufficientFunds
+from app.utils.reclaimer import reclaimer
 
 
 class TestAccountServiceReset:
@@ -34,4 +39,54 @@ class TestAccountServiceReset:
 
         # After reset, account should not exist
         with pytest.raises(AccountNotFound):
-            self.service.get_balance("100")
\ No newline at end of file
+            self.service.get_balance("100")
+
+    def test_reset_frees_the_previous_generation_in_the_background(self):
+        """
+        Given many accounts,
+        When reset is called,
+        Then the accounts are gone at once and their storage is emptied by the reclaimer.
+        """
+        for account_id in range(10000):
+            self.service.deposit(destination_id=str(account_id), amount=1)
+        accounts = self.repository._accounts
+
+        self.service.reset()
+
+        assert len(self.repository) == 0
+        assert reclaimer.wait(timeout=5)
+        assert len(accounts) == 0
+
+    def test_concurrent_transfers_land_wholly_before_or_after_a_reset(self):
+        """
+        Given deposits of 10 and transfers of 3 running between two accounts,
+        When reset is called concurrently,
+        Then the remaining money is always a whole number of deposits, split by a whole number of transfers:
+        a transfer cut in half by the reset would leave 3 too many or too few.
+        """
+        repository = ColumnarAccountRepository()
+        service = AccountService(repository)
+        stop = threading.Event()
+
+        def transfer():
+            while not stop.is_set():
+                service.deposit(destination_id="1", amount=10)
+                try:
+                    service.transfer(origin_id="1", destination_id="2", amount=3)
+                except (AccountNotFound, InsufficientFunds):
+                    pass
+
+        thread = threading.Thread(target=transfer)
+        thread.start()
+        try:
+            for _ in range(200):
+                # Lets the transfers run between resets, so that resets land in the middle of them.
+                time.sleep(0.001)
+                service.reset()
+                with service.locks.acquire_all():
+                    balances = dict(repository.items())
+                assert sum(balances.values()) % 10 == 0
+                assert balances.get("2", 0) % 3 == 0
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.routes as routes
+from app.main import app
+from app.api.routes import get_service
+from app.domain.account import Account
+from app.domain.exceptions import InvalidCursor
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.infrastructure.shared_memory_account_repository import SharedMemoryAccountRepository
+from app.infrastructure.sqlite_account_repository import SqliteAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_view import BalanceView
+
+
+@pytest.fixture(params=["memory", "columnar", "shared_memory", "sqlite"])
+def repository(request, tmp_path):
+    if request.param == "memory":
+        repository = InMemoryAccountRepository()
+    elif request.param == "columnar":
+        repository = ColumnarAccountRepository()
+    elif request.param == "shared_memory":
+        repository = SharedMemoryAccountRepository(str(tmp_path / "accounts"), capacity=256, lock_stripes=8)
+    else:
+        repository = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+
+    yield repository
+    close = getattr(repository, "close", None)
+    if close is not None:
+        close()
+
+
+def test_scan_returns_every_account_existing_for_the_whole_scan_once(repository):
+    """
+    Given accounts listed a few at a time
+    When accounts are created, changed and deleted between two pages
+    Then every account that existed for the whole scan is returned exactly once
+    """
+    for account in range(50):
+        repository.save(Account(f"{account:02}", account))
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        page, cursor = repository.scan(cursor, 7)
+        seen.extend(account_id for account_id, _ in page)
+        pages += 1
+
+        repository.save(Account(f"new-{pages}", 1))
+        repository.save(Account(f"{pages:02}", 1000))
+        repository.delete(f"new-{pages - 1}")
+
+        if cursor is None:
+            break
+
+    kept = [account_id for account_id in seen if not account_id.startswith("new-")]
+    assert sorted(kept) == [f"{account:02}" for account in range(50)]
+    assert len(set(seen)) == len(seen)
+
+
+def test_invalid_cursors_are_rejected(repository):
+    if isinstance(repository, SqliteAccountRepository):
+        pytest.skip("any account ID is a valid position in ID order")
+
+    with pytest.raises(InvalidCursor):
+        repository.scan("not a cursor", 10)
+
+
+class TestAccountsEndpoint:
+
+    def setup_method(self):
+        self.service = AccountService(InMemoryAccountRepository())
+        view = BalanceView(self.service.locks)
+        self.service.view = view
+        self.service.observers.append(view)
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_every_account_is_streamed(self, monkeypatch):
+        monkeypatch.setattr(routes, "ACCOUNTS_PAGE_SIZE", 3)
+        for account in range(10):
+            self.service.deposit(str(account), account + 1)
+        self.service.deposit("ação \"1\"", 5)
+
+        response = self.client.get("/accounts")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "next-cursor" not in response.headers
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines == [{"id": str(account), "balance": account + 1} for account in range(10)] + [{"id": "ação \"1\"", "balance": 5}]
+
+    def test_pages_are_followed_with_their_cursor(self):
+        for account in range(25):
+            self.service.deposit(str(account), 1)
+
+        listed = []
+        params = {"limit": 10}
+        while True:
+            response = self.client.get("/accounts", params=params)
+            listed += [json.loads(line)["id"] for line in response.text.splitlines()]
+            if "next-cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["next-cursor"]
+
+        assert listed == [str(account) for account in range(25)]
+
+    def test_the_listing_can_resume_after_a_page(self):
+        for account in range(5):
+            self.service.deposit(str(account), 1)
+
+        cursor = self.client.get("/accounts", params={"limit": 2}).headers["next-cursor"]
+        response = self.client.get("/accounts", params={"cursor": cursor})
+
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["2", "3", "4"]
+
+    def test_invalid_requests(self):
+        assert self.client.get("/accounts", params={"cursor": "%%%"}).status_code == 400
+        assert self.client.get("/accounts", params={"cursor": "eA"}).status_code == 400
+        assert self.client.get("/accounts", params={"limit": 0}).status_code == 422
+        assert self.client.get("/accounts").text == ""
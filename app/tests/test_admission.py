@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.routes as routes
+from app.main import app
+from app.api.admission import AdmissionControl, Overloaded, RateLimiter
+from app.api.routes import get_service
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_beyond_the_queue_are_refused_at_once():
+    """
+    Given one slot and a queue of one
+    When a third request arrives while the first two are in
+    Then it is refused immediately, and the queued one runs once the slot is freed
+    """
+    async def scenario():
+        admission = AdmissionControl(max_concurrency=1, max_queue=1, queue_timeout=5, retry_after=2)
+        release = asyncio.Event()
+        order = []
+
+        async def request(name):
+            async with admission.admit():
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(request("first"))
+        second = asyncio.create_task(request("second"))
+        await asyncio.sleep(0)
+        assert (admission.active, admission.queued) == (1, 1)
+
+        with pytest.raises(Overloaded) as refused:
+            await request("third")
+        assert refused.value.retry_after_header == "2"
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert (admission.active, admission.queued, admission.shed) == (0, 0, 1)
+
+    asyncio.run(scenario())
+
+
+def test_queued_requests_give_up_after_the_queue_timeout():
+    async def scenario():
+        admission = AdmissionControl(max_concurrency=1, max_queue=10, queue_timeout=0.01)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded):
+            async with admission.admit():
+                pass
+        assert admission.queued == 0
+
+        release.set()
+        await holder
+        async with admission.admit():
+            assert admission.active == 1
+        assert admission.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    async def scenario():
+        admission = AdmissionControl(max_concurrency=2, max_queue=100, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def request():
+            async with admission.admit():
+                await release.wait()
+
+        tasks = [asyncio.create_task(request()) for _ in range(20)]
+        await asyncio.sleep(0)
+        for task in tasks[5:15]:
+            task.cancel()
+
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert sum(isinstance(result, asyncio.CancelledError) for result in results) == 10
+        assert (admission.active, admission.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_rate_limiter_refills_over_time():
+    clock = Clock()
+    limiter = RateLimiter(rate=2, burst=3, clock=clock)
+
+    for _ in range(3):
+        limiter.check("1")
+    with pytest.raises(Overloaded) as refused:
+        limiter.check("1")
+    assert refused.value.retry_after == pytest.approx(0.5)
+
+    limiter.check("2")
+    clock.now = 0.5
+    limiter.check("1")
+    with pytest.raises(Overloaded):
+        limiter.check("1")
+    assert limiter.limited == 2
+
+    clock.now = 100
+    for _ in range(3):
+        limiter.check("1")
+
+
+def test_rate_limiter_forgets_the_least_recently_seen_accounts():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2, clock=Clock())
+    limiter.check("1")
+    limiter.check("2")
+    limiter.check("3")
+
+    assert len(limiter) == 2
+    limiter.check("1")
+    with pytest.raises(Overloaded):
+        limiter.check("3")
+
+
+class TestEventEndpoint:
+
+    def setup_method(self):
+        self.service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_events_over_the_account_rate_are_refused(self, monkeypatch):
+        monkeypatch.setattr(routes, "rate_limiter", RateLimiter(rate=0.25, burst=2, clock=Clock()))
+        deposit = {"type": "deposit", "destination": "1", "amount": 10}
+
+        statuses = [self.client.post("/event", json=deposit).status_code for _ in range(2)]
+        refused = self.client.post("/event", json=deposit)
+        other = self.client.post("/event", json={"type": "withdraw", "origin": "2", "amount": 1})
+
+        assert statuses == [201, 201]
+        assert refused.status_code == 429
+        assert refused.headers["retry-after"] == "4"
+        assert other.status_code == 404
+        assert self.service.get_balance("1") == 20
+
+    def test_events_are_refused_when_the_server_is_saturated(self, monkeypatch):
+        monkeypatch.setattr(routes, "admission", AdmissionControl(max_concurrency=0, max_queue=0, retry_after=3))
+
+        response = self.client.post(
+            "/event",
+            json={"type": "deposit", "destination": "1", "amount": 10},
+            headers={"Idempotency-Key": "retry-me"},
+        )
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
+        assert list(self.service.repository.items()) == []
+        assert len(routes.idempotency) == 0
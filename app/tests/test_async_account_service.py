@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.account_service import AccountService
+from app.services.async_account_service import AsyncAccountService
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.domain.exceptions import InsufficientFunds
+
+
+def create_service(event_log=None):
+    service = AccountService(InMemoryAccountRepository(), event_log=event_log)
+    return AsyncAccountService(service), service
+
+
+def test_operations_run_on_the_event_loop_thread():
+    """
+    Tests that, with a non-blocking repository, operations run inline on the
+    event loop thread instead of being dispatched to the threadpool.
+    """
+    async_service, service = create_service()
+    threads = []
+
+    def deposit(service, destination_id, amount):
+        threads.append(threading.current_thread())
+        return service.deposit(destination_id, amount)
+
+    async def scenario():
+        await async_service.run(deposit, "100", 10)
+        origin, destination = await async_service.transfer(origin_id="100", destination_id="200", amount=4)
+        return origin.balance, destination.balance, await async_service.get_balance("200")
+
+    assert asyncio.run(scenario()) == (6, 4, 4)
+    assert threads == [threading.main_thread()]
+
+
+def test_contended_lock_falls_back_to_the_threadpool():
+    """
+    Tests that an operation whose account lock is held by another thread waits
+    for it on the threadpool rather than blocking the event loop.
+    """
+    async_service, service = create_service()
+    service.deposit(destination_id="100", amount=10)
+    release = threading.Event()
+
+    def hold_lock():
+        with service.locks.acquire("100"):
+            release.wait()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+
+    async def scenario():
+        deposit = asyncio.ensure_future(async_service.deposit(destination_id="100", amount=5))
+        await asyncio.sleep(0.05)
+        # The loop is still free to serve other work while the deposit waits for the lock
+        assert not deposit.done()
+        release.set()
+        return (await deposit).balance
+
+    assert asyncio.run(scenario()) == 15
+    holder.join()
+
+
+def test_errors_are_raised_to_the_caller():
+    """
+    Tests that domain exceptions propagate through the async service.
+    """
+    async_service, _ = create_service()
+
+    async def scenario():
+        await async_service.deposit(destination_id="100", amount=1)
+        await async_service.withdraw(origin_id="100", amount=5)
+
+    with pytest.raises(InsufficientFunds):
+        asyncio.run(scenario())
+
+
+def test_durability_is_awaited(tmp_path):
+    """
+    Tests that an operation completes only once its event is in the log, and
+    that concurrent operations share the group commit.
+    """
+    path = str(tmp_path / "events.log")
+    async_service, service = create_service(EventLog(path, commit_window=0.01))
+
+    async def scenario():
+        await asyncio.gather(*(
+            async_service.deposit(destination_id=str(i), amount=1) for i in range(20)
+        ))
+        return len(list(EventLog.read(path)))
+
+    assert asyncio.run(scenario()) == 20
+    service.event_log.close()
@@ -0,0 +1,171 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.balance_aggregates as balance_aggregates
+from app.main import app
+from app.api.routes import get_service
+from app.domain.exceptions import AggregatesUnavailable, InsufficientFunds
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_aggregates import BalanceAggregates
+from app.services.balance_view import BalanceView
+
+
+def create_service(repository=None):
+    service = AccountService(repository if repository is not None else InMemoryAccountRepository())
+    view = BalanceView(service.locks, aggregates=BalanceAggregates())
+    view.seed(service.repository.items())
+    service.view = view
+    service.observers.append(view)
+    return service
+
+
+def test_aggregates_follow_every_operation():
+    service = create_service()
+    service.deposit("1", 100)
+    service.deposit("2", 50)
+    service.withdraw("1", 30)
+    service.transfer("2", "3", 20)
+    service.transfer("3", "3", 5)
+
+    assert service.get_aggregates(top=2) == (120, 3, [("1", 70), ("2", 30)])
+    assert service.get_aggregates(top=10) == (120, 3, [("1", 70), ("2", 30), ("3", 20)])
+
+    service.reset()
+    assert service.get_aggregates() == (0, 0, [])
+
+
+def test_rolled_back_batches_leave_the_aggregates_unchanged():
+    service = create_service()
+    service.deposit("1", 10)
+
+    with pytest.raises(InsufficientFunds):
+        with service.atomic("1", "2") as batch:
+            batch.deposit("2", 500)
+            batch.withdraw("1", 11)
+
+    assert service.get_aggregates() == (10, 1, [("1", 10)])
+
+
+def test_aggregates_start_from_the_seeded_balances():
+    repository = InMemoryAccountRepository()
+    AccountService(repository).deposit("1", 5)
+    AccountService(repository).deposit("2", 7)
+
+    service = create_service(repository)
+    service.deposit("3", 1)
+
+    assert service.get_aggregates(top=1) == (13, 3, [("2", 7)])
+
+
+def test_largest_balances_match_a_full_sort(monkeypatch):
+    """
+    Tests the sorted index against a full sort of the balances, with small buckets so that
+    buckets are split and emptied many times, and ties broken by account ID.
+    """
+    monkeypatch.setattr(balance_aggregates, "BUCKET_SIZE", 4)
+    generator = random.Random(7)
+    service = create_service()
+    balances = {}
+
+    for _ in range(3000):
+        account_id = str(generator.randrange(200))
+        amount = generator.randrange(1, 50)
+        if account_id in balances and balances[account_id] >= amount and generator.random() < 0.4:
+            service.withdraw(account_id, amount)
+            balances[account_id] -= amount
+        else:
+            service.deposit(account_id, amount)
+            balances[account_id] = balances.get(account_id, 0) + amount
+
+    expected = sorted(balances.items(), key=lambda item: (-item[1], item[0]))
+    assert service.get_aggregates(top=len(balances)) == (sum(balances.values()), len(balances), expected)
+
+
+def test_the_account_without_id_ties_with_other_accounts():
+    """
+    Given the account None, created by a deposit without destination
+    When another account reaches the same balance
+    Then both are ranked, and the aggregates still match the balances
+    """
+    service = create_service()
+    service.deposit(None, 10)
+    service.deposit("a", 10)
+    service.deposit("", 10)
+    service.withdraw("a", 10)
+
+    assert service.get_balance("a") == 0
+    assert service.get_aggregates(top=3) == (20, 3, [(None, 10), ("", 10), ("a", 0)])
+
+
+def test_a_failing_observer_does_not_split_the_view_from_the_repository(monkeypatch):
+    service = create_service()
+    service.deposit("1", 10)
+    subscriber = []
+
+    class Failing:
+        def balances_changed(self, accounts):
+            raise RuntimeError("observer failed")
+
+    class Recording:
+        def balances_changed(self, accounts):
+            subscriber.extend(account.account_id for account in accounts)
+
+    service.observers[:0] = [Failing()]
+    service.observers.append(Recording())
+    monkeypatch.setattr(BalanceAggregates, "apply", Failing.balances_changed)
+
+    with pytest.raises(RuntimeError):
+        service.deposit("2", 5)
+
+    assert service.get_balance("2") == service.repository.get("2").balance == 5
+    assert service.get_aggregates() == (15, 2, [("1", 10), ("2", 5)])
+    assert subscriber == ["2"]
+
+
+def test_aggregates_need_the_balance_view():
+    with pytest.raises(AggregatesUnavailable):
+        AccountService(InMemoryAccountRepository()).get_aggregates()
+
+
+class TestAggregatesEndpoint:
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_aggregates_are_returned(self):
+        service = create_service()
+        service.deposit("1", 10)
+        service.deposit("2", 30)
+        app.dependency_overrides[get_service] = lambda: service
+        client = TestClient(app)
+
+        response = client.get("/aggregates", params={"top": 1})
+
+        assert response.status_code == 200
+        assert response.json() == {"total": 40, "accounts": 2, "top": [{"id": "2", "balance": 30}]}
+        assert client.get("/aggregates", params={"top": 1001}).status_code == 422
+
+    def test_a_deposit_without_destination_ties_with_another_account(self):
+        service = create_service()
+        app.dependency_overrides[get_service] = lambda: service
+        client = TestClient(app)
+
+        first = client.post("/event", json={"type": "deposit", "amount": 10})
+        second = client.post("/event", json={"type": "deposit", "destination": "a", "amount": 10})
+
+        assert (first.status_code, second.status_code) == (201, 201)
+        assert client.get("/balance", params={"account_id": "a"}).text == "10"
+        assert client.get("/aggregates").json() == {
+            "total": 20,
+            "accounts": 2,
+            "top": [{"id": None, "balance": 10}, {"id": "a", "balance": 10}],
+        }
+
+    def test_aggregates_not_maintained(self):
+        service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: service
+
+        assert TestClient(app).get("/aggregates").status_code == 501
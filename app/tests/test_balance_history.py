@@ -0,0 +1,194 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_service
+from app.domain.exceptions import AccountNotFound, HistoryUnavailable
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_history import BalanceHistory, parse_timestamp
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_service(limit: int = 4096, clock=None):
+    clock = clock or FakeClock()
+    service = AccountService(InMemoryAccountRepository())
+    history = BalanceHistory(limit=limit, clock=clock)
+    service.history = history
+    service.observers.append(history)
+    return service, clock
+
+
+def test_balance_at_returns_the_balance_after_the_last_event_before_that_time():
+    """
+    Given deposits, withdrawals and transfers applied at different times
+    When the balance is queried at times between them
+    Then each query returns the balance right after the last event at or before that time
+    """
+    service, clock = create_service()
+
+    clock.now = 1010
+    service.deposit("100", 50)
+    clock.now = 1020
+    service.withdraw("100", 20)
+    clock.now = 1030
+    service.transfer("100", "200", 10)
+
+    assert service.get_balance_at("100", 1010) == 50
+    assert service.get_balance_at("100", 1015) == 50
+    assert service.get_balance_at("100", 1025) == 30
+    assert service.get_balance_at("100", 2000) == 20
+    assert service.get_balance_at("200", 1030) == 10
+
+    with pytest.raises(AccountNotFound):
+        service.get_balance_at("200", 1029)
+
+
+def test_reset_removes_accounts_from_later_queries_only():
+    service, clock = create_service()
+    clock.now = 1010
+    service.deposit("100", 50)
+    clock.now = 1020
+    service.reset()
+    clock.now = 1030
+    service.deposit("100", 5)
+
+    assert service.get_balance_at("100", 1015) == 50
+    with pytest.raises(AccountNotFound):
+        service.get_balance_at("100", 1025)
+    assert service.get_balance_at("100", 1030) == 5
+
+
+def test_resets_drop_the_history_before_the_previous_reset():
+    """
+    Given accounts created between successive resets
+    When another reset is applied
+    Then the accounts that did not change since the previous reset are dropped, and so is the history before it
+    """
+    service, clock = create_service()
+    history = service.history
+    for index in range(100):
+        clock.now = 1010 + index
+        service.deposit(f"old-{index}", 1)
+    clock.now = 1200
+    service.reset()
+    clock.now = 1210
+    service.deposit("new", 5)
+    service.deposit("old-0", 7)
+    clock.now = 1220
+    service.reset()
+
+    assert sorted(history._accounts) == ["new", "old-0"]
+    assert service.get_balance_at("new", 1215) == 5
+    assert service.get_balance_at("old-0", 1215) == 7
+    with pytest.raises(AccountNotFound):
+        service.get_balance_at("new", 1225)
+    with pytest.raises(HistoryUnavailable):
+        service.get_balance_at("old-1", 1100)
+
+    clock.now = 1230
+    service.reset()
+    assert not history._accounts
+
+
+def test_atomic_batches_and_self_transfers_are_recorded_once():
+    service, clock = create_service()
+    clock.now = 1010
+    with service.atomic("1", "2") as batch:
+        batch.deposit("1", 10)
+        batch.transfer("1", "2", 4)
+    clock.now = 1020
+    service.transfer("1", "1", 3)
+
+    assert service.get_balance_at("1", 1015) == 6
+    assert service.get_balance_at("2", 1015) == 4
+    assert len(service.history._accounts["1"].entries[0]) == 2
+
+
+def test_compaction_bounds_memory_and_reports_dropped_history():
+    """
+    Tests that an account keeps at most `limit` balances and that queries before the oldest kept one
+    report the history as unavailable instead of a wrong balance.
+    """
+    service, clock = create_service(limit=8)
+
+    for second in range(20):
+        clock.now = 1001 + second
+        service.deposit("1", 1)
+
+    times, balances = service.history._accounts["1"].entries
+    assert len(times) <= 8
+    assert service.get_balance_at("1", 1020) == 20
+    assert service.get_balance_at("1", times[0]) == balances[0]
+    with pytest.raises(HistoryUnavailable):
+        service.get_balance_at("1", 1001)
+
+
+def test_history_starts_with_the_seeded_balances():
+    clock = FakeClock(1000)
+    history = BalanceHistory(clock=clock)
+    history.seed([("1", 7)])
+
+    assert history.balance_at("1", 1000) == 7
+    with pytest.raises(HistoryUnavailable):
+        history.balance_at("1", 999)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("1700000000.5") == 1700000000.5
+    assert parse_timestamp("2023-11-14T22:13:20Z") == 1700000000
+    assert parse_timestamp("2023-11-14T22:13:20") == 1700000000
+    assert parse_timestamp("2023-11-15T00:13:20+02:00") == 1700000000
+    with pytest.raises(ValueError):
+        parse_timestamp("yesterday")
+    with pytest.raises(ValueError):
+        parse_timestamp("nan")
+
+
+class TestBalanceAtEndpoint:
+
+    def setup_method(self):
+        self.service, self.clock = create_service()
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_balance_at(self):
+        self.clock.now = 1010
+        self.client.post("/event", json={"type": "deposit", "destination": "100", "amount": 10})
+        self.clock.now = 1020
+        self.client.post("/event", json={"type": "deposit", "destination": "100", "amount": 5})
+
+        response = self.client.get("/balance", params={"account_id": "100", "at": "1015"})
+        assert response.status_code == 200
+        assert response.text == "10"
+
+        response = self.client.get("/balance", params={"account_id": "100", "at": "1970-01-01T00:17:00Z"})
+        assert response.status_code == 200
+        assert response.text == "15"
+
+        response = self.client.get("/balance", params={"account_id": "100", "at": "1005"})
+        assert response.status_code == 404
+        assert response.text == "0"
+
+    def test_invalid_and_unavailable_times(self):
+        response = self.client.get("/balance", params={"account_id": "100", "at": "soon"})
+        assert response.status_code == 400
+
+        response = self.client.get("/balance", params={"account_id": "100", "at": "10"})
+        assert response.status_code == 410
+
+    def test_history_disabled(self):
+        self.service.history = None
+
+        response = self.client.get("/balance", params={"account_id": "100", "at": "1015"})
+        assert response.status_code == 410
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.main import app
+from app.api.routes import get_service
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_subscriptions import BalanceSubscriptions, Subscription
+from app.services.balance_view import BalanceView
+from app.services.event_pipeline import EventPipeline
+
+
+def create_service(view: bool = False) -> AccountService:
+    service = AccountService(InMemoryAccountRepository())
+    if view:
+        service.view = BalanceView(service.locks)
+        service.observers.append(service.view)
+    service.subscriptions = BalanceSubscriptions()
+    service.observers.append(service.subscriptions)
+    return service
+
+
+@pytest.mark.parametrize("view", [False, True])
+def test_subscribers_receive_current_balances_then_their_changes(view):
+    """
+    Given a subscription to two accounts, one of which exists
+    When deposits, a transfer and an operation on another account are applied
+    Then it receives the existing balance first, then the latest balance of each account it follows
+    """
+    async def scenario():
+        service = create_service(view)
+        service.deposit("100", 10)
+        subscription = Subscription(["100", "300"])
+        service.subscribe(subscription)
+        first = await subscription.changes(timeout=1)
+
+        service.deposit("100", 5)
+        service.deposit("100", 5)
+        service.transfer("100", "300", 15)
+        service.deposit("200", 1)
+        second = await subscription.changes(timeout=1)
+        idle = await subscription.changes(timeout=0.01)
+        return first, second, idle
+
+    first, second, idle = asyncio.run(scenario())
+
+    assert first.balances == {"100": 10}
+    assert (second.reset, second.dropped, second.balances) == (False, 0, {"100": 5, "300": 15})
+    assert idle is None
+
+
+def test_a_slow_subscriber_neither_grows_nor_blocks_writers():
+    async def scenario():
+        service = create_service()
+        subscription = Subscription([str(index) for index in range(100)], buffer_size=4)
+        service.subscribe(subscription)
+
+        for round in range(50):
+            for index in range(100):
+                service.deposit(str(index), 1)
+
+        assert len(subscription._pending) == 4
+        return await subscription.changes(timeout=1)
+
+    update = asyncio.run(scenario())
+
+    assert update.dropped == 100 * 50 - 4
+    assert update.balances == {"96": 50, "97": 50, "98": 50, "99": 50}
+
+
+def test_changes_applied_on_other_threads_and_by_the_pipeline_wake_the_subscriber():
+    async def scenario():
+        service = create_service()
+        pipeline = EventPipeline(service)
+        subscription = Subscription(["1"])
+        service.subscribe(subscription)
+
+        thread = threading.Thread(target=lambda: [service.deposit("1", 1) for _ in range(100)])
+        thread.start()
+        seen = []
+        while not seen or seen[-1] < 100:
+            seen.append((await subscription.changes(timeout=1)).balances["1"])
+        thread.join()
+
+        pipeline.submit(("1",), lambda operations: operations.withdraw("1", 30)).result()
+        pipeline.close()
+        seen.append((await subscription.changes(timeout=1)).balances["1"])
+        return seen
+
+    seen = asyncio.run(scenario())
+
+    assert seen == sorted(seen[:-1]) + [70]
+    assert seen[-2] == 100
+
+
+def test_a_reset_discards_pending_changes():
+    async def scenario():
+        service = create_service()
+        subscription = Subscription(["1"])
+        service.subscribe(subscription)
+        service.deposit("1", 10)
+        service.reset()
+        service.deposit("1", 3)
+        update = await subscription.changes(timeout=1)
+        service.unsubscribe(subscription)
+        service.deposit("1", 3)
+        return update, await subscription.changes(timeout=0.01), len(service.subscriptions)
+
+    update, after_unsubscribe, subscribers = asyncio.run(scenario())
+
+    assert (update.reset, update.balances) == (True, {"1": 3})
+    assert after_unsubscribe is None
+    assert subscribers == 0
+
+
+# Sends a GET request to the app and returns a queue of the messages it sends, and an event that disconnects the client.
+def open_request(query: bytes) -> tuple[asyncio.Task, asyncio.Queue, asyncio.Event]:
+    messages = asyncio.Queue()
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/subscribe",
+        "raw_path": b"/subscribe",
+        "query_string": query,
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    task = asyncio.create_task(app(scope, receive, messages.put))
+    return task, messages, disconnected
+
+
+class TestSubscribeEndpoint:
+
+    def run(self, service, scenario):
+        app.dependency_overrides[get_service] = lambda: service
+        try:
+            return asyncio.run(scenario())
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_balance_changes_are_streamed_as_server_sent_events(self):
+        service = create_service()
+        service.deposit("100", 10)
+
+        async def scenario():
+            task, messages, disconnect = open_request(b"account_id=100&account_id=300")
+            start = await asyncio.wait_for(messages.get(), 1)
+            initial = await asyncio.wait_for(messages.get(), 1)
+
+            service.transfer("100", "300", 4)
+            changed = await asyncio.wait_for(messages.get(), 1)
+            service.reset()
+            reset = await asyncio.wait_for(messages.get(), 1)
+
+            disconnect.set()
+            await asyncio.wait_for(task, 1)
+            return start, initial["body"], changed["body"], reset["body"]
+
+        start, initial, changed, reset = self.run(service, scenario)
+
+        assert start["status"] == 200
+        assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+        assert initial == b'event: balances\ndata: {"100":10}\n\n'
+        assert changed == b'event: balances\ndata: {"100":6,"300":4}\n\n'
+        assert reset == b"event: reset\ndata: {}\n\n"
+        assert len(service.subscriptions) == 0
+
+    @pytest.mark.parametrize("query, status_code", [(b"", 400), (b"account_id=1", 501)])
+    def test_invalid_or_unavailable_subscriptions_are_refused(self, query, status_code):
+        service = AccountService(InMemoryAccountRepository())
+
+        async def scenario():
+            task, messages, _ = open_request(query)
+            await asyncio.wait_for(task, 1)
+            return await messages.get()
+
+        assert self.run(service, scenario)["status"] == status_code
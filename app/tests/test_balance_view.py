@@ -0,0 +1,132 @@
+import sys
+import threading
+
+import pytest
+
+from app.config import Settings
+from app.container import build_service, close_service
+from app.domain.exceptions import AccountNotFound, InsufficientFunds
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_view import BalanceView
+
+
+def create_service(repository=None):
+    service = AccountService(repository if repository is not None else InMemoryAccountRepository())
+    view = BalanceView(service.locks)
+    service.view = view
+    service.observers.append(view)
+    return service
+
+
+@pytest.fixture
+def fast_switching():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_balances_are_read_from_the_view():
+    service = create_service(ColumnarAccountRepository())
+    service.deposit("1", 10)
+    service.transfer("1", "2", 4)
+
+    assert service.get_balance("1") == 6
+    assert service.get_balances("1", "2", "missing") == {"1": 6, "2": 4}
+    with pytest.raises(AccountNotFound):
+        service.get_balance("missing")
+
+    service.reset()
+    with pytest.raises(AccountNotFound):
+        service.get_balance("1")
+    assert service.get_balances("1", "2") == {}
+
+
+def test_balances_of_a_batch_are_not_visible_before_it_commits():
+    """
+    Given an atomic batch that withdraws from an account and then fails
+    When the balance is read in the middle of the batch and after it was rolled back
+    Then both reads return the balance before the batch
+    """
+    service = create_service()
+    service.deposit("1", 10)
+    seen = []
+
+    with pytest.raises(InsufficientFunds):
+        with service.atomic("1", "2") as batch:
+            batch.transfer("1", "2", 7)
+            seen.append(service.get_balance("1"))
+            batch.withdraw("1", 7)
+
+    assert seen == [10]
+    assert service.get_balance("1") == 10
+    assert service.get_balances("2") == {}
+
+
+def test_seeded_balances_are_served():
+    repository = InMemoryAccountRepository()
+    AccountService(repository).deposit("1", 5)
+    service = AccountService(repository)
+    view = BalanceView(service.locks)
+    view.seed(repository.items())
+    service.view = view
+
+    assert service.get_balance("1") == 5
+
+
+@pytest.mark.parametrize("with_view", [True, False])
+def test_transfers_are_never_seen_half_applied(fast_switching, with_view):
+    """
+    Tests that reads of two accounts always add up to the money they hold, while transfers move it
+    back and forth between them, whether the balances come from the view or from the locked repository.
+    """
+    service = create_service() if with_view else AccountService(InMemoryAccountRepository())
+    service.deposit("1", 1000)
+    service.deposit("2", 1000)
+    stop = threading.Event()
+    totals = set()
+
+    def transfer():
+        for index in range(2000):
+            if index % 2:
+                service.transfer("1", "2", 3)
+            else:
+                service.transfer("2", "1", 3)
+        stop.set()
+
+    def read():
+        while not stop.is_set():
+            balances = service.get_balances("1", "2")
+            totals.add(balances["1"] + balances["2"])
+
+    threads = [threading.Thread(target=transfer), threading.Thread(target=read), threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert totals == {2000}
+
+
+def test_the_view_is_only_built_for_repositories_owned_by_the_process(tmp_path):
+    settings = Settings()
+    settings.event_log_path = None
+    settings.snapshot_path = None
+
+    settings.account_repository = "memory"
+    service = build_service(settings)
+    assert service.view is None
+    close_service(service)
+
+    settings.balance_view = True
+    service = build_service(settings)
+    assert service.view is not None
+    close_service(service)
+
+    settings.account_repository = "sqlite"
+    settings.sqlite_path = str(tmp_path / "accounts.db")
+    service = build_service(settings)
+    assert service.view is None
+    close_service(service)
@@ -0,0 +1,53 @@
+import asyncio
+
+from app.benchmarks.__main__ import main, percentile, run_asgi, run_service
+from app.benchmarks.workload import Workload
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+
+def test_workload_is_reproducible_and_follows_the_mix():
+    """
+    Tests that a workload replays the same events for the same seed and only generates the requested types.
+    """
+    workload = Workload(events=500, accounts=50, deposit=1, withdraw=0, transfer=1, hot_accounts=5, hot_share=1.0)
+
+    events = list(workload)
+
+    assert events == list(workload)
+    assert {event["type"] for event in events} == {"deposit", "transfer"}
+    assert all(int(event.get("destination", event.get("origin"))) < 5 for event in events)
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.99) == 0.0
+
+
+def test_service_and_asgi_reports():
+    """
+    Tests that both targets replay every event and report throughput and latency percentiles.
+    """
+    workload = Workload(events=200, accounts=20)
+
+    service_report = run_service(workload, AccountService(InMemoryAccountRepository()))
+    asgi_report = asyncio.run(run_asgi(workload, AccountService(InMemoryAccountRepository()), concurrency=4))
+
+    assert service_report["events"] == 200
+    assert sum(service_report["outcomes"].values()) == 200
+    assert asgi_report["events"] == 200
+    assert sum(asgi_report["outcomes"].values()) == 200
+    for report in (service_report, asgi_report):
+        assert report["throughput"] > 0
+        latency = report["latency_us"]
+        assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+
+
+def test_main_accepts_command_line_options():
+    report = main(["--events", "100", "--accounts", "10", "--repository", "columnar", "--transfer", "0"])
+
+    assert report["repository"] == "columnar"
+    assert report["events"] == 100
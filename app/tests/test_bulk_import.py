@@ -0,0 +1,213 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.bulk_import as bulk_import
+import app.api.routes as routes
+from app.main import app
+from app.api.routes import get_service
+from app.api.bulk_import import detect_format, import_file
+from app.importer.__main__ import main as importer_main
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+
+def run_import(service, tmp_path, content: bytes, format: str = "csv"):
+    path = tmp_path / "import"
+    path.write_bytes(content)
+    with open(path, "rb") as file:
+        return import_file(service, file, format)
+
+
+def test_csv_import(tmp_path):
+    """
+    Given a CSV file with a header, a quoted ID, Windows line endings and a blank line
+    When it is imported
+    Then every row is credited to its account, on top of the existing balances
+    """
+    service = AccountService(InMemoryAccountRepository())
+    service.deposit("1", 5)
+
+    report = run_import(service, tmp_path, b'account_id,amount\r\n1,10\r\n"a,b",7\r\n\r\n2,3\r\n1,1')
+
+    assert report.as_dict()["rows"] == 4
+    assert (report.imported, report.rejected, report.errors) == (4, 0, [])
+    assert service.get_balances("1", "2", "a,b") == {"1": 16, "2": 3, "a,b": 7}
+
+
+def test_invalid_rows_are_reported_with_their_line(tmp_path):
+    service = AccountService(InMemoryAccountRepository())
+    content = b"\n".join([
+        b"1,10",
+        b"2,ten",
+        b"3,0",
+        b"4,-5",
+        b"5",
+        b",6",
+        b"\xff\xfe,7",
+        b'"8,9',
+        b"9,1.5",
+        b"10,20",
+    ])
+
+    report = run_import(service, tmp_path, content)
+
+    assert (report.rows, report.imported, report.rejected) == (10, 2, 8)
+    assert sorted(error["line"] for error in report.errors) == [2, 3, 4, 5, 6, 7, 8, 9]
+    assert service.get_balances("1", "10", "2", "8") == {"1": 10, "10": 20}
+
+
+def test_small_chunks_and_batches_give_the_same_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_import, "READ_CHUNK_SIZE", 16)
+    monkeypatch.setattr(bulk_import, "APPLY_BATCH_SIZE", 3)
+    service = AccountService(InMemoryAccountRepository())
+    lines = [f"{account % 7},{account + 1}" for account in range(100)]
+    lines[50] = "1,x"
+
+    report = run_import(service, tmp_path, "\n".join(lines).encode())
+
+    assert (report.rows, report.imported, report.rejected) == (100, 99, 1)
+    assert report.errors == [{"line": 51, "error": "amount must be an integer"}]
+    expected = {}
+    for account in range(100):
+        if account != 50:
+            expected[str(account % 7)] = expected.get(str(account % 7), 0) + account + 1
+    assert service.get_balances(*expected) == expected
+
+
+def test_ndjson_import_round_trips_a_listing(tmp_path):
+    source = AccountService(InMemoryAccountRepository())
+    for account in range(20):
+        source.deposit(f"ação {account}", account + 1)
+    page, _ = source.scan(None, 100)
+    listing = "".join(json.dumps({"id": account_id, "balance": balance}) + "\n" for account_id, balance in page)
+
+    target = AccountService(InMemoryAccountRepository())
+    report = run_import(target, tmp_path, listing.encode(), "ndjson")
+
+    assert (report.imported, report.rejected) == (20, 0)
+    assert sorted(target.repository.items()) == sorted(source.repository.items())
+
+
+def test_invalid_ndjson_rows_are_reported(tmp_path):
+    service = AccountService(InMemoryAccountRepository())
+    content = b"\n".join([
+        b'{"id": "1", "amount": 4}',
+        b'{"id": "2", "amount": "5"}',
+        b'{"id": "3"',
+        b'[1, 2]',
+        b'{"id": 4, "amount": 1}',
+        b'{"id": "5"}',
+        b'{"id": "6", "amount": 1.5}',
+    ])
+
+    report = run_import(service, tmp_path, content, "ndjson")
+
+    assert (report.rows, report.imported, report.rejected) == (7, 2, 5)
+    assert sorted(error["line"] for error in report.errors) == [3, 4, 5, 6, 7]
+    assert service.get_balances("1", "2") == {"1": 4, "2": 5}
+
+
+def test_rows_rejected_by_the_repository_do_not_stop_the_batch(tmp_path):
+    service = AccountService(ColumnarAccountRepository())
+
+    report = run_import(service, tmp_path, f"1,5\n2,{2 ** 63}\n3,7\n".encode())
+
+    assert (report.imported, report.rejected) == (2, 1)
+    assert report.errors[0]["line"] == 2
+    assert service.get_balances("1", "2", "3") == {"1": 5, "3": 7}
+
+
+def test_an_unexpected_error_undoes_the_batch_without_an_event_log():
+    repository = InMemoryAccountRepository()
+    service = AccountService(repository)
+    service.deposit("1", 5)
+    save = repository.save
+
+    def failing_save(account):
+        if account.account_id == "3":
+            raise RuntimeError("disk full")
+        save(account)
+
+    repository.save = failing_save
+    with pytest.raises(RuntimeError):
+        service.deposit_many([("1", 10), ("2", 20), ("3", 30)])
+
+    repository.save = save
+    assert sorted(repository.items()) == [("1", 5)]
+
+
+def test_imported_rows_are_logged_as_deposits(tmp_path):
+    path = tmp_path / "events.log"
+    service = AccountService(InMemoryAccountRepository(), event_log=EventLog(str(path), commit_window=0))
+
+    run_import(service, tmp_path, b"1,5\n2,x\n1,7\n")
+    service.event_log.close()
+
+    assert list(EventLog.read(str(path))) == [
+        {"type": "deposit", "destination": "1", "amount": 5},
+        {"type": "deposit", "destination": "1", "amount": 7},
+    ]
+
+
+def test_format_is_detected_from_the_file_name():
+    assert detect_format("accounts.NDJSON") == "ndjson"
+    assert detect_format("accounts.jsonl") == "ndjson"
+    assert detect_format("balances.csv") == "csv"
+
+
+def test_the_importer_refuses_to_lose_the_imported_balances(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("EVENT_LOG_PATH", raising=False)
+    monkeypatch.delenv("SNAPSHOT_PATH", raising=False)
+    monkeypatch.setenv("ACCOUNT_REPOSITORY", "memory")
+    path = tmp_path / "balances.csv"
+    path.write_bytes(b"1,5\n")
+
+    with pytest.raises(SystemExit):
+        importer_main([str(path)])
+    assert "would be lost" in capsys.readouterr().err
+
+
+class TestImportEndpoint:
+
+    @pytest.fixture(autouse=True)
+    def import_token(self, monkeypatch):
+        monkeypatch.setattr(routes.settings, "import_token", "secret")
+
+    def setup_method(self):
+        self.service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.client = TestClient(app, headers={"X-Import-Token": "secret"})
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_the_import_token_is_required(self, monkeypatch):
+        assert self.client.post("/admin/import", content=b"1,10\n", headers={"X-Import-Token": "wrong"}).status_code == 403
+        assert TestClient(app).post("/admin/import", content=b"1,10\n").status_code == 403
+
+        monkeypatch.setattr(routes.settings, "import_token", None)
+        assert self.client.post("/admin/import", content=b"1,10\n").status_code == 404
+        assert len(self.service.repository) == 0
+
+    def test_csv_body_is_imported(self):
+        response = self.client.post("/admin/import", content=b"id,amount\n1,10\n2,x\n", headers={"Content-Type": "text/csv"})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["rows"], body["imported"], body["rejected"]) == (2, 1, 1)
+        assert body["errors"] == [{"line": 3, "error": "amount must be an integer"}]
+        assert self.service.get_balance("1") == 10
+
+    def test_format_follows_the_content_type(self):
+        response = self.client.post(
+            "/admin/import",
+            content=b'{"id": "1", "amount": 3}\n',
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.json()["imported"] == 1
+        assert self.client.post("/admin/import", params={"format": "xml"}, content=b"").status_code == 400
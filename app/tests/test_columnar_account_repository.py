@@ -0,0 +1,86 @@
+import tracemalloc
+
+import pytest
+
+from app.services.account_service import AccountService
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.domain.exceptions import BalanceOutOfRange
+
+
+def create_service():
+    repository = ColumnarAccountRepository()
+    return AccountService(repository), repository
+
+
+def test_operations_are_written_back_to_the_columns():
+    """
+    Tests that deposits, withdrawals and transfers update the balance buffer,
+    since get() returns copies.
+    """
+    service, repository = create_service()
+
+    service.deposit(destination_id="100", amount=50)
+    service.withdraw(origin_id="100", amount=10)
+    service.transfer(origin_id="100", destination_id="200", amount=15)
+    service.transfer(origin_id="200", destination_id="200", amount=5)
+
+    assert repository.get("100").balance == 25
+    assert repository.get("200").balance == 15
+    assert sorted(repository.items()) == [("100", 25), ("200", 15)]
+
+
+def test_deleted_slots_are_reused():
+    """
+    Tests that a slot freed by delete is reused by the next new account.
+    """
+    service, repository = create_service()
+    service.deposit(destination_id="1", amount=1)
+    service.deposit(destination_id="2", amount=2)
+
+    repository.delete("1")
+    service.deposit(destination_id="3", amount=3)
+
+    assert len(repository) == 2
+    assert repository.get("1") is None
+    assert list(repository.items()) == [("3", 3), ("2", 2)]
+
+
+def test_balance_overflow_leaves_accounts_unchanged():
+    """
+    Tests that a transfer that would overflow the destination balance is
+    rejected before the origin is debited.
+    """
+    service, repository = create_service()
+    service.deposit(destination_id="origin", amount=10)
+    service.deposit(destination_id="full", amount=2 ** 63 - 5)
+
+    with pytest.raises(BalanceOutOfRange):
+        service.transfer(origin_id="origin", destination_id="full", amount=10)
+
+    assert repository.get("origin").balance == 10
+    assert repository.get("full").balance == 2 ** 63 - 5
+
+
+def measure(repository, count):
+    service = AccountService(repository)
+    tracemalloc.start()
+    for i in range(count):
+        service.deposit(destination_id=str(i), amount=i + 1)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def test_uses_less_memory_than_account_objects():
+    """
+    Tests that the columnar layout needs less memory per account than one Account object per account:
+    about 125-140 bytes with the ID strings, which both layouts keep, against 160-180 bytes.
+    The bound leaves room for allocator and dictionary sizing differences between Python builds.
+    """
+    count = 20000
+    columnar = measure(ColumnarAccountRepository(), count) / count
+    objects = measure(InMemoryAccountRepository(), count) / count
+
+    assert columnar < 150
+    assert columnar < objects
@@ -0,0 +1,179 @@
+import fcntl
+import os
+import threading
+
+import pytest
+
+from app.services.account_service import AccountService
+import app.infrastructure.event_log as event_log_module
+from app.infrastructure.event_log import EventLog, EventLogError
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.domain.exceptions import InsufficientFunds
+
+
+def create_service(path):
+    repository = InMemoryAccountRepository()
+    event_log = EventLog(str(path), commit_window=0.001)
+    return AccountService(repository, event_log=event_log), repository
+
+
+def test_applied_events_are_written_to_the_log(tmp_path):
+    """
+    Tests that deposits, withdrawals and transfers are durable once acknowledged.
+    """
+    path = tmp_path / "events.log"
+    service, _ = create_service(path)
+
+    service.deposit(destination_id="100", amount=50)
+    service.withdraw(origin_id="100", amount=5)
+    service.transfer(origin_id="100", destination_id="200", amount=15)
+
+    # Read before close: every acknowledged event must already be on disk
+    events = list(EventLog.read(str(path)))
+    service.event_log.close()
+
+    assert events == [
+        {"type": "deposit", "destination": "100", "amount": 50},
+        {"type": "withdraw", "origin": "100", "amount": 5},
+        {"type": "transfer", "origin": "100", "destination": "200", "amount": 15},
+    ]
+
+
+def test_failed_operations_are_not_logged(tmp_path):
+    """
+    Tests that an operation rejected by the service leaves no trace in the log.
+    """
+    path = tmp_path / "events.log"
+    service, _ = create_service(path)
+
+    service.deposit(destination_id="100", amount=10)
+    with pytest.raises(InsufficientFunds):
+        service.withdraw(origin_id="100", amount=20)
+    service.event_log.close()
+
+    assert len(list(EventLog.read(str(path)))) == 1
+
+
+def test_replay_rebuilds_the_repository(tmp_path):
+    """
+    Tests that replaying the log into an empty repository restores every balance,
+    including the effect of a reset.
+    """
+    path = tmp_path / "events.log"
+    service, _ = create_service(path)
+
+    service.deposit(destination_id="300", amount=99)
+    service.reset()
+    service.deposit(destination_id="100", amount=50)
+    service.transfer(origin_id="100", destination_id="200", amount=20)
+    service.event_log.close()
+
+    restored = AccountService(InMemoryAccountRepository())
+    applied = restored.replay(EventLog.read(str(path)))
+
+    assert applied == 4
+    assert restored.get_balance("100") == 30
+    assert restored.get_balance("200") == 20
+    assert restored.repository.get("300") is None
+
+
+def test_concurrent_appends_share_group_commits(tmp_path):
+    """
+    Tests that events committed from many threads are all persisted.
+    """
+    path = tmp_path / "events.log"
+    event_log = EventLog(str(path), commit_window=0.005)
+
+    threads = [
+        threading.Thread(
+            target=event_log.commit,
+            args=({"type": "deposit", "destination": str(i), "amount": 1},),
+        )
+        for i in range(50)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    event_log.close()
+
+    assert len(list(EventLog.read(str(path)))) == 50
+
+
+def test_partial_last_line_is_discarded(tmp_path):
+    """
+    Tests that a line left incomplete by a crash is ignored on read and
+    dropped before new events are appended.
+    """
+    path = tmp_path / "events.log"
+    path.write_bytes(b'{"type":"deposit","destination":"1","amount":5}\n{"type":"dep')
+
+    assert len(list(EventLog.read(str(path)))) == 1
+
+    event_log = EventLog(str(path), commit_window=0)
+    event_log.commit({"type": "withdraw", "origin": "1", "amount": 2})
+    event_log.close()
+
+    assert [event["type"] for event in EventLog.read(str(path))] == ["deposit", "withdraw"]
+
+
+def test_log_cannot_be_opened_twice_exclusively(tmp_path):
+    """
+    Tests that a second exclusive writer on the same file is refused, since its
+    events would come from a different ledger.
+    """
+    path = tmp_path / "events.log"
+    event_log = EventLog(str(path))
+
+    with pytest.raises(EventLogError):
+        EventLog(str(path))
+
+    event_log.close()
+
+
+def test_shared_log_waits_for_a_worker_dropping_the_tail(tmp_path, monkeypatch):
+    """
+    Tests that a worker opening a shared log while another one holds it exclusively, to drop a partial
+    tail, waits for it instead of failing, and that an exclusive holder that never lets go is refused.
+    """
+    path = tmp_path / "events.log"
+    path.write_bytes(b"")
+    holder = os.open(str(path), os.O_RDONLY)
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    releaser = threading.Timer(0.2, fcntl.flock, (holder, fcntl.LOCK_UN))
+    releaser.start()
+
+    event_log = EventLog(str(path), shared=True)
+    event_log.close()
+    releaser.join()
+
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    monkeypatch.setattr(event_log_module, "SHARED_LOCK_TIMEOUT", 0.05)
+    try:
+        with pytest.raises(EventLogError):
+            EventLog(str(path), shared=True)
+    finally:
+        os.close(holder)
+
+
+def test_operations_are_refused_after_a_write_failure(tmp_path):
+    """
+    Tests that once the log has failed, appends raise and the service refuses
+    to change balances that could not be persisted.
+    """
+    service, repository = create_service(tmp_path / "events.log")
+    service.deposit(destination_id="100", amount=10)
+
+    # Make the next write fail
+    os.close(service.event_log._fd)
+
+    with pytest.raises(EventLogError):
+        service.transfer(origin_id="100", destination_id="200", amount=5)
+    with pytest.raises(EventLogError):
+        service.event_log.append({"type": "reset"})
+    with pytest.raises(EventLogError):
+        service.withdraw(origin_id="100", amount=5)
+
+    # The transfer whose write failed was undone
+    assert repository.get("100").balance == 10
+    assert repository.get("200") is None
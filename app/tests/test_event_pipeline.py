@@ -0,0 +1,173 @@
+import random
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.event_processing import apply_event
+from app.api.routes import get_service
+from app.api.schemas import EventRequest
+from app.domain.exceptions import BalanceOutOfRange, InsufficientFunds
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.balance_view import BalanceView
+from app.services.event_pipeline import EventPipeline
+
+
+def random_events(count: int, seed: int = 3) -> list[EventRequest]:
+    generator = random.Random(seed)
+    events = []
+    for _ in range(count):
+        kind = generator.choice(("deposit", "deposit", "withdraw", "transfer"))
+        account = generator.choice(("hot", "hot", "hot", "a", "b", "c"))
+        other = generator.choice(("hot", "a", "b", "c", "d"))
+        amount = generator.randrange(-1, 40)
+        if kind == "deposit":
+            events.append(EventRequest(type="deposit", destination=account, amount=amount))
+        elif kind == "withdraw":
+            events.append(EventRequest(type="withdraw", origin=account, amount=amount))
+        else:
+            events.append(EventRequest(type="transfer", origin=account, destination=other, amount=amount))
+    return events
+
+
+def outcome(function, *args):
+    try:
+        return function(*args)
+    except Exception as error:
+        return type(error)
+
+
+# Holds the lock of an account so the writer waits on its first batch while the next operations are queued.
+class HeldAccount:
+    def __init__(self, service: AccountService, account_id: str):
+        self._locks = service.locks.acquire(account_id)
+
+    def __enter__(self):
+        self._locks.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._locks.__exit__(*exc_info)
+
+
+def test_batched_operations_match_sequential_ones():
+    """
+    Given the same events applied one by one and through the pipeline
+    When they include rejected events and runs of deposits to a hot account
+    Then every result, error and final balance is the same
+    """
+    events = random_events(2000)
+    sequential = AccountService(InMemoryAccountRepository())
+    expected = [outcome(apply_event, sequential, event) for event in events]
+
+    service = AccountService(InMemoryAccountRepository())
+    pipeline = EventPipeline(service, max_batch=64)
+    futures = [pipeline.submit((event.origin, event.destination), apply_event, event) for event in events]
+    results = [outcome(lambda future: future.result()[0], future) for future in futures]
+    pipeline.close()
+
+    assert results == expected
+    assert sorted(service.repository.items()) == sorted(sequential.repository.items())
+
+
+def test_concurrent_deposits_to_a_hot_account_are_coalesced():
+    service = AccountService(InMemoryAccountRepository())
+    pipeline = EventPipeline(service)
+    event = EventRequest(type="deposit", destination="hot", amount=1)
+    balances = []
+
+    def client():
+        for _ in range(500):
+            balances.append(pipeline.submit(("hot", None), apply_event, event).result()[0]["destination"]["balance"])
+
+    threads = [threading.Thread(target=client) for _ in range(8)]
+    with HeldAccount(service, "hot"):
+        for thread in threads:
+            thread.start()
+    for thread in threads:
+        thread.join()
+    pipeline.close()
+
+    assert service.get_balance("hot") == 4000
+    assert sorted(balances) == list(range(1, 4001))
+    assert pipeline.operations == 4000
+    assert pipeline.batches < 4000
+
+
+def test_a_rejected_write_back_only_fails_the_operations_at_fault():
+    service = AccountService(ColumnarAccountRepository())
+    service.deposit("big", 2 ** 63 - 10)
+    pipeline = EventPipeline(service)
+
+    with HeldAccount(service, "x"):
+        first = pipeline.submit(("x",), lambda operations: operations.deposit("x", 1))
+        futures = [
+            pipeline.submit(("a",), lambda operations: operations.deposit("a", 5)),
+            pipeline.submit(("big",), lambda operations: operations.deposit("big", 20)),
+            pipeline.submit(("a", "big"), lambda operations: operations.transfer("a", "big", 3)),
+            pipeline.submit(("big",), lambda operations: operations.deposit("big", 2)),
+        ]
+    first.result()
+    results = [outcome(lambda future: future.result()[0], future) for future in futures]
+    pipeline.close()
+
+    assert results[0].balance == 5
+    assert results[1] is BalanceOutOfRange
+    assert [account.balance for account in results[2]] == [2, 2 ** 63 - 7]
+    assert results[3].balance == 2 ** 63 - 5
+    assert service.get_balances("a", "big", "x") == {"a": 2, "big": 2 ** 63 - 5, "x": 1}
+    assert pipeline.operations == 5
+
+
+def test_batches_are_logged_and_published_in_order(tmp_path):
+    path = tmp_path / "events.log"
+    service = AccountService(InMemoryAccountRepository(), event_log=EventLog(str(path), commit_window=0))
+    view = BalanceView(service.locks)
+    service.view = view
+    service.observers.append(view)
+    pipeline = EventPipeline(service)
+
+    with HeldAccount(service, "0"):
+        futures = [
+            pipeline.submit(("1",), lambda operations: operations.deposit("1", 10)),
+            pipeline.submit(("1",), lambda operations: operations.withdraw("1", 50)),
+            pipeline.submit(("1", "2"), lambda operations: operations.transfer("1", "2", 4)),
+            pipeline.submit(("1",), lambda operations: operations.deposit("1", 1)),
+        ]
+    with pytest.raises(InsufficientFunds):
+        futures[1].result()
+    sequence = futures[3].result()[1]
+    service.event_log.wait(sequence)
+    pipeline.close()
+    service.event_log.close()
+
+    assert list(EventLog.read(str(path))) == [
+        {"type": "deposit", "destination": "1", "amount": 10},
+        {"type": "transfer", "origin": "1", "destination": "2", "amount": 4},
+        {"type": "deposit", "destination": "1", "amount": 1},
+    ]
+    assert view.balances(["1", "2"]) == {"1": 7, "2": 4}
+
+
+def test_events_are_applied_through_the_pipeline_of_the_service():
+    service = AccountService(InMemoryAccountRepository())
+    service.pipeline = EventPipeline(service)
+    app.dependency_overrides[get_service] = lambda: service
+    client = TestClient(app)
+
+    try:
+        created = client.post("/event", json={"type": "deposit", "destination": "100", "amount": 10})
+        moved = client.post("/event", json={"type": "transfer", "origin": "100", "destination": "300", "amount": 15})
+        missing = client.post("/event", json={"type": "withdraw", "origin": "200", "amount": 10})
+    finally:
+        app.dependency_overrides.clear()
+        service.pipeline.close()
+
+    assert (created.status_code, created.json()) == (201, {"destination": {"id": "100", "balance": 10}})
+    assert moved.status_code == 404
+    assert (missing.status_code, missing.text) == (404, "0")
+    assert service.pipeline.operations == 3
@@ -0,0 +1,163 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_service
+from app.services.account_service import AccountService
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+
+
+def create_client():
+    service = AccountService(InMemoryAccountRepository())
+    app.dependency_overrides[get_service] = lambda: service
+    return TestClient(app), service
+
+
+def read_results(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+class TestEventsEndpoint:
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_json_array_is_applied_in_order(self):
+        """
+        Given a JSON array of events,
+        When it is posted to /events,
+        Then each event should report the same status and body as /event.
+        """
+        client, service = create_client()
+
+        response = client.post("/events", json=[
+            {"type": "deposit", "destination": "100", "amount": 10},
+            {"type": "withdraw", "origin": "100", "amount": 3},
+            {"type": "transfer", "origin": "100", "destination": "300", "amount": 5},
+            {"type": "withdraw", "origin": "200", "amount": 1},
+            {"type": "deposit", "destination": "100", "amount": -1},
+            {"type": "unknown", "amount": 1},
+        ])
+
+        assert response.status_code == 200
+        assert read_results(response) == [
+            {"status": 201, "body": {"destination": {"id": "100", "balance": 10}}},
+            {"status": 201, "body": {"origin": {"id": "100", "balance": 7}}},
+            {"status": 201, "body": {
+                "origin": {"id": "100", "balance": 2},
+                "destination": {"id": "300", "balance": 5},
+            }},
+            {"status": 404, "body": 0},
+            {"status": 400, "body": {"detail": "Amount must be positive"}},
+            {"status": 400, "body": {"detail": "Invalid event type"}},
+        ]
+        assert service.get_balance("100") == 2
+
+    def test_ndjson_stream_is_applied_in_chunks(self):
+        """
+        Given an NDJSON body longer than one chunk,
+        When it is posted to /events,
+        Then every event should be applied and reported, including undecodable lines.
+        """
+        client, service = create_client()
+        lines = [json.dumps({"type": "deposit", "destination": "100", "amount": 1})] * 600
+        lines.insert(10, "{not json")
+
+        response = client.post(
+            "/events",
+            content="\n".join(lines),
+            headers={"content-type": "application/x-ndjson"},
+        )
+
+        results = read_results(response)
+        assert len(results) == 601
+        assert results[10]["status"] == 422
+        assert results[-1] == {"status": 201, "body": {"destination": {"id": "100", "balance": 600}}}
+        assert service.get_balance("100") == 600
+
+    def test_atomic_batch_is_rolled_back_when_an_event_fails(self):
+        """
+        Given an atomic batch whose last event fails,
+        When it is posted to /events,
+        Then no event should be applied and the failure should be reported.
+        """
+        client, service = create_client()
+        service.deposit(destination_id="100", amount=10)
+
+        response = client.post("/events?atomic=true", json=[
+            {"type": "deposit", "destination": "100", "amount": 5},
+            {"type": "transfer", "origin": "100", "destination": "200", "amount": 15},
+            {"type": "withdraw", "origin": "100", "amount": 1},
+        ])
+
+        assert read_results(response) == [
+            {"status": 424, "body": {"detail": "Not applied: another event of the atomic batch failed"}},
+            {"status": 424, "body": {"detail": "Not applied: another event of the atomic batch failed"}},
+            {"status": 404, "body": 0},
+        ]
+        assert service.get_balance("100") == 10
+        assert service.repository.get("200") is None
+
+    def test_atomic_batch_is_applied_when_every_event_succeeds(self):
+        """
+        Given an atomic batch of valid events,
+        When it is posted to /events,
+        Then every event should be applied.
+        """
+        client, service = create_client()
+
+        response = client.post("/events?atomic=true", json=[
+            {"type": "deposit", "destination": "100", "amount": 5},
+            {"type": "transfer", "origin": "100", "destination": "200", "amount": 2},
+        ])
+
+        assert [result["status"] for result in read_results(response)] == [201, 201]
+        assert service.get_balance("100") == 3
+        assert service.get_balance("200") == 2
+
+    def test_body_that_is_not_an_array_is_rejected(self):
+        """
+        Given a body that is not a JSON array,
+        When it is posted to /events,
+        Then a 400 should be returned.
+        """
+        client, _ = create_client()
+
+        response = client.post("/events", json={"type": "deposit"})
+
+        assert response.status_code == 400
+
+    def test_atomic_batch_with_missing_account_is_rejected_before_applying(self):
+        """
+        Given an atomic batch with a deposit that has no destination,
+        When it is posted to /events,
+        Then nothing should be applied and the event should be reported as invalid.
+        """
+        client, service = create_client()
+
+        response = client.post("/events?atomic=true", json=[
+            {"type": "deposit", "destination": "100", "amount": 5},
+            {"type": "deposit", "amount": 5},
+        ])
+
+        assert [result["status"] for result in read_results(response)] == [424, 400]
+        assert service.repository.get("100") is None
+        assert service.repository.get(None) is None
+
+    def test_amounts_are_coerced_like_event_request(self):
+        """
+        Given amounts sent as integral floats and strings,
+        When they are posted to /events,
+        Then they should be accepted the same way /event accepts them.
+        """
+        client, service = create_client()
+
+        response = client.post("/events", json=[
+            {"type": "deposit", "destination": "100", "amount": "1.0"},
+            {"type": "deposit", "destination": "100", "amount": 2.0},
+            {"type": "deposit", "destination": "100", "amount": "1.5"},
+        ])
+
+        assert [result["status"] for result in read_results(response)] == [201, 201, 422]
+        assert service.get_balance("100") == 3
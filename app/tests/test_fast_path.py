@@ -0,0 +1,98 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.fast_path import FastPathApp
+from app.api.routes import get_service
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.async_account_service import AsyncAccountService
+
+# Requests sent in turn to the FastAPI app and to the fast path, as (method, url, keyword arguments of the client)
+SCENARIO = [
+    ("POST", "/reset", {}),
+    ("GET", "/balance?account_id=1234", {}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "100", "amount": 10}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "100", "amount": 10}}),
+    ("GET", "/balance?account_id=100", {}),
+    ("GET", "/balance?account_id=1&account_id=100", {}),
+    ("POST", "/event", {"json": {"type": "withdraw", "origin": "200", "amount": 10}}),
+    ("POST", "/event", {"json": {"type": "withdraw", "origin": "100", "amount": 5}}),
+    ("POST", "/event", {"json": {"type": "withdraw", "origin": "100", "amount": 500}}),
+    ("POST", "/event", {"json": {"type": "transfer", "origin": "100", "destination": "300", "amount": 15}}),
+    ("POST", "/event", {"json": {"type": "transfer", "origin": "200", "destination": "300", "amount": 15}}),
+    ("POST", "/event", {"json": {"type": "transfer", "origin": "100", "amount": 1}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "100", "amount": -5}}),
+    ("POST", "/event", {"json": {"type": "deposit", "amount": 5}}),
+    ("POST", "/event", {"json": {"type": "refund", "destination": "100", "amount": 5}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "100", "amount": "7"}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "100", "amount": 7.0}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": 100, "amount": 7}}),
+    ("POST", "/event", {"json": {"destination": "100", "amount": 7}}),
+    ("POST", "/event", {"json": [1, 2]}),
+    ("POST", "/event", {"content": b"{not json", "headers": {"Content-Type": "application/json"}}),
+    ("POST", "/event", {"content": b'{"type": "deposit", "destination": "9", "amount": 1}'}),
+    ("POST", "/event", {"content": b'{"type": "deposit", "destination": "9", "amount": 1}', "headers": {"Content-Type": "application/x-ndjson"}}),
+    ("POST", "/event", {"content": b'{"type": "deposit", "destination": "9", "amount": 1}', "headers": {"Content-Type": "application/vnd.api+json; charset=utf-8"}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "7", "amount": 3}, "headers": {"Idempotency-Key": "k1"}}),
+    ("POST", "/event", {"json": {"type": "deposit", "destination": "7", "amount": 3}, "headers": {"Idempotency-Key": "k1"}}),
+    ("GET", "/balance?account_id=7", {}),
+    ("GET", "/balance", {}),
+    ("GET", "/balance?account_id=100&at=2000-01-01T00:00:00Z", {}),
+    ("GET", "/event", {}),
+    ("POST", "/reset", {}),
+    ("GET", "/balance?account_id=100", {}),
+]
+
+
+def run_scenario(client: TestClient) -> list[tuple]:
+    responses = []
+    for method, url, options in SCENARIO:
+        response = client.request(method, url, **options)
+        responses.append((method, url, response.status_code, response.headers.get("content-type"), response.content))
+    return responses
+
+
+@pytest.fixture
+def served():
+    def serve(application_of):
+        service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: service
+        with TestClient(application_of(AsyncAccountService(service))) as client:
+            return run_scenario(client)
+
+    try:
+        yield serve
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_the_fast_path_answers_like_the_fastapi_app(served):
+    """
+    Given the same requests sent to the FastAPI app and to the fast path
+    When they include rejected events, malformed bodies and requests the fast path passes on
+    Then every status code, content type and body is the same
+    """
+    expected = served(lambda service: app)
+    actual = served(lambda service: FastPathApp(app, service))
+
+    assert actual == expected
+
+
+def test_hot_requests_do_not_reach_the_fastapi_app():
+    service = AccountService(InMemoryAccountRepository())
+    reached = []
+
+    async def fallback(scope, receive, send):
+        reached.append(scope["path"])
+        await app(scope, receive, send)
+
+    client = TestClient(FastPathApp(fallback, AsyncAccountService(service)))
+    created = client.post("/event", json={"type": "deposit", "destination": "1", "amount": 5})
+    balance = client.get("/balance", params={"account_id": "1"})
+    reset = client.post("/reset")
+
+    assert (created.status_code, created.json()) == (201, {"destination": {"id": "1", "balance": 5}})
+    assert (balance.status_code, balance.text) == (200, "5")
+    assert (reset.status_code, reset.text) == (200, "OK")
+    assert reached == []
@@ -0,0 +1,279 @@
+import asyncio
+import subprocess
+import sys
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+import app.api.routes as routes
+from app.api.idempotency import ENTRY_OVERHEAD, IdempotencyCache, IdempotencyKeyReused, SharedIdempotencyCache
+from app.api.routes import get_service
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def response(body: bytes = b"{}"):
+    async def produce():
+        return 201, body, "application/json"
+    return produce
+
+
+def test_lru_ttl_and_memory_bounds():
+    """
+    Tests that the cache drops the least recently used entries beyond its size, drops expired entries,
+    and never keeps more than its memory budget.
+    """
+    clock = FakeClock()
+    cache = IdempotencyCache(max_entries=2, max_bytes=3 * (ENTRY_OVERHEAD + 100), ttl=10, clock=clock)
+
+    async def scenario():
+        await cache.run("a", 1, response())
+        await cache.run("b", 1, response())
+        assert (await cache.run("a", 1, response(b"other")))[1] is True
+        await cache.run("c", 1, response())
+
+        # "b" was the least recently used entry
+        assert set(cache._entries) == {"a", "c"}
+
+        clock.now = 11
+        cached, replayed = await cache.run("a", 1, response(b"[]"))
+        assert (cached.content, replayed) == (b"[]", False)
+
+        await cache.run("big", 1, response(b"x" * 10 ** 6))
+        assert "big" not in cache._entries
+        assert cache.size_in_bytes <= 3 * (ENTRY_OVERHEAD + 100)
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_duplicates_wait_for_the_first_request():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 201, b"done", "application/json"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("key", 1, produce) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [replayed for _, replayed in results].count(False) == 1
+    assert all(cached.content == b"done" for cached, _ in results)
+
+
+def test_failed_requests_are_not_cached_and_waiters_retry():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return 201, b"done", "application/json"
+
+    async def scenario():
+        return await asyncio.gather(cache.run("key", 1, produce), cache.run("key", 1, produce), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+
+    assert isinstance(first, RuntimeError)
+    assert second[0].content == b"done"
+    assert len(calls) == 2
+
+
+def test_reusing_a_key_for_another_request_is_rejected():
+    cache = IdempotencyCache()
+
+    async def scenario():
+        await cache.run("key", 1, response())
+        with pytest.raises(IdempotencyKeyReused):
+            await cache.run("key", 2, response())
+
+    asyncio.run(scenario())
+
+
+def test_shared_cache_replays_responses_stored_by_another_worker(tmp_path):
+    """
+    Given two workers opening the same shared cache
+    When a request is retried on the other worker, with the same event or another one
+    Then the stored response is replayed or the key reuse rejected, and a reset on either worker forgets the keys
+    """
+    path = str(tmp_path / "idempotency")
+    first, second = SharedIdempotencyCache(path), SharedIdempotencyCache(path)
+    fingerprint = ("deposit", None, "100", 10)
+
+    async def scenario():
+        cached, replayed = await first.run("key", fingerprint, response(b"done"))
+        assert (cached.content, replayed) == (b"done", False)
+
+        cached, replayed = await second.run("key", fingerprint, response(b"again"))
+        assert (cached.status_code, cached.content, cached.media_type, replayed) == (201, b"done", "application/json", True)
+
+        with pytest.raises(IdempotencyKeyReused):
+            await second.run("key", ("deposit", None, "100", 20), response())
+
+        second.clear()
+        assert len(first) == 0 and first.size_in_bytes == 0
+        assert (await first.run("key", fingerprint, response(b"after reset")))[1] is False
+
+    asyncio.run(scenario())
+    first.close()
+    second.close()
+
+
+def test_shared_cache_waits_for_a_request_processed_by_another_worker(tmp_path):
+    path = str(tmp_path / "idempotency")
+    first, second = SharedIdempotencyCache(path), SharedIdempotencyCache(path)
+    calls = []
+
+    def produce(fail: bool):
+        async def run():
+            calls.append(fail)
+            await asyncio.sleep(0.02)
+            if fail:
+                raise RuntimeError("boom")
+            return 201, b"done", "application/json"
+        return run
+
+    async def scenario():
+        # The waiter runs the request itself once the first one failed, then a third one is replayed its response.
+        failed, retried = await asyncio.gather(
+            first.run("key", 1, produce(True)),
+            second.run("key", 1, produce(False)),
+            return_exceptions=True,
+        )
+        assert isinstance(failed, RuntimeError)
+        assert (retried[0].content, retried[1]) == (b"done", False)
+        return await asyncio.gather(first.run("key", 1, produce(False)), second.run("key", 1, produce(False)))
+
+    results = asyncio.run(scenario())
+
+    assert calls == [True, False]
+    assert all(cached.content == b"done" and replayed for cached, replayed in results)
+    first.close()
+    second.close()
+
+
+def test_shared_cache_claims_the_keys_of_a_dead_worker_again(tmp_path):
+    path = str(tmp_path / "idempotency")
+    cache = SharedIdempotencyCache(path)
+    worker = subprocess.Popen([sys.executable, "-c", "pass"])
+    worker.wait()
+    cache._connection.execute(
+        "INSERT INTO responses (key, seq, fingerprint, owner, size) VALUES ('key', 0, '1', ?, 0)",
+        (worker.pid,),
+    )
+
+    cached, replayed = asyncio.run(cache.run("key", 1, response(b"done")))
+
+    assert (cached.content, replayed) == (b"done", False)
+    cache.close()
+
+
+def test_shared_cache_bounds(tmp_path):
+    clock = FakeClock()
+    cache = SharedIdempotencyCache(
+        str(tmp_path / "idempotency"), max_entries=2, max_bytes=3 * (ENTRY_OVERHEAD + 100), ttl=10, clock=clock,
+    )
+
+    async def scenario():
+        await cache.run("a", 1, response())
+        await cache.run("b", 1, response())
+        await cache.run("c", 1, response())
+        # The oldest response was dropped
+        assert (await cache.run("a", 1, response(b"[]")))[1] is False
+
+        clock.now = 11
+        assert len(cache) == 2
+        cached, replayed = await cache.run("c", 1, response(b"[]"))
+        assert (cached.content, replayed) == (b"[]", False)
+        assert len(cache) == 1
+
+        await cache.run("big", 1, response(b"x" * 10 ** 6))
+        assert len(cache) == 1
+        assert 0 < cache.size_in_bytes <= 3 * (ENTRY_OVERHEAD + 100)
+
+    asyncio.run(scenario())
+    cache.close()
+
+
+class TestIdempotentEventEndpoint:
+
+    def setup_method(self):
+        self.service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.original, routes.idempotency = routes.idempotency, IdempotencyCache()
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        routes.idempotency = self.original
+        app.dependency_overrides.clear()
+
+    def post(self, event: dict, key: str):
+        return self.client.post("/event", json=event, headers={"Idempotency-Key": key})
+
+    def test_retried_events_are_applied_once(self):
+        deposit = {"type": "deposit", "destination": "100", "amount": 10}
+
+        first = self.post(deposit, "k1")
+        retry = self.post(deposit, "k1")
+
+        assert first.status_code == retry.status_code == 201
+        assert first.content == retry.content == b'{"destination":{"id":"100","balance":10}}'
+        assert "idempotent-replayed" not in first.headers
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert self.service.get_balance("100") == 10
+
+        # Rejections are replayed as well, with the same status and body
+        withdraw = {"type": "withdraw", "origin": "200", "amount": 10}
+        assert (self.post(withdraw, "k2").status_code, self.post(withdraw, "k2").text) == (404, "0")
+        negative = {"type": "deposit", "destination": "100", "amount": -1}
+        assert self.post(negative, "k3").json() == self.post(negative, "k3").json() == {"detail": "Amount must be positive"}
+
+    def test_reused_and_oversized_keys(self):
+        self.post({"type": "deposit", "destination": "100", "amount": 10}, "k1")
+
+        assert self.post({"type": "deposit", "destination": "100", "amount": 20}, "k1").status_code == 422
+        assert self.post({"type": "deposit", "destination": "100", "amount": 20}, "k" * 256).status_code == 400
+        assert self.service.get_balance("100") == 10
+
+    def test_reset_forgets_keys(self):
+        deposit = {"type": "deposit", "destination": "100", "amount": 10}
+        self.post(deposit, "k1")
+        self.client.post("/reset")
+
+        assert "idempotent-replayed" not in self.post(deposit, "k1").headers
+        assert self.service.get_balance("100") == 10
+
+    def test_concurrent_retries_are_applied_once(self):
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post(
+                        "/event",
+                        json={"type": "deposit", "destination": "100", "amount": 10},
+                        headers={"Idempotency-Key": "k1"},
+                    )
+                    for _ in range(10)
+                ))
+
+        responses = asyncio.run(scenario())
+
+        assert {response.status_code for response in responses} == {201}
+        assert self.service.get_balance("100") == 10
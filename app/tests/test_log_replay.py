@@ -0,0 +1,151 @@
+import random
+
+import pytest
+
+import app.services.log_replay as log_replay
+from app.container import build_service, close_service
+from app.config import Settings
+from app.domain.account import Account
+from app.domain.exceptions import AccountNotFound, InsufficientFunds, NegativeValue
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.infrastructure.shared_memory_account_repository import SharedMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.services.log_replay import ReplayMismatch, replay_log
+
+
+# Applies random events to a service logging them to `path`, including rejected ones and resets.
+def write_log(path, count: int, seed: int = 7, resets: bool = True) -> None:
+    service = AccountService(InMemoryAccountRepository(), event_log=EventLog(str(path), commit_window=0, fsync=False))
+    generator = random.Random(seed)
+    accounts = [str(index) for index in range(50)]
+
+    for index in range(count):
+        if resets and index in (count // 3, count // 2):
+            service.reset()
+            continue
+
+        kind = generator.choice(("deposit", "deposit", "withdraw", "transfer"))
+        origin, destination = generator.choice(accounts), generator.choice(accounts)
+        amount = generator.randrange(-1, 100)
+        try:
+            if kind == "deposit":
+                service.deposit(destination, amount)
+            elif kind == "withdraw":
+                service.withdraw(origin, amount)
+            else:
+                service.transfer(origin, destination, amount)
+        except (AccountNotFound, InsufficientFunds, NegativeValue):
+            pass
+
+    service.event_log.close()
+
+
+def sequential(path, initial=()) -> list:
+    repository = InMemoryAccountRepository()
+    repository.load([account_id for account_id, _ in initial], [balance for _, balance in initial])
+    AccountService(repository).replay(EventLog.read(str(path)))
+    return list(repository.items())
+
+
+@pytest.fixture
+def small_ranges(monkeypatch):
+    monkeypatch.setattr(log_replay, "MIN_RANGE_SIZE", 256)
+
+
+def test_parallel_replay_matches_the_sequential_one(tmp_path, small_ranges):
+    """
+    Given a log with transfers, rejected events and resets
+    When it is replayed on several processes
+    Then every account ends with the balance, and in the position, of a sequential replay
+    """
+    path = tmp_path / "events.log"
+    write_log(path, 3000)
+    service = AccountService(ColumnarAccountRepository())
+
+    replayed = replay_log(service, str(path), workers=3, verify=True)
+
+    assert replayed == sum(1 for _ in EventLog.read(str(path)))
+    assert list(service.repository.items()) == sequential(path)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_events_are_replayed_onto_the_balances_already_loaded(tmp_path, small_ranges, workers):
+    path = tmp_path / "events.log"
+    write_log(path, 1000, resets=False)
+    initial = [("1", 500), ("snapshot-only", 7)]
+    service = AccountService(InMemoryAccountRepository())
+    service.repository.load(["1", "snapshot-only"], [500, 7])
+
+    replay_log(service, str(path), workers=workers, start_method="fork")
+
+    assert list(service.repository.items()) == sequential(path, initial)
+    assert service.get_balance("snapshot-only") == 7
+
+
+def test_a_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "events.log"
+    path.write_bytes(b'{"type":"deposit","destination":"1","amount":10}\n{"type":"withdraw","orig')
+    service = AccountService(InMemoryAccountRepository())
+
+    assert replay_log(service, str(path), workers=2) == 1
+    assert service.get_balance("1") == 10
+
+
+def test_verification_fails_on_a_log_that_cannot_be_replayed(tmp_path):
+    path = tmp_path / "events.log"
+    path.write_bytes(b'{"type":"deposit","destination":"1","amount":10}\n{"type":"withdraw","origin":"1","amount":30}\n')
+
+    with pytest.raises(ReplayMismatch):
+        replay_log(AccountService(InMemoryAccountRepository()), str(path), verify=True)
+
+
+def test_startup_replays_the_log_on_worker_processes(tmp_path):
+    settings = Settings()
+    settings.account_repository = "columnar"
+    settings.event_log_path = str(tmp_path / "events.log")
+    settings.event_log_commit_window = 0
+    settings.event_log_replay_workers = 2
+    settings.event_log_replay_verify = True
+    write_log(tmp_path / "events.log", 500)
+
+    service = build_service(settings)
+    try:
+        assert list(service.repository.items()) == sequential(tmp_path / "events.log")
+        service.deposit("new", 1)
+    finally:
+        close_service(service)
+
+
+@pytest.mark.parametrize("resets", [False, True])
+def test_a_shared_memory_repository_is_rebuilt_in_parallel(tmp_path, small_ranges, resets):
+    path = tmp_path / "events.log"
+    write_log(path, 1000, resets=resets)
+    repository = SharedMemoryAccountRepository(str(tmp_path / "accounts"), capacity=256, lock_stripes=8)
+    repository.save(Account("before", 5))
+    service = AccountService(repository)
+
+    try:
+        replay_log(service, str(path), workers=2, verify=True, start_method="fork")
+        expected = dict(sequential(path, [("before", 5)]))
+        assert dict(repository.items()) == expected
+    finally:
+        repository.close()
+
+
+def test_startup_replays_a_shared_memory_log_on_worker_processes(tmp_path):
+    settings = Settings()
+    settings.account_repository = "shared_memory"
+    settings.shared_memory_path = str(tmp_path / "accounts")
+    settings.shared_memory_capacity = 1024
+    settings.event_log_path = str(tmp_path / "events.log")
+    settings.event_log_commit_window = 0
+    settings.event_log_replay_workers = 2
+    write_log(tmp_path / "events.log", 500)
+
+    service = build_service(settings)
+    try:
+        assert dict(service.repository.items()) == dict(sequential(tmp_path / "events.log"))
+    finally:
+        close_service(service)
@@ -0,0 +1,113 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+import app.api.routes as routes
+from app.api.routes import get_service
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+from app.utils.metrics import Metrics
+from app.utils.striped_lock import StripedLock
+
+
+def sample(text: str, series: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not found")
+
+
+def test_counters_of_every_thread_are_summed():
+    """
+    Tests that events observed by several threads are all reported, with cumulative histogram buckets.
+    """
+    metrics = Metrics()
+
+    def observe():
+        for _ in range(100):
+            metrics.observe_event("deposit", 0.00002)
+
+    threads = [threading.Thread(target=observe) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.observe_event("withdraw", 2.0, KeyError())
+    metrics.observe_event("bogus", 0.001)
+
+    text = metrics.render()
+
+    assert sample(text, 'ebanx_events_total{type="deposit"}') == 400
+    assert sample(text, 'ebanx_event_duration_seconds_bucket{type="deposit",le="1e-05"}') == 0
+    assert sample(text, 'ebanx_event_duration_seconds_bucket{type="deposit",le="2.5e-05"}') == 400
+    assert sample(text, 'ebanx_event_duration_seconds_bucket{type="withdraw",le="1.0"}') == 0
+    assert sample(text, 'ebanx_event_duration_seconds_bucket{type="withdraw",le="+Inf"}') == 1
+    assert sample(text, 'ebanx_event_errors_total{type="withdraw",error="KeyError"}') == 1
+    assert sample(text, 'ebanx_events_total{type="invalid"}') == 1
+
+
+def test_contended_lock_waits_are_recorded():
+    """
+    Tests that a thread waiting for a striped lock held by another thread reports the wait.
+    """
+    metrics = Metrics()
+    locks = StripedLock(metrics=metrics)
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with locks.acquire("1"):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+    threading.Timer(0.05, release.set).start()
+    with locks.acquire("1"):
+        pass
+    thread.join()
+
+    with locks.acquire("1"):
+        pass
+
+    text = metrics.render()
+    assert sample(text, "ebanx_lock_waits_total") == 1
+    assert sample(text, "ebanx_lock_wait_seconds_total") >= 0.04
+
+
+def test_metrics_endpoint_reports_events_errors_and_accounts():
+    """
+    Given events sent to /event and /events
+    When /metrics is scraped
+    Then it reports them by type and error, along with the number of accounts
+    """
+    metrics = Metrics()
+    service = AccountService(InMemoryAccountRepository())
+    metrics.gauge("ebanx_accounts", "Number of accounts.", lambda: len(service.repository))
+    app.dependency_overrides[get_service] = lambda: service
+    original, routes.metrics = routes.metrics, metrics
+    try:
+        client = TestClient(app)
+        client.post("/event", json={"type": "deposit", "destination": "100", "amount": 10})
+        client.post("/event", json={"type": "withdraw", "origin": "200", "amount": 10})
+        client.post("/events", json=[
+            {"type": "transfer", "origin": "100", "destination": "300", "amount": 5},
+            {"type": "withdraw", "origin": "100", "amount": 50},
+        ])
+
+        response = client.get("/metrics")
+    finally:
+        routes.metrics = original
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert sample(text, 'ebanx_events_total{type="deposit"}') == 1
+    assert sample(text, 'ebanx_events_total{type="withdraw"}') == 2
+    assert sample(text, 'ebanx_events_total{type="transfer"}') == 1
+    assert sample(text, 'ebanx_event_errors_total{type="withdraw",error="AccountNotFound"}') == 1
+    assert sample(text, 'ebanx_event_errors_total{type="withdraw",error="InsufficientFunds"}') == 1
+    assert sample(text, "ebanx_accounts") == 2
@@ -0,0 +1,112 @@
+import asyncio
+import re
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.api.profiling import AWAIT_FRAME, ProfilingMiddleware, TaskProfile
+from app.api.routes import get_service, router
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.services.account_service import AccountService
+
+COLLAPSED_LINE = re.compile(r"^[^ ;]+(;[^ ;]+)* \d+$")
+
+
+def test_task_profile_records_the_stacks_of_its_task_only():
+    """
+    Given a task that calls a function and awaits a sleep, while another task runs
+    When the task is profiled
+    Then its stacks are recorded, with the sleep under the await frame, and the other task is left out
+    """
+    def busy():
+        return sum(range(20000))
+
+    async def other():
+        busy()
+
+    async def profiled():
+        busy()
+        await asyncio.sleep(0.01)
+        busy()
+
+    async def scenario():
+        task = asyncio.create_task(profiled())
+        profile = TaskProfile(task)
+        sys.setprofile(profile)
+        try:
+            await asyncio.gather(task, other())
+        finally:
+            sys.setprofile(None)
+        return profile
+
+    profile = asyncio.run(scenario())
+    stacks = {";".join(stack): seconds for stack, seconds in profile.stacks.items()}
+    own = f"{__name__}:test_task_profile_records_the_stacks_of_its_task_only.<locals>"
+
+    assert f"{own}.profiled;{own}.busy" in stacks
+    assert not any(f"{own}.other" in stack for stack in stacks)
+    waits = [seconds for stack, seconds in stacks.items() if stack.endswith(AWAIT_FRAME) and f"{own}.profiled" in stack]
+    assert sum(waits) >= 0.009
+    assert all(COLLAPSED_LINE.match(line) for line in profile.collapsed().splitlines())
+
+
+class TestProfilingMiddleware:
+
+    def create_client(self, tmp_path, **options):
+        application = FastAPI()
+        application.include_router(router)
+        application.add_middleware(ProfilingMiddleware, directory=str(tmp_path), **options)
+        service = AccountService(InMemoryAccountRepository())
+        application.dependency_overrides[get_service] = lambda: service
+        return TestClient(application)
+
+    def test_requests_with_the_token_are_profiled(self, tmp_path):
+        client = self.create_client(tmp_path, token="s3cret")
+
+        response = client.post(
+            "/event",
+            json={"type": "deposit", "destination": "1", "amount": 5},
+            headers={"X-Profile": "s3cret"},
+        )
+
+        assert response.status_code == 201
+        timings = dict(metric.split(";dur=") for metric in response.headers["server-timing"].split(", "))
+        assert set(timings) == {"service", "encoding", "validation", "dependencies", "other", "total"}
+        assert float(timings["service"]) > 0 and float(timings["validation"]) > 0
+
+        profile = (tmp_path / f"{response.headers['x-profile-id']}.collapsed").read_text()
+        assert "app.services.account_service:AccountService.deposit" in profile
+        assert all(COLLAPSED_LINE.match(line) for line in profile.splitlines())
+
+    def test_other_requests_are_not_profiled(self, tmp_path):
+        client = self.create_client(tmp_path, token="s3cret")
+
+        unsigned = client.post("/event", json={"type": "deposit", "destination": "1", "amount": 5})
+        forged = client.post("/event", json={"type": "deposit", "destination": "1", "amount": 5}, headers={"X-Profile": "guess"})
+
+        assert "server-timing" not in unsigned.headers
+        assert "server-timing" not in forged.headers
+        assert list(tmp_path.iterdir()) == []
+
+    def test_requests_are_sampled(self, tmp_path):
+        client = self.create_client(tmp_path, sample_rate=1.0)
+
+        response = client.get("/balance", params={"account_id": "1"})
+
+        assert response.status_code == 404
+        assert "x-profile-id" in response.headers
+        assert len(list(tmp_path.iterdir())) == 1
+
+    def test_requests_with_a_wrong_token_are_still_sampled(self, tmp_path):
+        client = self.create_client(tmp_path, token="s3cret", sample_rate=1.0)
+
+        response = client.get("/balance", params={"account_id": "1"}, headers={"X-Profile": "guess"})
+
+        assert "x-profile-id" in response.headers
+        assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_the_middleware_is_not_installed_by_default():
+    assert not any(middleware.cls is ProfilingMiddleware for middleware in main.app.user_middleware)
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api import routes
+from app.api.routes import get_service
+from app.services.account_service import AccountService
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+
+
+EVENTS = [
+    {"type": "deposit", "destination": "100", "amount": 10},
+    {"type": "deposit", "destination": "açaí \"quoted\" \\ ünicode", "amount": 7},
+    {"type": "deposit", "amount": 3},
+    {"type": "withdraw", "origin": "100", "amount": 4},
+    {"type": "transfer", "origin": "100", "destination": "acc-2", "amount": 1},
+    {"type": "withdraw", "origin": "missing", "amount": 1},
+]
+
+
+def responses_with(fast_responses, monkeypatch):
+    monkeypatch.setattr(routes.settings, "fast_responses", fast_responses)
+    service = AccountService(InMemoryAccountRepository())
+    app.dependency_overrides[get_service] = lambda: service
+    client = TestClient(app)
+
+    try:
+        results = [client.post("/event", json=event) for event in EVENTS]
+        batch = client.post("/events", json=EVENTS)
+    finally:
+        app.dependency_overrides.clear()
+
+    return [(r.status_code, r.headers["content-type"], r.content) for r in results], batch.content
+
+
+@pytest.mark.parametrize("index", range(len(EVENTS)))
+def test_fast_event_responses_are_byte_identical(index, monkeypatch):
+    """
+    Tests that the template-based encoding of /event produces exactly the bytes
+    and headers of FastAPI's default JSON encoding.
+    """
+    fast, _ = responses_with(True, monkeypatch)
+    default, _ = responses_with(False, monkeypatch)
+
+    assert fast[index] == default[index]
+
+
+def test_fast_batch_responses_are_byte_identical(monkeypatch):
+    """
+    Tests that the template-based encoding of /events lines matches the JSON encoder.
+    """
+    _, fast = responses_with(True, monkeypatch)
+    _, default = responses_with(False, monkeypatch)
+
+    assert fast == default
@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_service
+from app.services.account_service import AccountService
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+
+
+class TestRoutes:
+
+    def setup_method(self):
+        """
+        Runs before each test.
+        Points the API at a fresh service instance.
+        """
+        self.service = AccountService(InMemoryAccountRepository())
+        app.dependency_overrides[get_service] = lambda: self.service
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        app.dependency_overrides.clear()
+
+    def test_reset_returns_ok(self):
+        response = self.client.post("/reset")
+
+        assert response.status_code == 200
+        assert response.text == "OK"
+
+    def test_balance_of_missing_account_returns_404(self):
+        response = self.client.get("/balance", params={"account_id": "1234"})
+
+        assert response.status_code == 404
+        assert response.text == "0"
+
+    def test_deposit_withdraw_and_transfer(self):
+        response = self.client.post("/event", json={"type": "deposit", "destination": "100", "amount": 10})
+        assert response.status_code == 201
+        assert response.json() == {"destination": {"id": "100", "balance": 10}}
+
+        response = self.client.post("/event", json={"type": "withdraw", "origin": "100", "amount": 5})
+        assert response.status_code == 201
+        assert response.json() == {"origin": {"id": "100", "balance": 5}}
+
+        response = self.client.post(
+            "/event",
+            json={"type": "transfer", "origin": "100", "destination": "300", "amount": 15},
+        )
+        assert response.status_code == 404
+        assert response.text == "0"
+
+        response = self.client.post(
+            "/event",
+            json={"type": "transfer", "origin": "100", "destination": "300", "amount": 5},
+        )
+        assert response.status_code == 201
+        assert response.json() == {
+            "origin": {"id": "100", "balance": 0},
+            "destination": {"id": "300", "balance": 5},
+        }
+
+        response = self.client.get("/balance", params={"account_id": "300"})
+        assert response.status_code == 200
+        assert response.text == "5"
+
+    def test_invalid_events_return_400(self):
+        response = self.client.post("/event", json={"type": "deposit", "destination": "100", "amount": -1})
+        assert response.status_code == 400
+
+        response = self.client.post("/event", json={"type": "refund", "destination": "100", "amount": 1})
+        assert response.status_code == 400
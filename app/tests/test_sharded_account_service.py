@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_service
+from app.domain.exceptions import (
+    AccountNotFound,
+    AtomicBatchesUnavailable,
+    BalanceOutOfRange,
+    HistoryUnavailable,
+    InsufficientFunds,
+)
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.services.sharded_account_service import ShardedAccountService, shard_of
+
+SHARDS = 3
+
+
+@pytest.fixture(scope="module")
+def shared_service():
+    service = ShardedAccountService(SHARDS, repository_factory=ColumnarAccountRepository)
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def service(shared_service):
+    shared_service.reset()
+    return shared_service
+
+
+# Returns account IDs owned by two different shards
+def accounts_on_different_shards() -> tuple[str, str]:
+    origin = "1"
+    destination = next(str(account) for account in range(2, 100) if shard_of(str(account), SHARDS) != shard_of(origin, SHARDS))
+    return origin, destination
+
+
+def test_accounts_are_spread_over_every_shard():
+    assert shard_of("100", SHARDS) == shard_of("100", SHARDS)
+    assert {shard_of(str(account), SHARDS) for account in range(100)} == set(range(SHARDS))
+
+
+def test_operations_are_routed_to_the_shard_of_their_account(service):
+    for account in range(20):
+        service.deposit(destination_id=str(account), amount=account + 1)
+
+    assert service.withdraw(origin_id="5", amount=2).balance == 4
+    assert [service.get_balance(str(account)) for account in range(3)] == [1, 2, 3]
+    assert len(service) == 20
+
+    with pytest.raises(AccountNotFound):
+        service.get_balance("missing")
+    with pytest.raises(InsufficientFunds):
+        service.withdraw(origin_id="0", amount=10)
+    with pytest.raises(HistoryUnavailable):
+        service.get_balance_at("0", 0)
+
+
+def test_accounts_of_every_shard_are_scanned(service):
+    for account in range(30):
+        service.deposit(destination_id=str(account), amount=account + 1)
+
+    listed = {}
+    page, cursor = service.scan(None, 4)
+    listed.update(page)
+    while cursor is not None:
+        page, cursor = service.scan(cursor, 4)
+        listed.update(page)
+
+    assert listed == {str(account): account + 1 for account in range(30)}
+
+
+def test_cross_shard_transfers_keep_money_conserved(service):
+    """
+    Given accounts on different shards
+    When transfers between them succeed, fail on the origin or are rejected by the destination
+    Then the origin is debited only when the destination was credited, and nothing stays on hold
+    """
+    origin_id, destination_id = accounts_on_different_shards()
+    service.deposit(destination_id=origin_id, amount=10)
+
+    origin, destination = service.transfer(origin_id=origin_id, destination_id=destination_id, amount=4)
+    assert (origin.balance, destination.balance) == (6, 4)
+
+    with pytest.raises(InsufficientFunds):
+        service.transfer(origin_id=origin_id, destination_id=destination_id, amount=7)
+
+    # The destination cannot hold the amount: the debit of the origin is given back
+    service.deposit(destination_id=destination_id, amount=2 ** 63 - 5)
+    with pytest.raises(BalanceOutOfRange):
+        service.transfer(origin_id=origin_id, destination_id=destination_id, amount=6)
+
+    assert service.get_balance(origin_id) == 6
+    assert service.holds() == 0
+
+
+def test_concurrent_transfers_and_resets(service):
+    """
+    Tests that transfers in every direction, running while the accounts are reset, never create money:
+    after the last reset, the accounts only hold what was deposited since.
+    """
+    accounts = [str(account) for account in range(12)]
+    stop = threading.Event()
+    errors = []
+
+    def transfer(seed: int):
+        index = seed
+        while not stop.is_set():
+            try:
+                service.transfer(origin_id=accounts[index % 12], destination_id=accounts[(index * 5 + 1) % 12], amount=1)
+            except (AccountNotFound, InsufficientFunds):
+                pass
+            except Exception as error:
+                errors.append(error)
+            index += 1
+
+    threads = [threading.Thread(target=transfer, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(3):
+            service.reset()
+            for account in accounts:
+                service.deposit(destination_id=account, amount=10)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert not errors
+    assert sum(service.get_balance(account) for account in accounts) == 120
+    assert service.holds() == 0
+
+
+def test_endpoints_serve_sharded_accounts(service):
+    app.dependency_overrides[get_service] = lambda: service
+    try:
+        client = TestClient(app)
+        origin_id, destination_id = accounts_on_different_shards()
+
+        response = client.post("/event", json={"type": "deposit", "destination": origin_id, "amount": 10})
+        assert response.status_code == 201
+        response = client.post(
+            "/event",
+            json={"type": "transfer", "origin": origin_id, "destination": destination_id, "amount": 3},
+        )
+        assert response.json() == {
+            "origin": {"id": origin_id, "balance": 7},
+            "destination": {"id": destination_id, "balance": 3},
+        }
+        assert client.get("/balance", params={"account_id": destination_id}).text == "3"
+        assert client.post("/events?atomic=true", json=[]).status_code == 501
+        response = client.post("/events?atomic=true", json=[{"type": "deposit", "destination": origin_id, "amount": 1}])
+        assert response.status_code == 501
+        assert response.text == "Atomic batches are not available with sharded accounts"
+        assert client.post("/events?atomic=true", json=[{"type": "deposit"}]).status_code == 501
+        assert client.post("/reset").status_code == 200
+        assert client.get("/balance", params={"account_id": origin_id}).status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_atomic_batches_are_reported_unavailable(service):
+    with pytest.raises(AtomicBatchesUnavailable):
+        service.atomic("1", "2")
@@ -0,0 +1,193 @@
+import multiprocessing
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_service
+from app.services.account_service import AccountService
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.shared_memory_account_repository import (
+    SharedMemoryAccountRepository,
+    SharedMemoryFull,
+)
+from app.domain.exceptions import BalanceOutOfRange, InvalidAccountId
+
+
+def create_service(path, capacity=64):
+    repository = SharedMemoryAccountRepository(str(path), capacity=capacity, lock_stripes=8)
+    return AccountService(repository), repository
+
+
+def deposit_many(path, count):
+    service, repository = create_service(path)
+    for _ in range(count):
+        service.deposit(destination_id="100", amount=1)
+        service.transfer(origin_id="100", destination_id="200", amount=1)
+    repository.close()
+
+
+def test_accounts_are_visible_to_every_attached_repository(tmp_path):
+    """
+    Tests that two repositories mapping the same file share one ledger.
+    """
+    path = tmp_path / "accounts"
+    service, _ = create_service(path)
+    other_service, other_repository = create_service(path)
+
+    service.deposit(destination_id="100", amount=30)
+    other_service.transfer(origin_id="100", destination_id="200", amount=10)
+
+    assert service.get_balance("100") == 20
+    assert service.get_balance("200") == 10
+    assert len(other_repository) == 2
+
+
+def test_reset_clears_every_account(tmp_path):
+    """
+    Tests that reset removes all accounts from the shared region.
+    """
+    service, repository = create_service(tmp_path / "accounts")
+
+    service.deposit(destination_id="100", amount=30)
+    service.reset()
+
+    assert repository.get("100") is None
+    assert len(repository) == 0
+
+
+def test_concurrent_processes_conserve_money(tmp_path):
+    """
+    Tests that deposits and transfers issued by several processes on the same
+    accounts are all applied exactly once.
+    """
+    path = tmp_path / "accounts"
+    _, repository = create_service(path)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=deposit_many, args=(path, 200)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert repository.get("100").balance == 0
+    assert repository.get("200").balance == 800
+
+
+def test_full_region_raises_exception(tmp_path):
+    """
+    Tests that saving a new account into a full region raises SharedMemoryFull.
+    """
+    service, _ = create_service(tmp_path / "accounts", capacity=2)
+
+    service.deposit(destination_id="1", amount=1)
+    service.deposit(destination_id="2", amount=1)
+
+    with pytest.raises(SharedMemoryFull):
+        service.deposit(destination_id="3", amount=1)
+
+
+def test_incompatible_layout_is_rejected(tmp_path):
+    """
+    Tests that attaching to a region created with another capacity fails.
+    """
+    path = tmp_path / "accounts"
+    create_service(path, capacity=64)
+
+    with pytest.raises(ValueError):
+        create_service(path, capacity=128)
+
+
+def test_transfer_to_the_same_account_keeps_the_balance(tmp_path):
+    """
+    Tests that a transfer from an account to itself neither creates nor destroys
+    money, although the repository returns copies of the accounts.
+    """
+    service, _ = create_service(tmp_path / "accounts")
+
+    service.deposit(destination_id="A", amount=100)
+    origin, destination = service.transfer(origin_id="A", destination_id="A", amount=10)
+
+    assert origin.balance == 100
+    assert destination.balance == 100
+    assert service.get_balance("A") == 100
+
+
+def test_account_id_too_long_is_rejected(tmp_path):
+    """
+    Tests that an account ID the slots cannot hold raises InvalidAccountId.
+    """
+    path = tmp_path / "accounts"
+    repository = SharedMemoryAccountRepository(str(path), capacity=8, key_size=4, lock_stripes=8)
+    service = AccountService(repository)
+
+    with pytest.raises(InvalidAccountId):
+        service.deposit(destination_id="12345", amount=1)
+
+    assert repository.get("12345") is None
+
+
+def test_balance_out_of_range_leaves_no_account_behind(tmp_path):
+    """
+    Tests that a balance a slot cannot hold raises BalanceOutOfRange before any slot is claimed.
+    """
+    repository = SharedMemoryAccountRepository(str(tmp_path / "accounts"), capacity=8, lock_stripes=8)
+    service = AccountService(repository)
+
+    with pytest.raises(BalanceOutOfRange):
+        service.deposit(destination_id="A", amount=2 ** 63)
+
+    assert repository.get("A") is None
+    assert len(repository) == 0
+
+
+def test_a_full_region_and_an_overflow_are_rejected_by_the_api(tmp_path):
+    """
+    Tests that /event answers a deposit the region cannot hold with a handled error instead of a 500.
+    """
+    repository = SharedMemoryAccountRepository(str(tmp_path / "accounts"), capacity=1, lock_stripes=8)
+    service = AccountService(repository)
+    app.dependency_overrides[get_service] = lambda: service
+    client = TestClient(app)
+
+    try:
+        overflow = client.post("/event", json={"type": "deposit", "destination": "A", "amount": 2 ** 63})
+        created = client.post("/event", json={"type": "deposit", "destination": "A", "amount": 1})
+        full = client.post("/event", json={"type": "deposit", "destination": "B", "amount": 1})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert (overflow.status_code, overflow.json()) == (400, {"detail": "Balance out of range"})
+    assert created.status_code == 201
+    assert (full.status_code, full.json()) == (507, {"detail": "No room left for new accounts"})
+    assert dict(repository.items()) == {"A": 1}
+
+
+def test_shared_log_rebuilds_the_region_once(tmp_path):
+    """
+    Tests that workers sharing a region also share one event log, and that a new
+    region is rebuilt from that log only by the first repository attaching to it.
+    """
+    log_path = str(tmp_path / "events.log")
+    services = []
+    for _ in range(2):
+        repository = SharedMemoryAccountRepository(str(tmp_path / "accounts"), capacity=64, lock_stripes=8)
+        event_log = EventLog(log_path, commit_window=0, shared=True)
+        services.append(AccountService(repository, event_log=event_log))
+
+    services[0].deposit(destination_id="100", amount=50)
+    services[1].transfer(origin_id="100", destination_id="200", amount=20)
+    services[0].withdraw(origin_id="200", amount=5)
+    for service in services:
+        service.event_log.close()
+
+    replays = []
+    for _ in range(2):
+        repository = SharedMemoryAccountRepository(str(tmp_path / "restarted"), capacity=64, lock_stripes=8)
+        service = AccountService(repository)
+        repository.initialize(lambda: replays.append(service.replay(EventLog.read(log_path))))
+
+    assert replays == [3]
+    assert service.get_balance("100") == 30
+    assert service.get_balance("200") == 15
@@ -0,0 +1,235 @@
+import threading
+from array import array
+
+import pytest
+
+from app.config import Settings
+from app.container import build_service, close_service
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.event_log import EventLog
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.infrastructure.snapshot import SnapshotError, UnsupportedAccounts, read_snapshot, write_snapshot
+from app.services.account_service import AccountService
+from app.services.snapshotter import Snapshotter
+
+
+def settings_for(tmp_path, **overrides) -> Settings:
+    settings = Settings()
+    settings.account_repository = "memory"
+    settings.event_log_path = str(tmp_path / "events.log")
+    settings.event_log_commit_window = 0.001
+    settings.snapshot_path = str(tmp_path / "accounts.snapshot")
+    settings.snapshot_interval = 3600
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return settings
+
+
+def balances(repository) -> dict:
+    return dict(repository.items())
+
+
+@pytest.mark.parametrize("account_ids", [
+    ["1", "conta-ação", "", "😀" * 3],
+    ["1", "conta-ação", "multi\nline", "😀" * 3],
+])
+def test_snapshot_round_trip(tmp_path, account_ids):
+    path = str(tmp_path / "accounts.snapshot")
+    write_snapshot(path, account_ids, array("q", [5, -(2 ** 63), 0, 2 ** 63 - 1]), 1234)
+
+    snapshot = read_snapshot(path)
+
+    assert snapshot.account_ids == account_ids
+    assert list(snapshot.balances) == [5, -(2 ** 63), 0, 2 ** 63 - 1]
+    assert snapshot.log_offset == 1234
+    assert read_snapshot(str(tmp_path / "missing")) is None
+
+
+def test_corrupted_snapshots_are_rejected(tmp_path):
+    path = tmp_path / "accounts.snapshot"
+    write_snapshot(str(path), ["1", "2"], array("q", [5, 6]), -1)
+    data = bytearray(path.read_bytes())
+
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError):
+        read_snapshot(str(path))
+
+    path.write_bytes(bytes(data[:-1]))
+    with pytest.raises(SnapshotError):
+        read_snapshot(str(path))
+
+
+@pytest.mark.parametrize("repository_class", [InMemoryAccountRepository, ColumnarAccountRepository])
+def test_repositories_load_snapshots(repository_class):
+    repository = repository_class()
+    repository.load(["1", "2"], array("q", [10, 20]))
+
+    assert balances(repository) == {"1": 10, "2": 20}
+    assert repository.get("2").balance == 20
+    assert len(repository) == 2
+
+
+def test_snapshots_taken_under_load_are_consistent(tmp_path):
+    """
+    Given transfers running between accounts while snapshots are taken
+    When a snapshot is loaded and the events logged after it are replayed
+    Then the result is exactly the state rebuilt from the whole log, and money is conserved in every snapshot
+    """
+    settings = settings_for(tmp_path)
+    service = build_service(settings)
+    snapshotter = next(observer for observer in service.observers if isinstance(observer, Snapshotter))
+
+    for account in range(200):
+        service.deposit(str(account), 100)
+
+    stop = threading.Event()
+
+    def transfer(seed: int):
+        index = seed
+        while not stop.is_set():
+            service.transfer(str(index % 200), str((index * 7 + 1) % 200), 1)
+            index += 3
+
+    threads = [threading.Thread(target=transfer, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(5):
+            snapshotter.take()
+            assert sum(read_snapshot(settings.snapshot_path).balances) == 20000
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    snapshot = read_snapshot(settings.snapshot_path)
+    service.event_log.close()
+
+    from_snapshot = InMemoryAccountRepository()
+    from_snapshot.load(snapshot.account_ids, snapshot.balances)
+    AccountService(from_snapshot).replay(EventLog.read(settings.event_log_path, snapshot.log_offset))
+
+    from_log = InMemoryAccountRepository()
+    AccountService(from_log).replay(EventLog.read(settings.event_log_path))
+
+    assert snapshot.log_offset > 0
+    assert balances(from_snapshot) == balances(from_log) == balances(service.repository)
+
+
+def test_changes_and_resets_during_a_copy_are_included(tmp_path):
+    service = AccountService(InMemoryAccountRepository())
+    snapshotter = Snapshotter(service, str(tmp_path / "accounts.snapshot"))
+    service.observers.append(snapshotter)
+    service.deposit("1", 10)
+
+    copy = snapshotter._copy
+
+    def copy_while_changing():
+        copied = copy()
+        service.deposit("1", 5)
+        service.deposit("2", 7)
+        return copied
+
+    snapshotter._copy = copy_while_changing
+    snapshotter.take()
+    snapshot = read_snapshot(str(tmp_path / "accounts.snapshot"))
+    assert dict(zip(snapshot.account_ids, snapshot.balances)) == {"1": 15, "2": 7}
+
+    def copy_while_resetting():
+        copied = copy()
+        service.reset()
+        service.deposit("3", 1)
+        return copied
+
+    snapshotter._copy = copy_while_resetting
+    snapshotter.take()
+    snapshot = read_snapshot(str(tmp_path / "accounts.snapshot"))
+    assert dict(zip(snapshot.account_ids, snapshot.balances)) == {"3": 1}
+
+
+def test_accounts_a_snapshot_cannot_hold_are_left_out_without_an_event_log(tmp_path):
+    """
+    Given the account without ID and an account whose balance does not fit in 64 bits, and no event log
+    When a snapshot is taken
+    Then the other accounts are written and the two left out are reported
+    """
+    path = str(tmp_path / "accounts.snapshot")
+    service = AccountService(InMemoryAccountRepository())
+    snapshotter = Snapshotter(service, path)
+    service.deposit("1", 10)
+    service.deposit(None, 5)
+    service.deposit("big", 2 ** 63)
+
+    assert snapshotter.take() == 1
+    assert snapshotter.skipped == [None, "big"]
+    snapshot = read_snapshot(path)
+    assert dict(zip(snapshot.account_ids, snapshot.balances)) == {"1": 10}
+
+    with pytest.raises(UnsupportedAccounts):
+        write_snapshot(path, ["1", None], array("q", [1, 2]), -1)
+
+
+@pytest.mark.parametrize("account_id, amount", [(None, 5), ("big", 2 ** 63)])
+def test_accounts_a_snapshot_cannot_hold_keep_the_previous_snapshot_with_an_event_log(tmp_path, account_id, amount):
+    """
+    Given an account a snapshot cannot hold, created after the last snapshot of a service with an event log
+    When snapshots are taken, periodically and on shutdown
+    Then none is written, the error is recorded without failing the shutdown, and a restart rebuilds every account
+    """
+    settings = settings_for(tmp_path)
+    service = build_service(settings)
+    snapshotter = next(observer for observer in service.observers if isinstance(observer, Snapshotter))
+    service.deposit("1", 10)
+    snapshotter.take()
+    service.deposit(account_id, amount)
+
+    with pytest.raises(UnsupportedAccounts):
+        snapshotter.take()
+    close_service(service)
+
+    assert isinstance(snapshotter.error, UnsupportedAccounts)
+    assert snapshotter.skipped == [account_id]
+    assert read_snapshot(settings.snapshot_path).account_ids == ["1"]
+
+    restarted = build_service(settings)
+    try:
+        assert balances(restarted.repository) == {"1": 10, account_id: amount}
+    finally:
+        close_service(restarted)
+
+
+def test_restart_loads_the_snapshot_and_replays_the_rest_of_the_log(tmp_path):
+    settings = settings_for(tmp_path)
+    service = build_service(settings)
+    service.deposit("1", 10)
+    snapshotter = next(observer for observer in service.observers if isinstance(observer, Snapshotter))
+    snapshotter.take()
+    service.deposit("1", 5)
+    service.transfer("1", "2", 3)
+
+    # Simulates a crash: the log is closed without the last snapshot written by close_service
+    snapshotter._stopped.set()
+    service.event_log.close()
+
+    restarted = build_service(settings)
+    try:
+        assert balances(restarted.repository) == {"1": 12, "2": 3}
+    finally:
+        close_service(restarted)
+
+    # After a clean shutdown the last snapshot covers the whole log
+    assert read_snapshot(settings.snapshot_path).log_offset == (tmp_path / "events.log").stat().st_size
+
+
+def test_snapshots_that_do_not_belong_to_the_log_are_ignored(tmp_path):
+    settings = settings_for(tmp_path)
+    write_snapshot(settings.snapshot_path, ["1"], array("q", [1000]), 10 ** 6)
+    with open(settings.event_log_path, "w") as file:
+        file.write('{"type":"deposit","destination":"1","amount":10}\n')
+
+    service = build_service(settings)
+    try:
+        assert balances(service.repository) == {"1": 10}
+    finally:
+        close_service(service)
@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.infrastructure.sqlite_account_repository as sqlite_repository
+from app.api.routes import get_service
+from app.config import Settings
+from app.container import build_service, close_service
+from app.domain.account import Account
+from app.domain.account_repository import AccountRepository
+from app.domain.exceptions import BalanceOutOfRange, InsufficientFunds, InvalidAccountId
+from app.infrastructure.columnar_account_repository import ColumnarAccountRepository
+from app.infrastructure.in_memory_account_repository import InMemoryAccountRepository
+from app.infrastructure.sqlite_account_repository import SqliteAccountRepository
+from app.main import app
+from app.services.account_service import AccountService
+
+
+def create_service(tmp_path):
+    repository = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+    return AccountService(repository), repository
+
+
+def test_repositories_implement_the_protocol(tmp_path):
+    repository = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+
+    for candidate in (InMemoryAccountRepository(), ColumnarAccountRepository(), repository):
+        assert isinstance(candidate, AccountRepository)
+
+    repository.close()
+
+
+def test_operations_are_persisted(tmp_path):
+    """
+    Tests that deposits, withdrawals and transfers are visible to a new repository opened on the same file.
+    """
+    service, repository = create_service(tmp_path)
+    service.deposit(destination_id="100", amount=50)
+    service.withdraw(origin_id="100", amount=10)
+    service.transfer(origin_id="100", destination_id="200", amount=15)
+    service.transfer(origin_id="200", destination_id="200", amount=5)
+    repository.close()
+
+    reopened = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+    assert list(reopened.items()) == [("100", 25), ("200", 15)]
+    assert len(reopened) == 2
+
+    reopened.reset()
+    assert reopened.get("100") is None
+    reopened.close()
+
+
+def test_failed_operations_roll_back_their_transaction(tmp_path):
+    """
+    Tests that an operation failing after some of its writes leaves no trace in the database.
+    """
+    service, repository = create_service(tmp_path)
+    service.deposit(destination_id="1", amount=10)
+    service.deposit(destination_id="2", amount=2 ** 63 - 1)
+
+    with pytest.raises(BalanceOutOfRange):
+        service.transfer(origin_id="1", destination_id="2", amount=5)
+
+    with pytest.raises(InsufficientFunds):
+        with service.atomic("1", "3") as batch:
+            batch.transfer("1", "3", 10)
+            batch.withdraw("1", 1)
+
+    assert repository.get("1").balance == 10
+    assert repository.get("3") is None
+    repository.close()
+
+
+def test_concurrent_transfers_keep_money_conserved(tmp_path):
+    service, repository = create_service(tmp_path)
+    for account in range(10):
+        service.deposit(destination_id=str(account), amount=100)
+
+    def transfer(seed: int):
+        for index in range(200):
+            service.transfer(origin_id=str((seed + index) % 10), destination_id=str((seed + 3 * index + 1) % 10), amount=1)
+
+    threads = [threading.Thread(target=transfer, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(balance for _, balance in repository.items()) == 1000
+    repository.close()
+
+
+def test_concurrent_operations_are_committed_in_groups(tmp_path):
+    """
+    Given threads queuing up for the database
+    When each of them applies operations
+    Then operations share commits, every one of them is persisted, and a failed one is undone alone
+    """
+    service, repository = create_service(tmp_path)
+
+    def failing_operation():
+        with pytest.raises(InsufficientFunds):
+            with service.atomic("2"):
+                service.deposit(destination_id="2", amount=1)
+                raise InsufficientFunds()
+
+    # The first operation ends while the second waits for the writer: it is left to commit them both.
+    with repository.lock("1"):
+        repository.save(Account("1", 10))
+        waiter = threading.Thread(target=failing_operation)
+        waiter.start()
+        while not repository._queued:
+            time.sleep(0.001)
+    waiter.join()
+
+    assert repository.get("1").balance == 10
+    assert repository.get("2") is None
+
+    def deposit(seed: int):
+        for index in range(200):
+            service.deposit(destination_id=str((seed + index) % 10), amount=1)
+
+    commits = repository.commits
+    threads = [threading.Thread(target=deposit, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    repository.close()
+
+    assert repository.commits - commits < 8 * 200
+    reopened = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+    assert sum(balance for _, balance in reopened.items()) == 10 + 8 * 200
+    reopened.close()
+
+
+def test_accounts_without_id_are_rejected(tmp_path):
+    service, repository = create_service(tmp_path)
+
+    with pytest.raises(InvalidAccountId):
+        service.deposit(destination_id=None, amount=10)
+    with pytest.raises(InvalidAccountId):
+        repository.load(["1", None], [1, 2])
+
+    assert list(repository.items()) == []
+    app.dependency_overrides[get_service] = lambda: service
+    try:
+        response = TestClient(app).post("/event", json={"type": "deposit", "amount": 10})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 400
+    repository.close()
+
+
+def test_connections_are_closed_when_their_thread_exits(tmp_path):
+    repository = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+    repository.save(Account("1", 10))
+    assert repository.get("1").balance == 10
+
+    for _ in range(20):
+        thread = threading.Thread(target=repository.get, args=("1",))
+        thread.start()
+        thread.join()
+
+    # Only the connection the main thread reads with remains open, besides the writer.
+    assert len(repository._connections) == 1
+    repository.close()
+    assert not repository._connections
+
+
+def test_items_and_load_page_through_every_account(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_repository, "PAGE_SIZE", 3)
+    repository = SqliteAccountRepository(str(tmp_path / "accounts.db"))
+    repository.save(Account("stale", 1))
+
+    repository.load([str(account) for account in range(10)] + [""], list(range(10)) + [7])
+
+    assert list(repository.items()) == [("", 7)] + [(str(account), account) for account in range(10)]
+    repository.close()
+
+
+def test_the_database_is_not_rebuilt_from_the_event_log(tmp_path):
+    settings = Settings()
+    settings.account_repository = "sqlite"
+    settings.sqlite_path = str(tmp_path / "accounts.db")
+    settings.event_log_path = str(tmp_path / "events.log")
+    settings.snapshot_path = None
+
+    service = build_service(settings)
+    service.deposit(destination_id="1", amount=10)
+    close_service(service)
+
+    service = build_service(settings)
+    try:
+        assert service.get_balance("1") == 10
+    finally:
+        close_service(service)
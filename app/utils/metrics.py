@@ -0,0 +1,144 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Optional
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Event types reported under their own label; anything else is reported as "invalid" so that
+# arbitrary types sent by clients cannot create new series.
+EVENT_TYPES = ("deposit", "withdraw", "transfer")
+
+
+# Counters of a single thread. Only the owning thread writes them, so no lock is taken on the hot path.
+# Each event type has one list: the count of every latency bucket, followed by the total of the latencies.
+class _ThreadCounters:
+    def __init__(self):
+        self.series: dict[str, list] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.lock_waits = 0
+        self.lock_wait_seconds = 0.0
+
+
+# This class collects the application metrics and renders them in the Prometheus text format.
+# Each thread writes to its own counters (the event loop and every threadpool worker), which costs a
+# few dictionary updates per event; the counters of every thread are only summed when they are scraped.
+class Metrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._threads: list[_ThreadCounters] = []
+        self._registration = threading.Lock()
+        self._gauges: list[tuple[str, str, Callable[[], float]]] = []
+        self._counters: list[tuple[str, str, Callable[[], float]]] = []
+
+    # This method records an event that took `seconds` to process, and the error it failed with, if any.
+    def observe_event(self, event_type, seconds: float, error: Optional[BaseException] = None) -> None:
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._register()
+
+        series = counters.series.get(event_type)
+        if series is None:
+            if event_type not in EVENT_TYPES:
+                event_type = "invalid"
+            series = counters.series.setdefault(event_type, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+
+        series[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        series[-1] += seconds
+
+        if error is not None:
+            key = (event_type if event_type in EVENT_TYPES else "invalid", type(error).__name__)
+            counters.errors[key] = counters.errors.get(key, 0) + 1
+
+    # This method records the time a thread spent waiting for a lock held by another thread.
+    def observe_lock_wait(self, seconds: float) -> None:
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._register()
+
+        counters.lock_waits += 1
+        counters.lock_wait_seconds += seconds
+
+    # This method registers a gauge whose value is read from `read` when the metrics are scraped.
+    def gauge(self, name: str, description: str, read: Callable[[], float]) -> None:
+        self._gauges.append((name, description, read))
+
+    # This method registers a counter kept elsewhere, whose value is read from `read` when the metrics are scraped.
+    def counter(self, name: str, description: str, read: Callable[[], float]) -> None:
+        self._counters.append((name, description, read))
+
+    # This method renders the current value of every metric in the Prometheus text exposition format.
+    def render(self) -> str:
+        with self._registration:
+            threads = list(self._threads)
+
+        series: dict[str, list] = {}
+        errors: dict[tuple[str, str], int] = {}
+        lock_waits = 0
+        lock_wait_seconds = 0.0
+
+        # Copies are taken first: the owning threads may add keys while the counters are summed.
+        for counters in threads:
+            for event_type, values in dict(counters.series).items():
+                merged = series.setdefault(event_type, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+                for index, value in enumerate(list(values)):
+                    merged[index] += value
+            for key, count in dict(counters.errors).items():
+                errors[key] = errors.get(key, 0) + count
+            lock_waits += counters.lock_waits
+            lock_wait_seconds += counters.lock_wait_seconds
+
+        lines = [
+            "# HELP ebanx_events_total Events processed, by type.",
+            "# TYPE ebanx_events_total counter",
+        ]
+        for event_type in sorted(series):
+            lines.append(f'ebanx_events_total{{type="{event_type}"}} {sum(series[event_type][:-1])}')
+
+        lines += [
+            "# HELP ebanx_event_errors_total Events rejected, by type and exception.",
+            "# TYPE ebanx_event_errors_total counter",
+        ]
+        for event_type, error in sorted(errors):
+            lines.append(f'ebanx_event_errors_total{{type="{event_type}",error="{error}"}} {errors[event_type, error]}')
+
+        lines += [
+            "# HELP ebanx_event_duration_seconds Time taken to process an event, by type.",
+            "# TYPE ebanx_event_duration_seconds histogram",
+        ]
+        for event_type in sorted(series):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (None,), series[event_type]):
+                cumulative += count
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f'ebanx_event_duration_seconds_bucket{{type="{event_type}",le="{le}"}} {cumulative}')
+            lines.append(f'ebanx_event_duration_seconds_sum{{type="{event_type}"}} {series[event_type][-1]!r}')
+            lines.append(f'ebanx_event_duration_seconds_count{{type="{event_type}"}} {cumulative}')
+
+        lines += [
+            "# HELP ebanx_lock_waits_total Account lock acquisitions that had to wait for another thread.",
+            "# TYPE ebanx_lock_waits_total counter",
+            f"ebanx_lock_waits_total {lock_waits}",
+            "# HELP ebanx_lock_wait_seconds_total Time spent waiting for account locks held by other threads.",
+            "# TYPE ebanx_lock_wait_seconds_total counter",
+            f"ebanx_lock_wait_seconds_total {lock_wait_seconds!r}",
+        ]
+
+        for name, description, read in self._counters:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter", f"{name} {read()}"]
+
+        for name, description, read in self._gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {read()}"]
+
+        return "\n".join(lines) + "\n"
+
+    def _register(self) -> _ThreadCounters:
+        counters = self._local.counters = _ThreadCounters()
+        with self._registration:
+            self._threads.append(counters)
+        return counters
@@ -0,0 +1,58 @@
+import queue
+import threading
+
+# Number of entries released at a time, between which other threads can take the interpreter lock
+RELEASE_CHUNK_SIZE = 1024
+
+
+# This class frees large containers in a background thread, so that the thread dropping them (such as a
+# request resetting every account) does not pay for the deallocation of millions of objects.
+# Dropping the last reference to a container frees all of its items in a single call that holds the
+# interpreter lock until it returns, even on another thread. Dictionaries and lists are therefore
+# emptied a chunk at a time, letting other threads run between chunks, before being dropped.
+class Reclaimer:
+    def __init__(self):
+        self._pending: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._outstanding = 0
+
+    # This method takes ownership of the given objects and frees them in the background. The caller must
+    # not keep or use any other reference to them.
+    def release(self, *objects) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="reclaimer", daemon=True)
+                self._thread.start()
+            self._outstanding += 1
+
+        self._pending.put(list(objects))
+
+    # This method blocks until every object released so far has been freed.
+    def wait(self, timeout=None) -> bool:
+        with self._lock:
+            return self._released.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def _run(self) -> None:
+        while True:
+            objects = self._pending.get()
+
+            while objects:
+                item = objects.pop()
+                if isinstance(item, dict):
+                    while item:
+                        for _ in range(min(RELEASE_CHUNK_SIZE, len(item))):
+                            item.popitem()
+                elif isinstance(item, list):
+                    while item:
+                        del item[-RELEASE_CHUNK_SIZE:]
+                del item
+
+            with self._lock:
+                self._outstanding -= 1
+                self._released.notify_all()
+
+
+# Reclaimer shared by the whole process
+reclaimer = Reclaimer()
@@ -0,0 +1,93 @@
+import threading
+import time
+from typing import Hashable, Optional
+
+from app.utils.metrics import Metrics
+
+
+class LockUnavailable(Exception):
+    """Raised by a non-blocking acquisition when one of the locks is held by another thread."""
+    pass
+
+
+# This class implements lock striping: keys are hashed onto a fixed pool of locks, so operations on
+# unrelated keys usually proceed in parallel while operations sharing a key are serialized.
+# Locks are always acquired in ascending stripe order, which rules out deadlocks between operations
+# that lock the same keys in a different order (e.g. a transfer A->B racing a transfer B->A).
+# When metrics are given, the time spent waiting for a lock held by another thread is recorded; an
+# uncontended acquisition is not timed.
+class StripedLock:
+    def __init__(self, stripes: int = 1024, metrics: Optional[Metrics] = None):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._metrics = metrics
+
+    # This method holds the locks of every given key for the duration of the block.
+    # When `blocking` is false, it raises LockUnavailable instead of waiting for a lock held elsewhere.
+    def acquire(self, *keys: Hashable, blocking: bool = True) -> "HeldStripes":
+        count = len(self._locks)
+        if len(keys) == 1:
+            stripes = (hash(keys[0]) % count,)
+        elif len(keys) == 2:
+            first, second = hash(keys[0]) % count, hash(keys[1]) % count
+            stripes = (first,) if first == second else (first, second) if first < second else (second, first)
+        else:
+            stripes = sorted({hash(key) % count for key in keys})
+        return HeldStripes(self, stripes, blocking)
+
+    # This method holds every lock of the pool, excluding all other operations for the duration of the block.
+    def acquire_all(self, blocking: bool = True) -> "HeldStripes":
+        return HeldStripes(self, range(len(self._locks)), blocking)
+
+    # This method returns the index of the lock guarding a key.
+    def stripe_of(self, key: Hashable) -> int:
+        return hash(key) % len(self._locks)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    # This method acquires the given stripes in order; if one cannot be acquired, the ones already held are released.
+    def _acquire(self, stripes, blocking: bool) -> None:
+        locks = self._locks
+        acquired = 0
+        try:
+            for stripe in stripes:
+                lock = locks[stripe]
+                if not lock.acquire(False):
+                    if not blocking:
+                        raise LockUnavailable()
+                    self._wait(lock)
+                acquired += 1
+        except BaseException:
+            self._release(stripes[:acquired])
+            raise
+
+    def _release(self, stripes) -> None:
+        locks = self._locks
+        for stripe in reversed(stripes):
+            locks[stripe].release()
+
+    def _wait(self, lock) -> None:
+        if self._metrics is None:
+            lock.acquire()
+            return
+
+        started = time.perf_counter()
+        lock.acquire()
+        self._metrics.observe_lock_wait(time.perf_counter() - started)
+
+
+# This class holds stripes of a StripedLock for the duration of a `with` block. It is a plain class rather
+# than a generator-based context manager, since it is entered on every operation.
+class HeldStripes:
+    __slots__ = ("_striped", "_stripes", "_blocking")
+
+    def __init__(self, striped: StripedLock, stripes, blocking: bool):
+        self._striped = striped
+        self._stripes = stripes
+        self._blocking = blocking
+
+    def __enter__(self) -> None:
+        self._striped._acquire(self._stripes, self._blocking)
+
+    def __exit__(self, *exc_info) -> None:
+        self._striped._release(self._stripes)